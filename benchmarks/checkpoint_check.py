@@ -0,0 +1,134 @@
+#!/usr/bin/env python2
+"""
+Checks of checkpointed and resumed batch runs with the stand-in VEP
+of benchmarks/stub_vep.py:
+
+- a checkpointed run writes the same output as a plain run
+- resuming a run interrupted after some chunks only annotates the
+  remaining chunks, with the VEP annotations of the first run, and
+  writes the same output
+- resuming on an input with a changed row annotates its chunk again
+- resuming a run of other references annotates all chunks again
+
+    python benchmarks/checkpoint_check.py
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic
+from vep_check import annotate
+
+ROWS = 3000
+CHUNKSIZE = 500
+
+
+def checkpointed(path, out, tmp_dir, checkpoint, resume=False):
+    """
+    Annotate a table in streamed chunks with a checkpoint and return
+    the counters of the run
+    str, str, str, str, bool -> dict
+    """
+    report = os.path.join(tmp_dir, "profile.json")
+    options = ["-w", "2", "-s", str(CHUNKSIZE), "-ck", checkpoint, "-p", report]
+    if annotate(path, out, tmp_dir, options + (["--resume"] if resume else [])):
+        return {}
+    with open(report) as f:
+        return [p["counters"] for p in json.load(f)["by_process"] if p["role"] == "main"][0]
+
+
+def interrupt(checkpoint, keep):
+    """
+    Leave a checkpoint as a run interrupted after its first chunks
+    str, int -> None
+    """
+    path = os.path.join(checkpoint, "manifest.json")
+    with open(path) as f:
+        manifest = json.load(f)
+    for i in list(manifest["chunks"]):
+        if int(i) >= keep:
+            os.remove(os.path.join(checkpoint, manifest["chunks"].pop(i)["results"]))
+    manifest["complete"] = False
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+
+def same(path1, path2):
+    with open(path1) as f1, open(path2) as f2:
+        return f1.read() == f2.read()
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    failed = []
+    try:
+        path = os.path.join(tmp_dir, "svs.txt")
+        synthetic.write_table(path, ROWS)
+        expected, out = [os.path.join(tmp_dir, name) for name in ("plain.tsv", "out.tsv")]
+        checkpoint = os.path.join(tmp_dir, "checkpoint")
+        annotate(path, expected, tmp_dir, ["-w", "2"])
+        n_chunks = ROWS // CHUNKSIZE
+
+        counters = checkpointed(path, out, tmp_dir, checkpoint)
+        if counters.get("checkpoint.saved_chunks") != n_chunks or not same(out, expected):
+            failed.append("checkpointed")
+        print("checkpointed  %d chunks saved" % counters.get("checkpoint.saved_chunks", 0))
+
+        interrupt(checkpoint, 2)
+        counters = checkpointed(path, out, tmp_dir, checkpoint, resume=True)
+        if (
+            counters.get("checkpoint.reused_chunks") != 2
+            or counters.get("checkpoint.saved_chunks") != n_chunks - 2
+            or counters.get("vep.breakpoints")
+            or not same(out, expected)
+        ):
+            failed.append("resumed")
+        print(
+            "resumed       %d chunks reused, %d annotated, %d breakpoints sent to VEP"
+            % (
+                counters.get("checkpoint.reused_chunks", 0),
+                counters.get("checkpoint.saved_chunks", 0),
+                counters.get("vep.breakpoints", 0),
+            )
+        )
+
+        with open(path) as f:
+            lines = f.readlines()
+        lines[CHUNKSIZE + 1] = lines[CHUNKSIZE + 1].replace("\t", "\t ", 1)
+        with open(path, "w") as f:
+            f.writelines(lines)
+        counters = checkpointed(path, out, tmp_dir, checkpoint, resume=True)
+        if counters.get("checkpoint.saved_chunks") != 1:
+            failed.append("changed_input")
+        print("changed input %d chunk annotated again" % counters.get("checkpoint.saved_chunks", 0))
+
+        manifest = os.path.join(checkpoint, "manifest.json")
+        with open(manifest) as f:
+            content = json.load(f)
+        content["signature"]["references"] = {"bundle": "other"}
+        with open(manifest, "w") as f:
+            json.dump(content, f)
+        counters = checkpointed(path, out, tmp_dir, checkpoint, resume=True)
+        if counters.get("checkpoint.saved_chunks") != n_chunks:
+            failed.append("other_references")
+        print(
+            "references    %d chunks annotated again"
+            % counters.get("checkpoint.saved_chunks", 0)
+        )
+    finally:
+        shutil.rmtree(tmp_dir)
+    for name in failed:
+        print("FAILED %s" % name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python2
+"""
+Checks of the in-process batch API, main.batch.annotate_frame, with
+the stand-in VEP of benchmarks/stub_vep.py:
+
+- a frame annotated with each engine, serial, columnar and a pool
+  of workers, has the rows a batch run writes
+- one cache and one pool serve several frames
+- a reference set given to annotate_frame is used instead of the
+  shared one, as --reference_bundle is on the command line
+- the serial and columnar engines accept the same rows, e.g. genes
+  with " / " in their names, and fail rows with missing values
+
+    python benchmarks/frame_check.py
+"""
+
+import os
+import sys
+import shutil
+import logging
+import numpy as np
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic
+from throughput import use_stub_vep
+from vep_check import annotate
+from reannotate_check import old_references
+
+ROWS = 2000
+
+
+def written(frames):
+    """
+    Get annotated frames as a batch run writes them
+    list -> str
+    """
+    return "".join(
+        frame.to_csv(None, header=i == 0, sep="\t", index=False)
+        for i, frame in enumerate(frames)
+    )
+
+
+def main():
+    from collections import Counter
+    from main import batch
+    from main.models import build_cache
+    from main.reference import references
+    from main.refdiff import open_references
+
+    use_stub_vep()
+    # Warnings of SVs that fail are not checked
+    logging.getLogger("basic_logger").addHandler(logging.NullHandler())
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["TMP"] = tmp_dir
+    failed = []
+    try:
+        path = os.path.join(tmp_dir, "svs.txt")
+        synthetic.write_table(path, ROWS)
+        expected, other = [os.path.join(tmp_dir, name) for name in ("out.tsv", "other.tsv")]
+        annotate(path, expected, tmp_dir, ["-w", "1"])
+        with open(expected) as f:
+            expected = f.read()
+        with open(path) as f:
+            svs = batch.read_svs(f)[0]
+        head, tail = svs.iloc[: ROWS // 2], svs.iloc[ROWS // 2 :]
+
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                outputs = {"serial": written([batch.annotate_frame(svs)])}
+                cache = build_cache(
+                    batch.get_unique_breakpoints([svs]),
+                    references.transcript_reference,
+                    False,
+                )
+                outputs["columnar"] = written(
+                    [batch.annotate_frame(svs, references, cache, "columnar")]
+                )
+                pool = batch.start_pool(references, 2)
+                try:
+                    outputs["pool"] = written(
+                        [
+                            batch.annotate_frame(frame, references, cache, "pool", pool, 100)
+                            for frame in (head, tail)
+                        ]
+                    )
+                finally:
+                    pool.close()
+                    pool.join()
+
+                # References with the reported transcript of the most
+                # frequent gene changed
+                with open(path) as f:
+                    genes = Counter(line.split("\t")[7] for line in list(f)[1:])
+                bundle = os.path.join(tmp_dir, "other.bundle")
+                old_references(bundle, tmp_dir, [g for g, _ in genes.most_common(2)])
+                outputs["references"] = written(
+                    [batch.annotate_frame(svs, open_references(bundle))]
+                )
+
+                # Odd rows of both engines
+                odd = svs.iloc[:20].copy()
+                odd.iloc[:10, odd.columns.get_loc("Gene1")] += " / other"
+                for i, column in enumerate(["Chr1", "Pos1", "Chr2", "Pos2", "Gene2"]):
+                    odd.iloc[10 + i, odd.columns.get_loc(column)] = np.nan
+                odd_outputs = [
+                    batch.annotate_frame(odd, references, cache, engine)
+                    for engine in ("serial", "columnar")
+                ]
+            finally:
+                sys.stdout = stdout
+        annotate(path, other, tmp_dir, ["-w", "1", "-rb", bundle])
+        with open(other) as f:
+            other = f.read()
+
+        for engine in ("serial", "columnar", "pool"):
+            if outputs[engine] != expected:
+                failed.append(engine)
+            print("%-13s %d SVs" % (engine, ROWS))
+        if outputs["references"] != other or other == expected:
+            failed.append("references")
+        print("references    %d SVs with other references" % ROWS)
+        notes = [frame["Note"].tolist() for frame in odd_outputs]
+        if written(odd_outputs[:1]) != written(odd_outputs[1:]):
+            failed.append("engine_parity")
+        if not any(notes[0][:10]) or any(notes[0][10:15]):
+            failed.append("engine_parity_rows")
+        print(
+            "parity        %d of %d SVs with \" / \" in a gene annotated by both engines"
+            % (sum(1 for note in notes[0][:10] if note), 10)
+        )
+    finally:
+        shutil.rmtree(tmp_dir)
+    for name in failed:
+        print("FAILED %s" % name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
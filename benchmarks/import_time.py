@@ -0,0 +1,102 @@
+#!/usr/bin/env python2
+"""
+Start-up benchmark of sv-annotator. Times `svannotate.py --help`,
+importing the single-SV annotation modules and building the reference
+indexes, each in a fresh interpreter, and checks that the argument
+parsing and single-SV paths do not import pandas or requests. Exits
+with a non-zero status when a check fails or a timing exceeds its
+threshold.
+
+    python benchmarks/import_time.py [-r REPEATS] [--scale SCALE]
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported before a batch run is requested
+HEAVY_MODULES = ["pandas", "requests"]
+
+# name, python code run in a fresh interpreter, threshold in seconds
+CASES = [
+    (
+        "help",
+        "import sys; sys.argv = ['svannotate.py', '--help']\n"
+        "import svannotate\n"
+        "try:\n"
+        "    svannotate.main()\n"
+        "except SystemExit:\n"
+        "    pass\n",
+        0.15,
+    ),
+    (
+        "import_single_sv",
+        "import main.models, main.annotation, main.notes\n",
+        0.3,
+    ),
+    (
+        "load_references",
+        "from main.reference import references\nreferences.load()\n",
+        0.75,
+    ),
+]
+
+CHECK_MODULES = (
+    "\nimport sys\n"
+    "sys.stdout.write('\\nheavy:' + ','.join("
+    "m for m in %r if m in sys.modules))\n" % (HEAVY_MODULES,)
+)
+
+
+def run_case(code):
+    """
+    Run code in a fresh interpreter from the package root and return
+    the wall time and the heavy modules it imported
+    str -> (float, list)
+    """
+    with open(os.devnull, "w") as devnull:
+        start = time.time()
+        out = subprocess.check_output(
+            [sys.executable, "-c", code + CHECK_MODULES], cwd=ROOT, stderr=devnull
+        )
+        elapsed = time.time() - start
+    heavy = out.rsplit("heavy:", 1)[-1].strip()
+    return elapsed, [m for m in heavy.split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sv-annotator start-up benchmark")
+    parser.add_argument(
+        "-r", "--repeats", type=int, default=5, help="runs per case, best is kept"
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="multiply all thresholds, e.g. on slow machines",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for name, code, threshold in CASES:
+        times, heavy = [], []
+        for _ in range(args.repeats):
+            elapsed, heavy = run_case(code)
+            times.append(elapsed)
+        best = min(times)
+        limit = threshold * args.scale
+        status = "ok"
+        if best > limit:
+            status, failed = "SLOW", True
+        if heavy:
+            status, failed = "IMPORTS " + ",".join(heavy), True
+        print("%-18s best %6.3fs  limit %6.3fs  %s" % (name, best, limit, status))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
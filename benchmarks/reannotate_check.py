@@ -0,0 +1,180 @@
+#!/usr/bin/env python2
+"""
+Checks of incremental re-annotation with the stand-in VEP of
+benchmarks/stub_vep.py, against an older version of the references
+made by changing the reported transcript of one gene and the exons
+of another, and by removing a known fusion of two genes that are
+partners of other known fusions, i.e. the current references add
+that fusion:
+
+- the reference diff finds these genes and only them
+- annotating an output of the older references again only annotates
+  the SVs of those genes, and writes the same output as annotating
+  the input with the current references
+
+    python benchmarks/reannotate_check.py
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic
+from vep_check import annotate
+
+ROWS = 3000
+
+
+def old_references(path, tmp_dir, genes, fusion=None):
+    """
+    Compile a bundle of the references with the reported transcript
+    of the first gene and the last exon of the second gene changed,
+    and without a known fusion if one is given
+    str, str, list, str -> None
+    """
+    from main.bundle import compile_arrays, write_bundle, source_digests
+    from main.constants import OncoKb_known_fusions
+    from main.reference import DATA_DIR, TRANSCRIPT_REFERENCE, REFFLAT_SUMMARY
+
+    data_dir = os.path.join(tmp_dir, "data")
+    shutil.copytree(DATA_DIR, data_dir)
+    for name, gene, change in (
+        (TRANSCRIPT_REFERENCE, genes[0], lambda row: row[:-1] + [row[-1] + "X"]),
+        (REFFLAT_SUMMARY, genes[1], lambda row: row[:5] + [str(int(row[5]) - 1)] + row[6:]),
+    ):
+        with open(os.path.join(data_dir, name)) as f:
+            rows = [line.rstrip("\n").split("\t") for line in f]
+        column = rows[0].index("Gene")
+        rows = [change(row) if row[column] == gene else row for row in rows]
+        with open(os.path.join(data_dir, name), "w") as f:
+            f.writelines("\t".join(row) + "\n" for row in rows)
+    fusions = [f for f in OncoKb_known_fusions if f != fusion]
+    write_bundle(
+        path, compile_arrays(data_dir, fusions), {"sources": source_digests(data_dir)}
+    )
+
+
+def added_fusion(transcripts):
+    """
+    Get a known fusion of two panel genes that are both partners of
+    other known fusions, so that removing it leaves their gene classes
+    as they are
+    list -> str
+    """
+    from main.constants import OncoKb_known_fusions
+
+    genes = set(t[0] for t in transcripts)
+    partners = [gene for fusion in OncoKb_known_fusions for gene in fusion.split(":")]
+    return sorted(
+        fusion
+        for fusion in OncoKb_known_fusions
+        if all(partners.count(g) > 1 and g in genes for g in fusion.split(":"))
+    )[0]
+
+
+def fusion_row(fusion, transcripts):
+    """
+    Draw a protein fusion of two genes as a row of a synthetic table
+    str, list -> list
+    """
+    rng = random.Random(0)
+    by_gene = dict((t[0], t) for t in transcripts)
+    b1, b2 = [synthetic.breakpoint(rng, by_gene[g]) for g in fusion.split(":")]
+    return [
+        "S00000-T",
+        "S00000-N",
+        b1[0],
+        str(b1[1]),
+        b2[0],
+        str(b2[1]),
+        "TRA" if b1[0] != b2[0] else "DEL",
+        b1[2],
+        b2[2],
+        b1[3],
+        b2[3],
+        "Protein Fusion: in frame  {%s}" % fusion,
+    ]
+
+
+def main():
+    from main.refdiff import open_references, diff_references
+    from main.reference import references
+
+    tmp_dir = tempfile.mkdtemp()
+    failed = []
+    try:
+        path = os.path.join(tmp_dir, "svs.txt")
+        synthetic.write_table(path, ROWS)
+        transcripts = synthetic.load_transcripts()[0]
+        fusion = added_fusion(transcripts)
+        with open(path, "a") as f:
+            f.write("\t".join(fusion_row(fusion, transcripts)) + "\n")
+        with open(path) as f:
+            header = next(f).rstrip("\n").split("\t")
+            rows = [line.rstrip("\n").split("\t") for line in f]
+        gene1, gene2 = header.index("Gene1"), header.index("Gene2")
+        genes = [g for g, _ in Counter(row[gene1] for row in rows).most_common(2)]
+        changed = set(genes + fusion.split(":"))
+        touched = sum(1 for row in rows if row[gene1] in changed or row[gene2] in changed)
+        bundle = os.path.join(tmp_dir, "old.bundle")
+        old_references(bundle, tmp_dir, genes, fusion)
+
+        changes = diff_references(open_references(bundle), references)
+        if changes.genes != frozenset(changed):
+            failed.append("diff")
+        print(
+            "diff          genes %s, transcripts %s"
+            % (", ".join(sorted(changes.genes)), ", ".join(sorted(changes.transcripts)))
+        )
+
+        previous, expected, out = [
+            os.path.join(tmp_dir, name) for name in ("previous.tsv", "current.tsv", "out.tsv")
+        ]
+        annotate(path, previous, tmp_dir, ["-w", "2", "-rb", bundle])
+        annotate(path, expected, tmp_dir, ["-w", "2"])
+        report = os.path.join(tmp_dir, "profile.json")
+        annotate(
+            None,
+            out,
+            tmp_dir,
+            ["-w", "2", "-s", "1000", "-rf", previous, "-pr", bundle, "-p", report],
+        )
+        with open(report) as f:
+            counters = [p["counters"] for p in json.load(f)["by_process"] if p["role"] == "main"][0]
+        with open(previous) as f1, open(expected) as f2, open(out) as f3:
+            previous, expected, out = f1.read(), f2.read(), f3.read()
+        if previous == expected:
+            failed.append("unchanged")
+        # The SV of the added fusion is annotated as a known fusion
+        if previous.splitlines()[-1] == expected.splitlines()[-1]:
+            failed.append("fusion_unchanged")
+        if out != expected:
+            failed.append("reannotated_output")
+        if counters.get("svs") != touched:
+            failed.append("reannotated_svs")
+        print(
+            "reannotated   %d of %d SVs annotated again, %d copied"
+            % (
+                counters.get("svs", 0),
+                len(rows),
+                counters.get("reannotate.copied_svs", 0),
+            )
+        )
+    finally:
+        shutil.rmtree(tmp_dir)
+    for name in failed:
+        print("FAILED %s" % name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
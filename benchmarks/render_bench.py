@@ -0,0 +1,142 @@
+#!/usr/bin/env python2
+"""
+Microbenchmark of rendering annotations and notes: the time per SV
+of get_variant_annotation and get_notes on the SVs of a synthetic
+table, whose breakpoints are expanded beforehand with the stand-in
+VEP of benchmarks/stub_vep.py. Reports the minimum over the repeats
+and a hash of the rendered results, which stays the same as long as
+the output does.
+
+    python benchmarks/render_bench.py [-n 20000] [-r 5]
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic
+from throughput import use_stub_vep
+
+
+def expanded_svs(path):
+    """
+    Get the sv records of a table that expand, with the annotation
+    cache of their breakpoints
+    str -> (list, vep_cache)
+    """
+    from main import batch
+    from main.models import sv, build_cache
+    from main.reference import references
+
+    with open(path) as f:
+        svs = batch.read_svs(f)[0]
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            cache = build_cache(
+                batch.get_unique_breakpoints([svs]),
+                references.transcript_reference,
+                False,
+            )
+        finally:
+            sys.stdout = stdout
+    records = []
+    for record in batch.sv_records(batch.prepare_svs(svs)):
+        try:
+            expand(sv(*record), cache)
+        except Exception:
+            continue
+        records.append(record)
+    return records, cache
+
+
+def expand(variant, cache):
+    from main.reference import references
+
+    variant.expand(
+        references.gene_transcripts, references.gene_classes, references.oncokb, cache
+    )
+    return variant
+
+
+def render(records, cache):
+    """
+    Render the annotations and notes of freshly expanded SVs and
+    get the time spent in each and the results
+    list, vep_cache -> (float, float, list)
+    """
+    from main.models import sv
+    from main.reference import references
+    from main.annotation import get_variant_annotation
+    from main.notes import get_notes
+
+    variants = [expand(sv(*record), cache) for record in records]
+    annotations = []
+    start = time.time()
+    for variant in variants:
+        try:
+            annotations.append(get_variant_annotation(variant, references.cytobands))
+        except Exception as e:
+            annotations.append(type(e).__name__)
+    annotated = time.time()
+    results = []
+    for variant, annotation in zip(variants, annotations):
+        try:
+            results.append(
+                get_notes(variant, references.transcript_exons, references.kinase_domains)
+            )
+        except Exception as e:
+            results.append((annotation, type(e).__name__))
+    return annotated - start, time.time() - annotated, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sv-annotator rendering benchmark")
+    parser.add_argument("-n", "--rows", type=int, default=20000, help="table size")
+    parser.add_argument("-r", "--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    use_stub_vep()
+    # Warnings of the rendered SVs are not timed
+    logging.getLogger("basic_logger").addHandler(logging.NullHandler())
+    logging.getLogger("basic_logger").propagate = False
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["TMP"] = tmp_dir
+    try:
+        path = os.path.join(tmp_dir, "svs.txt")
+        synthetic.write_table(path, args.rows, args.seed)
+        records, cache = expanded_svs(path)
+    finally:
+        shutil.rmtree(tmp_dir)
+    timings = []
+    for _ in range(args.repeats):
+        annotation, notes, results = render(records, cache)
+        timings.append((annotation, notes))
+    digest = hashlib.sha1(repr(results)).hexdigest()
+    annotation = min(t[0] for t in timings)
+    notes = min(t[1] for t in timings)
+    print(
+        "%d SVs  annotation %.2f us/SV  notes %.2f us/SV  total %.2f us/SV  results %s"
+        % (
+            len(records),
+            1e6 * annotation / len(records),
+            1e6 * notes / len(records),
+            1e6 * (annotation + notes) / len(records),
+            digest[:12],
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
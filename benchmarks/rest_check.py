@@ -0,0 +1,120 @@
+#!/usr/bin/env python2
+"""
+Checks of the REST resolver against the stand-in variant_recoder
+server of benchmarks/stub_rest.py, with rate limiting injected:
+
+- breakpoints get the cDNA annotations of the stand-in VEP
+- rate limited requests are retried whether Retry-After is given in
+  seconds, as an HTTP date or in neither form
+- only breakpoints missing from a batch reply are sent one by one
+- a batch request failing after its retries fails the batch without
+  single requests
+
+    python benchmarks/rest_check.py
+"""
+
+import os
+import sys
+import time
+import requests
+from email.utils import formatdate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic
+from stub_rest import stub_rest_server, reference_allele, expected_cdnas
+from main.rest import rest_resolver
+
+
+def sample_breakpoints(n, seed=0):
+    """
+    Get the breakpoints of n synthetic SVs
+    int, int -> list
+    """
+    bkps = set()
+    for row in synthetic.generate(n, seed):
+        bkps.add((row[2], int(row[3])))
+        bkps.add((row[4], int(row[5])))
+    return sorted(bkps)
+
+
+def make_resolver(server, retries=5):
+    """
+    Get a resolver for the stand-in server without real waits
+    stub_rest_server, int -> rest_resolver
+    """
+    return rest_resolver(
+        server=server.url,
+        batch_size=50,
+        workers=4,
+        requests_per_second=1000,
+        retries=retries,
+        backoff=0.01,
+    )
+
+
+def check_resolve(bkps, retry_after="0.01"):
+    """
+    Resolve breakpoints through batches with some rate limited
+    requests and compare them with the stand-in VEP
+    list, str -> list
+    """
+    failed = []
+    with stub_rest_server(throttle_every=7, retry_after=retry_after) as server:
+        annotations = make_resolver(server).resolve(bkps)
+        expected = [
+            (chrom, pos, tx, cdna)
+            for chrom, pos in bkps
+            for tx, cdna in expected_cdnas(server.bins, chrom, pos)
+        ]
+        if sorted(annotations) != sorted(expected):
+            failed.append("annotations")
+        # Breakpoints whose dummy allele is wrong are missing from the
+        # batch replies and take a rejected and a corrected request
+        missing = sum(1 for chrom, pos in bkps if reference_allele(pos) != "C")
+        if server.answered["GET"] != 2 * missing:
+            failed.append("fallbacks")
+    print(
+        "resolve       %d breakpoints, %d POST, %d GET, Retry-After %s"
+        % (len(bkps), server.answered["POST"], server.answered["GET"], retry_after)
+    )
+    return failed
+
+
+def check_failed_batch(bkps):
+    """
+    Make every batch request fail and check that the batch fails
+    without single requests
+    list -> list
+    """
+    failed = []
+    with stub_rest_server(failing_posts=len(bkps)) as server:
+        try:
+            make_resolver(server, retries=2).resolve(bkps)
+            failed.append("failed_batch")
+        except requests.HTTPError:
+            pass
+        if server.answered["GET"]:
+            failed.append("failed_batch_fallbacks")
+    print("failed batch  %d GET" % server.answered["GET"])
+    return failed
+
+
+def main():
+    bkps = sample_breakpoints(200)
+    failed = check_resolve(bkps)
+    for retry_after in (formatdate(time.time() + 0.01, usegmt=True), "soon"):
+        failed += [
+            name + "_retry_after" for name in check_resolve(bkps[:50], retry_after)
+        ]
+    failed += check_failed_batch(bkps[:50])
+    for name in failed:
+        print("FAILED %s" % name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python2
+"""
+Checks of single SV annotation and of the annotation server with the
+stand-in VEP of benchmarks/stub_vep.py:
+
+- SVs sent to the server over HTTP, as table rows or in their
+  comma-joined string form, get the annotations of a batch run
+- the server answers malformed SVs and requests with errors and
+  keeps serving
+- a server on a Unix socket started on the breakpoint store of the
+  first one answers without running VEP, fails the SVs of breakpoints
+  that VEP fails on, reloads its references on SIGHUP and removes its
+  socket on SIGTERM
+- -sv with --offline annotates an SV from the breakpoint store as
+  a batch run does, and fails an SV with a breakpoint that is not
+  stored
+
+    python benchmarks/server_check.py
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import shutil
+import urllib2
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic
+from vep_check import annotate
+
+ROWS = 300
+RESULT_COLUMNS = ["Note", "Annotation", "Position", "oncokb_sv_type"]
+
+
+def read_rows(path):
+    """
+    Read a table as a list of dicts
+    str -> list
+    """
+    with open(path) as f:
+        header = next(f).rstrip("\n").split("\t")
+        return [dict(zip(header, line.rstrip("\n").split("\t"))) for line in f]
+
+
+def sv_string(row):
+    """
+    Get the comma-joined string form of an SV of a table
+    dict -> str
+    """
+    from main.variant import expand_svtype
+
+    return ",".join(
+        [
+            expand_svtype(row["SV_Type"]),
+            "%s:%s" % (row["Chr1"], row["Pos1"]),
+            "%s:%s" % (row["Chr2"], row["Pos2"]),
+            "%s / %s" % (row["Gene1"], row["Gene2"]),
+            row["Site1Description"],
+            row["Site2Description"],
+            row["Fusion"],
+        ]
+    )
+
+
+def matches(result, row):
+    """
+    Check that the result of an SV has the annotations of its row in
+    the output of a batch run, where None is written empty
+    dict, dict -> bool
+    """
+    return all((result[column] or "") == row[column] for column in RESULT_COLUMNS)
+
+
+def start(address, tmp_dir, options, log, vep=None):
+    """
+    Start a server on the command line with the stand-in VEP, or
+    another script, and wait until it serves
+    str, str, list, file, str -> Popen
+    """
+    env = dict(os.environ, TMP=tmp_dir, STUB_VEP_DELAY="0")
+    command = [sys.executable, os.path.join(BENCHMARKS, "vep_check.py"), "--run"]
+    if vep:
+        command += ["--vep", vep]
+    server = subprocess.Popen(
+        command + ["--serve", address] + options, env=env, stdout=log, stderr=log
+    )
+    for _ in range(600):
+        if server.poll() is not None:
+            break
+        try:
+            if "/" in address:
+                socket_request(address, {"svs": []})
+            else:
+                urllib2.urlopen("http://%s/health" % address, timeout=1).read()
+            return server
+        except (IOError, socket.error):
+            time.sleep(0.1)
+    raise RuntimeError("The annotation server did not start.")
+
+
+def http_request(address, request):
+    """
+    Post a request to a server over HTTP and return its status and
+    response
+    str, object -> (int, dict)
+    """
+    try:
+        response = urllib2.urlopen(
+            "http://%s/annotate" % address, json.dumps(request), timeout=600
+        )
+        return response.getcode(), json.load(response)
+    except urllib2.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def socket_request(path, request):
+    """
+    Send a request to a server on a Unix socket and return its response
+    str, object -> dict
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        connection.sendall(json.dumps(request) + "\n")
+        return json.loads(connection.makefile().readline())
+    finally:
+        connection.close()
+
+
+def free_port():
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+def check_http(rows, address, store, tmp_dir, log):
+    """
+    Annotate table rows and SV strings on an HTTP server
+    list, str, str, str, file -> list
+    """
+    failed = []
+    server = start(address, tmp_dir, ["-db", store], log)
+    try:
+        columns = [column for column in rows[0] if column not in RESULT_COLUMNS]
+        status, response = http_request(
+            address, {"svs": [dict((c, row[c]) for c in columns) for row in rows]}
+        )
+        results = response.get("results", [])
+        if status != 200 or len(results) != len(rows):
+            failed.append("http_rows")
+        elif not all(matches(result, row) for result, row in zip(results, rows)):
+            failed.append("http_rows_annotations")
+        status, response = http_request(address, {"sv": sv_string(rows[0])})
+        if status != 200 or not matches(response, rows[0]):
+            failed.append("http_string")
+        status, response = http_request(address, {"svs": ["DELETION,7:1,7"]})
+        if status != 200 or response["results"][0]["status"] != "FAILED":
+            failed.append("http_malformed_sv")
+        status, response = http_request(address, ["not", "a", "request"])
+        if status != 400 or "error" not in response:
+            failed.append("http_malformed_request")
+        health = json.load(urllib2.urlopen("http://%s/health" % address, timeout=10))
+        print("http          %d SVs, %d breakpoints" % (len(rows), health["breakpoints"]))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        if server.wait():
+            failed.append("http_exit")
+    return failed
+
+
+def check_socket(rows, path, store, tmp_dir, log):
+    """
+    Annotate SV strings on a Unix socket server started on the
+    breakpoint store, before and after reloading its references
+    list, str, str, str, file -> list
+    """
+    failed = []
+    # Any VEP run fails, so every breakpoint has to come from the store
+    server = start(
+        path, tmp_dir, ["-db", store], log, vep=os.path.join(tmp_dir, "missing_vep.py")
+    )
+    try:
+        svs = [sv_string(row) for row in rows]
+        results = socket_request(path, {"svs": svs})["results"]
+        if not all(matches(result, row) for result, row in zip(results, rows)):
+            failed.append("socket_from_store")
+        # One breakpoint from the store and one that VEP fails on
+        moved = dict(rows[0], Pos2=str(int(rows[0]["Pos2"]) + 1))
+        unresolved, known = socket_request(path, {"svs": [sv_string(moved), svs[0]]})[
+            "results"
+        ]
+        if unresolved["status"] != "FAILED" or not unresolved.get("message"):
+            failed.append("socket_unresolved")
+        if not matches(known, rows[0]):
+            failed.append("socket_unresolved_request")
+        server.send_signal(signal.SIGHUP)
+        results = socket_request(path, {"svs": svs})["results"]
+        if not all(matches(result, row) for result, row in zip(results, rows)):
+            failed.append("socket_reloaded")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        if server.wait() or os.path.exists(path):
+            failed.append("socket_exit")
+    print(
+        "socket        %d SVs from the store, reloaded on SIGHUP, unresolved SV %s"
+        % (len(rows), unresolved["status"])
+    )
+    return failed
+
+
+def check_offline(rows, store, tmp_dir):
+    """
+    Annotate single SVs with -sv from the breakpoint store
+    list, str, str -> list
+    """
+    env = dict(os.environ, TMP=tmp_dir)
+    command = [sys.executable, os.path.join(BENCHMARKS, "vep_check.py"), "--run"]
+    annotated = 0
+    for row in rows[:20]:
+        output = subprocess.check_output(
+            command + ["-sv", sv_string(row), "-of", "-db", store], env=env
+        )
+        result = json.loads(output.strip().split("\n")[-1])
+        annotated += result["status"] == "SUCCESS"
+        if not matches(result, row):
+            return ["offline_sv"]
+    print("offline -sv   %d of 20 SVs annotated from the store" % annotated)
+    moved = dict(rows[0], Pos2=str(int(rows[0]["Pos2"]) + 1))
+    output = subprocess.check_output(
+        command + ["-sv", sv_string(moved), "-of", "-db", store], env=env
+    )
+    result = json.loads(output.strip().split("\n")[-1])
+    if result["status"] != "FAILED" or not result["message"]:
+        return ["offline_sv_not_stored"]
+    return []
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    failed = []
+    try:
+        path, out = os.path.join(tmp_dir, "svs.txt"), os.path.join(tmp_dir, "out.tsv")
+        store = os.path.join(tmp_dir, "store.db")
+        synthetic.write_table(path, ROWS)
+        annotate(path, out, tmp_dir, ["-w", "1"])
+        rows = read_rows(out)
+        with open(os.path.join(tmp_dir, "server.log"), "w") as log:
+            failed += check_http(rows, "127.0.0.1:%d" % free_port(), store, tmp_dir, log)
+            failed += check_socket(
+                rows, os.path.join(tmp_dir, "server.sock"), store, tmp_dir, log
+            )
+        with open(os.path.join(tmp_dir, "server.log")) as f:
+            # Once for each server and once more on SIGHUP
+            if f.read().count("Loaded references") != 3:
+                failed.append("reload")
+        failed += check_offline(rows, store, tmp_dir)
+        if failed:
+            with open(os.path.join(tmp_dir, "server.log")) as f:
+                sys.stdout.write(f.read())
+    finally:
+        shutil.rmtree(tmp_dir)
+    for name in failed:
+        print("FAILED %s" % name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
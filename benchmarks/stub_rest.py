@@ -0,0 +1,162 @@
+#!/usr/bin/env python2
+"""
+Stand-in for the Ensembl variant_recoder endpoint used by the REST
+resolver checks. Breakpoints get the cDNA annotations of the stand-in
+VEP of benchmarks/stub_vep.py. The reference allele is T at positions
+divisible by four and C elsewhere, so part of the dummy queries are
+rejected as by Ensembl, and requests can be made to fail or be rate
+limited to exercise the retries of the resolver.
+"""
+
+import re
+import json
+import urllib
+import threading
+import SocketServer
+import BaseHTTPServer
+
+import stub_vep
+
+QUERY = re.compile(r"^(\w+):g\.(\d+)([ACGT])>([ACGT])$")
+
+
+def reference_allele(pos):
+    """
+    Get the reference allele of the stand-in genome
+    int -> str
+    """
+    return "T" if pos % 4 == 0 else "C"
+
+
+class recoder_handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answer variant_recoder GET and POST requests
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, code, body, headers=()):
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body))
+
+    def refused(self, method):
+        """
+        Send the injected failures and count the answered requests
+        str -> bool
+        """
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            if method == "POST" and server.failing_posts:
+                server.failing_posts -= 1
+                status = 503
+            elif server.throttle_every and server.requests % server.throttle_every == 0:
+                status = 429
+            else:
+                status = None
+                server.answered[method] += 1
+        if status == 503:
+            self.send(status, {"error": "Service unavailable"})
+        elif status == 429:
+            self.send(
+                status,
+                {"error": "Too many requests"},
+                [("Retry-After", server.retry_after)],
+            )
+        return status is not None
+
+    def do_POST(self):
+        if self.refused("POST"):
+            return
+        length = int(self.headers["Content-Length"])
+        queries = json.loads(self.rfile.read(length))["ids"]
+        records = [self.server.recode(query) for query in queries]
+        # Batched replies are keyed by allele and skip rejected queries
+        self.send(
+            200,
+            [
+                {QUERY.match(r["input"]).group(4): r}
+                for r in records
+                if r is not None
+            ],
+        )
+
+    def do_GET(self):
+        if self.refused("GET"):
+            return
+        query = urllib.unquote(self.path.rsplit("/", 1)[1])
+        record = self.server.recode(query)
+        if record is None:
+            pos = int(QUERY.match(query).group(2))
+            self.send(
+                400,
+                {"error": "(%s) does not match reference allele" % reference_allele(pos)},
+            )
+        else:
+            self.send(200, [record])
+
+
+class stub_rest_server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Threaded stand-in server on a free local port. failing_posts is
+    the number of POST requests to answer with 503 and
+    throttle_every sends 429 to every nth request, with retry_after
+    as its Retry-After header.
+    """
+
+    def __init__(self, failing_posts=0, throttle_every=0, retry_after="0.01"):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), recoder_handler)
+        self.daemon_threads = True
+        self.bins = stub_vep.load_spans()
+        self.failing_posts = failing_posts
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.answered = {"GET": 0, "POST": 0}
+        self.url = "http://127.0.0.1:%d" % self.server_address[1]
+
+    def recode(self, query):
+        """
+        Get the variant_recoder record of a dummy query, or None
+        when its reference allele is wrong
+        str -> dict
+        """
+        chrom, pos, ref, alt = QUERY.match(query).groups()
+        pos = int(pos)
+        if ref != reference_allele(pos):
+            return None
+        hgvsc = [
+            "%s:%s%s>%s" % (tx, cdna, ref, alt)
+            for tx, cdna in expected_cdnas(self.bins, chrom, pos)
+        ]
+        return {"input": query, "hgvsc": hgvsc}
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+def expected_cdnas(bins, chrom, pos):
+    """
+    Get the (transcript, cdna) pairs the stand-in VEP reports for a
+    breakpoint, leaving out transcripts without a cDNA position
+    dict, str, int -> list
+    """
+    record = stub_vep.annotate(bins, chrom, pos)
+    return [
+        (c["transcript_id"], c["hgvsc"].split(":", 1)[1][: -len("delN")])
+        for c in record.get("transcript_consequences", [])
+        if "hgvsc" in c
+    ]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python2
+"""
+Stand-in for the VEP script used by benchmarks. It accepts the VEP
+command line used by sv-annotator, reads the breakpoint VCF and
+writes one JSON record per breakpoint with deterministic cDNA
+annotations for every canonical transcript overlapping it. Input
+and output default to stdin and stdout. STUB_VEP_DELAY delays every
+run by that many seconds, to let checks observe concurrent runs.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main.reference import DATA_DIR, REFFLAT_SUMMARY, TRANSCRIPT_REFERENCE, read_table
+
+BIN = 1000000
+
+
+def load_spans(data_dir=DATA_DIR):
+    """
+    Get the spans of all lookup transcripts, binned by chromosome
+    and megabase
+    str -> dict
+    """
+    reference = read_table(os.path.join(data_dir, TRANSCRIPT_REFERENCE))
+    lookup = {}
+    for reported, tx in zip(reference["Reported_Transcript"], reference["Lookup_Transcript"]):
+        lookup.setdefault(reported, []).append(tx)
+    summary = read_table(os.path.join(data_dir, REFFLAT_SUMMARY))
+    bins = {}
+    for chrom, transcript, pos1, pos2 in zip(
+        summary["Chrom"], summary["Transcript"], summary["pos1"], summary["pos2"]
+    ):
+        start, end = sorted((int(pos1), int(pos2)))
+        for tx in lookup.get(transcript, []):
+            for b in range(start // BIN, end // BIN + 1):
+                bins.setdefault((chrom, b), []).append((start, end, tx))
+    return bins
+
+
+def hgvsc(pos, tx):
+    """
+    Get a deterministic cDNA annotation, with a share of UTR and
+    intronic positions and of transcripts VEP reports without one
+    int, str -> (str or None)
+    """
+    h = (pos * 2654435761 + zlib.crc32(tx)) % 1000
+    if h < 20:
+        return None
+    if h < 40:
+        return "c.-%d" % (h + 1)
+    if h < 80:
+        return "c.*%d" % (h + 1)
+    if h < 400:
+        return "c.%d+%d" % (h * 3, h % 50 + 1)
+    return "c.%d" % (h * 3)
+
+
+def annotate(bins, chrom, pos):
+    """
+    Get the VEP JSON record of a breakpoint
+    dict, str, int -> dict
+    """
+    record = {"id": "%s_%s_N/-" % (chrom, pos)}
+    consequences = []
+    for start, end, tx in bins.get((chrom, pos // BIN), []):
+        if start <= pos <= end:
+            consequence = {"transcript_id": tx}
+            cdna = hgvsc(pos, tx)
+            if cdna is not None:
+                consequence["hgvsc"] = "%s:%sdelN" % (tx, cdna)
+            consequences.append(consequence)
+    if consequences:
+        record["transcript_consequences"] = consequences
+    return record
+
+
+def option(argv, names, default):
+    """
+    Get the value of a command line option
+    list, list, str -> str
+    """
+    for name in names:
+        if name in argv:
+            return argv[argv.index(name) + 1]
+    return default
+
+
+def main(argv):
+    source = option(argv, ["--input_file", "-i"], "STDIN")
+    target = option(argv, ["--out", "--output_file", "-o"], "STDOUT")
+    bins = load_spans()
+    time.sleep(float(os.environ.get("STUB_VEP_DELAY", 0)))
+    fi = sys.stdin if source == "STDIN" else open(source)
+    fo = sys.stdout if target == "STDOUT" else open(target, "w")
+    for line in fi:
+        if line.startswith("#") or not line.strip():
+            continue
+        chrom, pos = line.split("\t")[:2]
+        if not pos.isdigit():
+            # VEP warns about and skips invalid positions
+            sys.stderr.write("WARNING: invalid position %s:%s\n" % (chrom, pos))
+            continue
+        fo.write(json.dumps(annotate(bins, chrom, int(pos))) + "\n")
+    fo.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
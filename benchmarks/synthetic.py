@@ -0,0 +1,244 @@
+#!/usr/bin/env python2
+"""
+Generate synthetic iCallSV tables for benchmarking. Breakpoints are
+drawn from the canonical transcripts of the refFlat summary and the
+transcript reference, with a mix of fusions, translocations,
+intragenic deletions and duplications, intergenic and non-panel
+breakpoints resembling clinical calls.
+
+    python benchmarks/synthetic.py -n 100000 -o svs.txt [--seed 0]
+"""
+
+import os
+import sys
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main.reference import DATA_DIR, REFFLAT_SUMMARY, TRANSCRIPT_REFERENCE, read_table
+
+COLUMNS = [
+    "TumorId",
+    "NormalId",
+    "Chr1",
+    "Pos1",
+    "Chr2",
+    "Pos2",
+    "SV_Type",
+    "Gene1",
+    "Gene2",
+    "Site1Description",
+    "Site2Description",
+    "Fusion",
+]
+
+# Relative frequency of each kind of SV
+MIX = [
+    ("fusion", 30),
+    ("translocation", 15),
+    ("intragenic", 25),
+    ("intergenic", 10),
+    ("non_panel", 15),
+    ("antisense", 5),
+]
+
+# Share of non-translocation SVs with both breakpoints on one chromosome
+SAME_CHROMOSOME = 0.6
+
+FUSION_FRAMES = ["in frame", "mid-exon", "out of frame"]
+
+
+def load_transcripts(data_dir=DATA_DIR):
+    """
+    Get the canonical transcripts of the refFlat summary on the main
+    chromosomes with their panel status, as (panel, non panel) lists
+    of (gene, chrom, strand, start, end, last_exon)
+    str -> (list, list)
+    """
+    reference = read_table(os.path.join(data_dir, TRANSCRIPT_REFERENCE))
+    panel = set(g for g, p in zip(reference["Gene"], reference["IsPanel"]) if p == "1")
+    known = set(reference["Gene"])
+    summary = read_table(os.path.join(data_dir, REFFLAT_SUMMARY))
+    transcripts = ([], [])
+    seen = set()
+    for chrom, strand, gene, last, pos1, pos2 in zip(
+        summary["Chrom"],
+        summary["Strand"],
+        summary["Gene"],
+        summary["last_exon"],
+        summary["pos1"],
+        summary["pos2"],
+    ):
+        if gene in seen or gene not in known or " " in gene:
+            continue
+        if not (chrom.isdigit() or chrom in ("X", "Y")) or int(last) < 2:
+            continue
+        seen.add(gene)
+        start, end = sorted((int(pos1), int(pos2)))
+        record = (gene, chrom, strand, start, end, int(last))
+        transcripts[0 if gene in panel else 1].append(record)
+    return transcripts
+
+
+def site(rng, transcript, pos):
+    """
+    Describe a genic breakpoint as an exon or an intron
+    Random, tuple, int -> str
+    """
+    gene, _, strand, _, _, last_exon = transcript
+    label = "%s(%s)" % (gene, strand)
+    exon = rng.randint(2, last_exon)
+    r = rng.random()
+    if r < 0.3:
+        return "Exon %d of %s" % (exon, label)
+    distance = (
+        "%dbp" % rng.randint(1, 999) if r < 0.65 else "%dKb" % rng.randint(1, 40)
+    )
+    direction = "after" if rng.random() < 0.5 else "before"
+    if direction == "after":
+        exon -= 1
+    return "Intron of %s:%s %s exon %d" % (label, distance, direction, exon)
+
+
+def breakpoint(rng, transcript):
+    """
+    Draw a breakpoint within a transcript
+    Random, tuple -> (str, int, str, str)
+    """
+    gene, chrom, _, start, end, _ = transcript
+    pos = rng.randint(start, end)
+    return chrom, pos, gene, site(rng, transcript, pos)
+
+
+def intergenic(rng, transcript):
+    """
+    Draw a breakpoint upstream of a transcript
+    Random, tuple -> (str, int, str, str)
+    """
+    gene, chrom, strand, start, end, _ = transcript
+    kb = rng.randint(2, 80)
+    pos = start - kb * 1000 if strand == "+" else end + kb * 1000
+    return chrom, max(1, pos), gene, "IGR: %dKb before %s(%s)" % (kb, gene, strand)
+
+
+def by_chromosome(transcripts):
+    """
+    Group transcripts by chromosome
+    list -> dict
+    """
+    groups = {}
+    for t in transcripts:
+        groups.setdefault(t[1], []).append(t)
+    return groups
+
+
+def make_sv(rng, kind, pools):
+    """
+    Draw one SV of the given kind as an iCallSV row without sample
+    ids, from panel and non-panel pools of (transcripts, transcripts
+    by chromosome)
+    Random, str, dict -> list
+    """
+    panel = pools["panel"][0]
+    t1 = rng.choice(panel)
+    if kind == "intragenic":
+        b1, b2 = sorted(
+            [breakpoint(rng, t1), breakpoint(rng, t1)], key=lambda b: b[1]
+        )
+        svtype = rng.choice(["DEL", "DEL", "DUP", "INV"])
+        if rng.random() < 0.5:
+            n = rng.randint(1, max(1, t1[5] // 3))
+            name = "Deletion" if svtype == "DEL" else "Duplication"
+            description = "%s of %d exon%s : %s" % (
+                name,
+                n,
+                "s" if n > 1 else "",
+                rng.choice(["in frame", "out of frame"]),
+            )
+        else:
+            description = rng.choice(
+                ["Deletion within transcript : mid-exon", "Deletion within transcript", "-"]
+            )
+    else:
+        pool, groups = pools["non_panel" if kind == "non_panel" else "panel"]
+        if kind != "translocation" and rng.random() < SAME_CHROMOSOME:
+            pool = groups.get(t1[1], pool)
+        t2 = rng.choice(pool)
+        b1 = breakpoint(rng, t1)
+        b2 = intergenic(rng, t2) if kind == "intergenic" else breakpoint(rng, t2)
+        if rng.random() < 0.5:
+            b1, b2 = b2, b1
+        if b1[0] != b2[0]:
+            svtype = "TRA"
+        else:
+            svtype = rng.choice(["DEL", "DUP", "INV"])
+            b1, b2 = sorted([b1, b2], key=lambda b: b[1])
+        if kind == "fusion":
+            genes = [b1[2], b2[2]]
+            rng.shuffle(genes)
+            description = "Protein Fusion: %s  {%s:%s}" % (
+                rng.choice(FUSION_FRAMES),
+                genes[0],
+                genes[1],
+            )
+        elif kind == "antisense":
+            description = "Antisense Fusion"
+        elif kind == "translocation" and rng.random() < 0.3:
+            description = "Transcript Fusion {%s:%s}" % (b1[2], b2[2])
+        else:
+            description = "-"
+    return [
+        b1[0],
+        str(b1[1]),
+        b2[0],
+        str(b2[1]),
+        svtype,
+        b1[2],
+        b2[2],
+        b1[3],
+        b2[3],
+        description,
+    ]
+
+
+def generate(n, seed=0, transcripts=None):
+    """
+    Generate n synthetic iCallSV rows
+    int, int, tuple -> iterator
+    """
+    rng = random.Random(seed)
+    panel, non_panel = transcripts or load_transcripts()
+    pools = {
+        "panel": (panel, by_chromosome(panel)),
+        "non_panel": (non_panel, by_chromosome(non_panel)),
+    }
+    kinds = [kind for kind, weight in MIX for _ in range(weight)]
+    for i in range(n):
+        row = make_sv(rng, rng.choice(kinds), pools)
+        yield ["S%05d-T" % (i % 5000), "S%05d-N" % (i % 5000)] + row
+
+
+def write_table(path, n, seed=0):
+    """
+    Write a synthetic iCallSV table
+    str, int, int -> None
+    """
+    with open(path, "w") as f:
+        f.write("\t".join(COLUMNS) + "\n")
+        for row in generate(n, seed):
+            f.write("\t".join(row) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic iCallSV table generator")
+    parser.add_argument("-n", "--rows", type=int, default=1000, help="number of SVs")
+    parser.add_argument("-o", "--out_file", type=str, required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_table(args.out_file, args.rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
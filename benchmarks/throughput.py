@@ -0,0 +1,365 @@
+#!/usr/bin/env python2
+"""
+End-to-end batch benchmark of sv-annotator. Synthetic iCallSV tables
+are annotated through the batch path with the stand-in VEP of
+benchmarks/stub_vep.py, each size in a fresh process, reporting
+SVs/second, peak RSS and the time spent in every stage.
+
+Golden checks run first: the test data, a copy of it with invalid
+positions and a fixed synthetic table are annotated with the object
+and columnar engines and compared with the outputs in
+benchmarks/golden, so a speedup cannot silently change the notes.
+Refresh them with --update_golden after an intended change.
+
+    python benchmarks/throughput.py [-n 1000 10000 100000] [-w 4] [-c]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import resource
+import tempfile
+import contextlib
+import subprocess
+import logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+GOLDEN_DIR = os.path.join(BENCHMARKS, "golden")
+TEST_DATA = os.path.join(ROOT, "test", "test_data.txt")
+GOLDEN_SEED, GOLDEN_ROWS = 0, 2000
+MEMO_SIZE = 50000
+SV_TYPES = {
+    "DELETION": "DEL",
+    "DUPLICATION": "DUP",
+    "INVERSION": "INV",
+    "TRANSLOCATION": "TRA",
+}
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+
+def use_stub_vep():
+    """
+    Point the batch path at the stand-in VEP
+    None -> None
+    """
+    import main.models as models
+
+    models.PERL = sys.executable
+    models.VEP = os.path.join(BENCHMARKS, "stub_vep.py")
+
+
+class stage_timer(object):
+    """
+    Accumulate wall time per named stage
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.times = {}
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        if name not in self.times:
+            self.stages.append(name)
+            self.times[name] = 0.0
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.times[name] += time.time() - start
+
+
+def annotate_table(
+    path, out, workers=1, columnar=False, chunksize=500, timer=None, memo=None
+):
+    """
+    Annotate an iCallSV table with the batch path into out
+    str, file, int, bool, int, stage_timer, breakpoint_memo -> int
+    """
+    from main import batch
+    from main.models import build_cache
+    from main.reference import references
+
+    timer = timer or stage_timer()
+    with timer("read"):
+        with open(path) as f:
+            sv_all_data = batch.read_svs(f)[0]
+    with timer("breakpoints"):
+        bkps = batch.get_unique_breakpoints([sv_all_data])
+    with timer("vep_cache"):
+        cache = build_cache(bkps, references.transcript_reference, False)
+    with timer("annotate"):
+        if columnar:
+            result = batch.annotate_frame(
+                sv_all_data, references, cache, "columnar", memo=memo
+            )
+        elif workers > 1:
+            pool = batch.start_pool(
+                references, workers, memo_size=memo.maxsize if memo else 0
+            )
+            result = batch.annotate_frame(
+                sv_all_data, references, cache, "pool", pool, chunksize
+            )
+            pool.close()
+            pool.join()
+        else:
+            result = batch.annotate_frame(sv_all_data, references, cache, memo=memo)
+    with timer("write"):
+        result.to_csv(out, sep="\t", index=False)
+    return len(result.index)
+
+
+def test_data_table(path):
+    """
+    Convert the sv strings of the test data to an iCallSV table
+    str -> None
+    """
+    import synthetic
+
+    with open(TEST_DATA) as f, open(path, "w") as out:
+        out.write("\t".join(synthetic.COLUMNS) + "\n")
+        for i, line in enumerate(l.strip() for l in f if l.strip()):
+            fields = line.split(",")
+            if len(fields) != 7:
+                continue
+            svtype, bkp1, bkp2, genes, site1, site2, description = fields
+            gene1, gene2 = genes.split(" / ")
+            row = ["T%d" % i, "N%d" % i]
+            row += bkp1.split(":") + bkp2.split(":") + [SV_TYPES[svtype]]
+            row += [gene1, gene2, site1, site2, description]
+            out.write("\t".join(row) + "\n")
+
+
+def malformed_table(path, source):
+    """
+    Copy an iCallSV table, replacing the first position of every
+    third row and the second position of every fifth row with
+    values VEP and the annotator reject
+    str, str -> None
+    """
+    with open(source) as f, open(path, "w") as out:
+        out.write(f.readline())
+        for i, line in enumerate(f):
+            row = line.rstrip("\n").split("\t")
+            if i % 3 == 0:
+                row[3] = "-"
+            if i % 5 == 0:
+                row[5] = row[5] + "x"
+            out.write("\t".join(row) + "\n")
+
+
+def annotate_text(path, columnar, memo_size=0):
+    """
+    Annotate a table and return the output as a string
+    str, bool, int -> str
+    """
+    from main.memo import breakpoint_memo
+
+    out = tempfile.TemporaryFile()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            annotate_table(
+                path,
+                out,
+                columnar=columnar,
+                memo=breakpoint_memo(memo_size) if memo_size > 0 else None,
+            )
+        finally:
+            sys.stdout = stdout
+    out.seek(0)
+    return out.read()
+
+
+def check_golden(tmp_dir, update=False):
+    """
+    Compare the annotations of the test data, of the test data with
+    invalid positions and of a fixed synthetic table with the golden
+    outputs of both engines, with and without the breakpoint memo.
+    Returns the names of the failed checks.
+    str, bool -> list
+    """
+    import synthetic
+
+    tables = {
+        "test_data": os.path.join(tmp_dir, "test_data.txt"),
+        "malformed": os.path.join(tmp_dir, "malformed.txt"),
+        "synthetic": os.path.join(tmp_dir, "synthetic.txt"),
+    }
+    test_data_table(tables["test_data"])
+    malformed_table(tables["malformed"], tables["test_data"])
+    synthetic.write_table(tables["synthetic"], GOLDEN_ROWS, GOLDEN_SEED)
+    digests_path = os.path.join(GOLDEN_DIR, "digests.json")
+    digests = {}
+    if os.path.exists(digests_path):
+        with open(digests_path) as f:
+            digests = json.load(f)
+    failed = []
+    for name, path in sorted(tables.items()):
+        outputs = dict(
+            (engine, annotate_text(path, engine.startswith("columnar"), memo_size))
+            for engine, memo_size in (
+                ("object", 0),
+                ("object+memo", MEMO_SIZE),
+                ("columnar", 0),
+                ("columnar+memo", MEMO_SIZE),
+            )
+        )
+        golden_path = os.path.join(GOLDEN_DIR, name + ".tsv")
+        if update:
+            # The other outputs are only kept as digests
+            if name == "test_data":
+                with open(golden_path, "w") as f:
+                    f.write(outputs["object"])
+            digests[name] = hashlib.sha256(outputs["object"]).hexdigest()
+        for engine, output in sorted(outputs.items()):
+            ok = hashlib.sha256(output).hexdigest() == digests.get(name)
+            print("golden %-10s %-13s %s" % (name, engine, "ok" if ok else "CHANGED"))
+            if not ok:
+                failed.append("%s/%s" % (name, engine))
+    if update:
+        with open(digests_path, "w") as f:
+            json.dump(digests, f, indent=2, sort_keys=True)
+    return failed
+
+
+def run_one(rows, workers, columnar, chunksize, seed, memo_size):
+    """
+    Benchmark one table size in this process and return the report
+    int, int, bool, int, int, int -> dict
+    """
+    from main.memo import breakpoint_memo
+
+    import synthetic
+
+    memo = breakpoint_memo(memo_size) if memo_size > 0 else None
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["TMP"] = tmp_dir
+    try:
+        path = os.path.join(tmp_dir, "svs.txt")
+        synthetic.write_table(path, rows, seed)
+        timer = stage_timer()
+        start = time.time()
+        with open(os.path.join(tmp_dir, "out.txt"), "w") as out:
+            annotate_table(path, out, workers, columnar, chunksize, timer, memo)
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(tmp_dir)
+    return {
+        "rows": rows,
+        "seconds": elapsed,
+        "svs_per_second": rows / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "peak_child_rss_mb": (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+        ),
+        "stages": [(name, timer.times[name]) for name in timer.stages],
+        # Workers fill their own memos, only in-process runs report it
+        "memo_hit_rate": memo.hit_rate() if memo and workers < 2 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sv-annotator batch benchmark")
+    parser.add_argument(
+        "-n", "--rows", type=int, nargs="+", default=[1000, 10000], help="table sizes"
+    )
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("-cs", "--chunksize", type=int, default=500)
+    parser.add_argument("-c", "--columnar", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "-m", "--memo_size", type=int, default=0, help="breakpoint memo size"
+    )
+    parser.add_argument("--skip_golden", action="store_true")
+    parser.add_argument("--update_golden", action="store_true")
+    parser.add_argument("--json", type=str, help="write the reports to a file")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.getLogger("basic_logger").addHandler(logging.NullHandler())
+    use_stub_vep()
+
+    if args.single:
+        # Child process of a benchmark run, report on the last line
+        with contextlib.closing(os.fdopen(os.dup(1), "w")) as report:
+            os.dup2(2, 1)
+            report.write(
+                json.dumps(
+                    run_one(
+                        args.rows[0],
+                        args.workers,
+                        args.columnar,
+                        args.chunksize,
+                        args.seed,
+                        args.memo_size,
+                    )
+                )
+                + "\n"
+            )
+        return
+
+    failed = []
+    if not args.skip_golden:
+        tmp_dir = tempfile.mkdtemp()
+        os.environ["TMP"] = tmp_dir
+        try:
+            failed = check_golden(tmp_dir, args.update_golden)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    reports = []
+    for rows in args.rows:
+        command = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--single",
+            "-n",
+            str(rows),
+            "-w",
+            str(args.workers),
+            "-cs",
+            str(args.chunksize),
+            "--seed",
+            str(args.seed),
+            "-m",
+            str(args.memo_size),
+        ] + (["-c"] if args.columnar else [])
+        with open(os.devnull, "w") as devnull:
+            output = subprocess.check_output(command, stderr=devnull)
+        report = json.loads(output.strip().splitlines()[-1])
+        reports.append(report)
+        print(
+            "%8d SVs  %8.1f SVs/s  %7.2fs  peak RSS %6.1f MB (children %6.1f MB)"
+            % (
+                rows,
+                report["svs_per_second"],
+                report["seconds"],
+                report["peak_rss_mb"],
+                report["peak_child_rss_mb"],
+            )
+        )
+        print(
+            "          "
+            + "  ".join("%s %.2fs" % (name, t) for name, t in report["stages"])
+            + (
+                "  memo hit rate %.1f%%" % (100 * report["memo_hit_rate"])
+                if report["memo_hit_rate"] is not None
+                else ""
+            )
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    if failed:
+        print("Golden outputs changed: " + ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
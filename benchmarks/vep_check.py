@@ -0,0 +1,198 @@
+#!/usr/bin/env python2
+"""
+Checks of the sharded VEP runs against the stand-in VEP of
+benchmarks/stub_vep.py:
+
+- a cache built from several concurrent shards holds the same
+  annotations as one built from a single VEP run
+- with several shards, SVs are annotated while later shards are
+  still running, and the output matches a single shard run
+- a failing VEP run stops the annotation
+- VEP input and output never touch the disk
+
+    python benchmarks/vep_check.py
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import synthetic
+from throughput import use_stub_vep
+
+ROWS = 3000
+
+
+def cache_entries(cache):
+    """
+    Get the annotations of a cache as sorted (chromosome, position,
+    transcript, hgvsc) tuples, independent of its integer codes
+    vep_cache -> list
+    """
+    cache.finalize()
+    chroms = dict((code, chrom) for chrom, code in cache.chrom_codes.items())
+    transcripts = dict((code, tx) for tx, code in cache.transcript_codes.items())
+    mask = (1 << cache.TX_BITS) - 1
+    return sorted(
+        (
+            chroms[int(entry) >> cache.TX_BITS >> 32],
+            (int(entry) >> cache.TX_BITS) & 0xFFFFFFFF,
+            transcripts[int(entry) & mask],
+            hgvsc,
+        )
+        for entry, hgvsc in zip(cache.entries, cache.hgvsc)
+    )
+
+
+def check_shards(path, tmp_dir):
+    """
+    Build the cache of a table with one VEP run and with concurrent
+    shards and compare them
+    str, str -> list
+    """
+    from main import batch
+    from main.models import build_cache
+    from main.reference import references
+
+    failed = []
+    with open(path) as f:
+        bkps = batch.get_unique_breakpoints([batch.read_svs(f)[0]])
+    caches = {}
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            for name, cpus, shard_size in (("single", 1, len(bkps.index)), ("sharded", 4, 700)):
+                caches[name] = cache_entries(
+                    build_cache(
+                        bkps, references.transcript_reference, False, None, None, cpus, shard_size
+                    )
+                )
+        finally:
+            sys.stdout = stdout
+    if caches["single"] != caches["sharded"]:
+        failed.append("shards")
+    if os.listdir(tmp_dir):
+        failed.append("vep_files")
+    print("shards        %d breakpoints, %d annotations" % (len(bkps.index), len(caches["single"])))
+    return failed
+
+
+def annotate(path, out, tmp_dir, options, delay=0, vep=None):
+    """
+    Annotate a table on the command line with the stand-in VEP, or
+    another script, and return the exit status. Without a table, the
+    options give the input.
+    str, str, str, list, float, str -> int
+    """
+    env = dict(os.environ, TMP=tmp_dir, STUB_VEP_DELAY=str(delay))
+    command = [sys.executable, os.path.abspath(__file__), "--run"]
+    if vep:
+        command += ["--vep", vep]
+    with open(os.devnull, "w") as devnull:
+        return subprocess.call(
+            command + (["-i", path] if path else []) + ["-o", out] + options,
+            env=env,
+            stdout=devnull,
+            stderr=devnull,
+        )
+
+
+def check_pipelined(path, tmp_dir):
+    """
+    Annotate a table with slow concurrent shards and check that SVs
+    were annotated before the last shard completed
+    str, str -> list
+    """
+    failed = []
+    single, sharded = [os.path.join(tmp_dir, name) for name in ("single.tsv", "sharded.tsv")]
+    report = os.path.join(tmp_dir, "profile.json")
+    annotate(path, single, tmp_dir, ["--vep_cpus", "1", "--vep_shard_size", "100000"])
+    status = annotate(
+        path,
+        sharded,
+        tmp_dir,
+        ["-w", "2", "-cs", "100", "--vep_cpus", "2", "--vep_shard_size", "800", "-p", report],
+        delay=0.5,
+    )
+    with open(single) as f1, open(sharded) as f2:
+        if status or f1.read() != f2.read():
+            failed.append("pipelined_output")
+    with open(report) as f:
+        counters = [p["counters"] for p in json.load(f)["by_process"] if p["role"] == "main"][0]
+    if not counters.get("vep.pipelined_svs"):
+        failed.append("pipelined")
+    print(
+        "pipelined     %d shards, %d of %d SVs annotated while shards were running"
+        % (counters.get("vep.shards", 0), counters.get("vep.pipelined_svs", 0), ROWS)
+    )
+    return failed
+
+
+def check_failure(path, tmp_dir):
+    """
+    Annotate a table with a VEP script that fails and check that the
+    run fails
+    str, str -> list
+    """
+    failed = []
+    status = annotate(
+        path,
+        os.path.join(tmp_dir, "failed.tsv"),
+        tmp_dir,
+        ["--vep_cpus", "2", "--vep_shard_size", "800"],
+        vep=os.path.join(tmp_dir, "missing_vep.py"),
+    )
+    if status != 1:
+        failed.append("failure_status")
+    print("failure       exit status %d" % status)
+    return failed
+
+
+def run(argv):
+    """
+    Run the command line with the stand-in VEP, or another script
+    list -> None
+    """
+    import main.models as models
+    import svannotate
+
+    use_stub_vep()
+    if argv[0] == "--vep":
+        models.VEP, argv = argv[1], argv[2:]
+    sys.argv = [svannotate.__file__] + argv
+    svannotate.main()
+
+
+def main():
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2:])
+        return
+    use_stub_vep()
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["TMP"] = tmp_dir
+    try:
+        path = os.path.join(tmp_dir, "svs.txt")
+        synthetic.write_table(path, ROWS)
+        vep_dir = os.path.join(tmp_dir, "vep")
+        os.mkdir(vep_dir)
+        os.environ["TMP"] = vep_dir
+        failed = check_shards(path, vep_dir)
+        failed += check_pipelined(path, tmp_dir)
+        failed += check_failure(path, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
+    for name in failed:
+        print("FAILED %s" % name)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
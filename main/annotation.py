@@ -2,85 +2,159 @@
 import os
 import sys
 import logging
-from constants import cb_df
-from models import BreakPointIntergenic
+from reference import references
+from models import BreakPointIntergenic, partner_signature
 
 logger = logging.getLogger("basic_logger")
 
 
-def get_variant_annotation(sv):
+def get_variant_annotation(sv, cytobands=None):
     """
     Gall annotation function based on the
-    the type of SV in the sv object
-    sv -> func(sv)
+    the type of SV in the sv object, with the cytobands
+    of the given index or else of the shared references
+    sv, cytoband_index -> func(sv)
     """
     if sv.svtype == "TRANSLOCATION":
-        sv.annotation = get_translocation(sv)
+        sv.annotation = get_translocation(sv, cytobands)
     else:
         sv.annotation = get_other_svs(sv)
     return sv.annotation
 
 
-def get_translocation(sv):
+# Annotation templates: genes and transcripts of the partners, then
+# for SVs other than translocations their cDNA or genomic positions
+GENES = "%s (%s) - %s (%s) %s: "
+GENE = "%s (%s) %s: "
+GENES_CDNA = "%s (%s) - %s (%s) %s: %s:%s_%s:%s%s"
+GENE_CDNA = "%s (%s) %s: %s_%s%s"
+GENE_GENOMIC = "%s (%s) %s: %s:%s_%s%s"
+TRANSLOCATION = "t(%s;%s)(%s;%s)(chr%s:g.%s::chr%s:g.%s)"
+# Suffixes of SV types other than translocations
+SV_SUFFIXES = {"DUPLICATION": "dup", "DELETION": "del", "INVERSION": "inv"}
+
+
+def genomic_position(bkp):
+    return "chr" + bkp.chrom + ":g." + str(bkp.pos)
+
+
+def translocation_genes(partner1, partner2, fusion_type):
+    return GENES % (
+        partner1.gene,
+        partner1.transcript,
+        partner2.gene,
+        partner2.transcript,
+        fusion_type,
+    )
+
+
+def translocation_gene(partner, fusion_type):
+    return GENE % (partner.gene, partner.transcript, fusion_type)
+
+
+def genes_cdna(partner1, partner2, fusion_type, svtype):
+    return GENES_CDNA % (
+        partner1.gene,
+        partner1.transcript,
+        partner2.gene,
+        partner2.transcript,
+        fusion_type,
+        partner1.cdna,
+        partner1.gene,
+        partner2.cdna,
+        partner2.gene,
+        svtype,
+    )
+
+
+def gene_cdna(partner1, partner2, fusion_type, svtype):
+    return GENE_CDNA % (
+        partner1.gene,
+        partner1.transcript,
+        fusion_type,
+        partner1.cdna,
+        partner2.cdna,
+        svtype,
+    )
+
+
+def gene_genomic(partner, other, fusion_type, svtype):
+    return GENE_GENOMIC % (
+        partner.gene,
+        partner.transcript,
+        fusion_type,
+        partner.cdna,
+        partner.gene,
+        genomic_position(other),
+        svtype,
+    )
+
+
+# Annotation of the genes of a translocation and of other SVs by
+# the partner signature of the sv
+TRANSLOCATION_RULES = {
+    "fusion": lambda sv, fusion_type: translocation_genes(
+        sv.fusionPartner1, sv.fusionPartner2, fusion_type
+    ),
+    "both": lambda sv, fusion_type: translocation_genes(
+        sv.annotationPartner1, sv.annotationPartner2, fusion_type
+    ),
+    "intragenic": lambda sv, fusion_type: translocation_genes(
+        sv.annotationPartner1, sv.annotationPartner2, fusion_type
+    ),
+    "first": lambda sv, fusion_type: translocation_gene(
+        sv.annotationPartner1, fusion_type
+    ),
+    "second": lambda sv, fusion_type: translocation_gene(
+        sv.annotationPartner2, fusion_type
+    ),
+}
+OTHER_SV_RULES = {
+    "fusion": lambda sv, fusion_type, svtype: genes_cdna(
+        sv.fusionPartner1, sv.fusionPartner2, fusion_type, svtype
+    ),
+    "both": lambda sv, fusion_type, svtype: genes_cdna(
+        sv.annotationPartner1, sv.annotationPartner2, fusion_type, svtype
+    ),
+    "intragenic": lambda sv, fusion_type, svtype: gene_cdna(
+        sv.annotationPartner1, sv.annotationPartner2, fusion_type, svtype
+    ),
+    "first": lambda sv, fusion_type, svtype: gene_genomic(
+        sv.annotationPartner1, sv.annotationPartner2, fusion_type, svtype
+    ),
+    "second": lambda sv, fusion_type, svtype: gene_genomic(
+        sv.annotationPartner2, sv.annotationPartner1, fusion_type, svtype
+    ),
+}
+
+
+def get_translocation(sv, cytobands=None):
     """
     Get annotation and coordinate for translocations based on 
     the panel and coding characterisitcs of the two breakpoints
     in the given sv object
-    sv -> str
+    sv, cytoband_index -> str
     """
-    fusion_type = "rearrangement"
-    Annotation = ""
-    if sv.isFusion:
-        if sv.isKnownFusion is True:
-            fusion_type = "fusion"
-        Annotation = "%s (%s) - %s (%s) %s: " % (
-            sv.fusionPartner1.gene,
-            sv.fusionPartner1.transcript,
-            sv.fusionPartner2.gene,
-            sv.fusionPartner2.transcript,
-            fusion_type,
-        )
-    elif all(
-        [
-            sv.annotationPartner1.isPanel,
-            sv.annotationPartner2.isPanel,
-            sv.annotationPartner1.isCoding,
-            sv.annotationPartner2.isCoding,
-        ]
-    ):
-        Annotation = "%s (%s) - %s (%s) %s: " % (
-            sv.annotationPartner1.gene,
-            sv.annotationPartner1.transcript,
-            sv.annotationPartner2.gene,
-            sv.annotationPartner2.transcript,
-            fusion_type,
-        )
-    elif sv.annotationPartner1.isPanel and sv.annotationPartner1.isCoding:
-        Annotation = "%s (%s) %s: " % (
-            sv.annotationPartner1.gene,
-            sv.annotationPartner1.transcript,
-            fusion_type,
-        )
+    signature = partner_signature(sv, sv.isFusion)
+    if signature == "fusion" and sv.isKnownFusion is True:
+        fusion_type = "fusion"
     else:
-        Annotation = "%s (%s) %s: " % (
-            sv.annotationPartner2.gene,
-            sv.annotationPartner2.transcript,
-            fusion_type,
-        )
-
-    cband1 = get_cytoband(sv.annotationPartner1)
-    cband2 = get_cytoband(sv.annotationPartner2)
-    t_format = (
-        sv.annotationPartner1.chrom,
-        sv.annotationPartner2.chrom,
+        fusion_type = "rearrangement"
+    Annotation = TRANSLOCATION_RULES[signature](sv, fusion_type)
+
+    partner1, partner2 = sv.annotationPartner1, sv.annotationPartner2
+    cband1 = get_cytoband(partner1, cytobands)
+    cband2 = get_cytoband(partner2, cytobands)
+    coordinate = TRANSLOCATION % (
+        partner1.chrom,
+        partner2.chrom,
         cband1,
         cband2,
-        sv.annotationPartner1.chrom,
-        sv.annotationPartner1.pos,
-        sv.annotationPartner2.chrom,
-        sv.annotationPartner2.pos,
+        partner1.chrom,
+        partner1.pos,
+        partner2.chrom,
+        partner2.pos,
     )
-    coordinate = "t(%s;%s)(%s;%s)(chr%s:g.%s::chr%s:g.%s)" % t_format
     return Annotation + coordinate
 
 
@@ -92,133 +166,39 @@ def get_other_svs(sv):
     sv -> str
     """
     svtype = reformat(sv.svtype)
-    fusion_type = "rearrangement"
-    if sv.isFusion and sv.bkp1.isCoding and sv.bkp2.isCoding:
-        if sv.isKnownFusion:
-            fusion_type = "fusion"
-        gene1, tx1, cdna1 = (
-            sv.fusionPartner1.gene,
-            sv.fusionPartner1.transcript,
-            sv.fusionPartner1.cdna,
-        )
-        gene2, tx2, cdna2 = (
-            sv.fusionPartner2.gene,
-            sv.fusionPartner2.transcript,
-            sv.fusionPartner2.cdna,
-        )
-        return "%s (%s) - %s (%s) %s: %s:%s_%s:%s%s" % (
-            gene1,
-            tx1,
-            gene2,
-            tx2,
-            fusion_type,
-            cdna1,
-            gene1,
-            cdna2,
-            gene2,
-            svtype,
-        )
-    elif all(
-        [
-            sv.annotationPartner1.isPanel,
-            sv.annotationPartner2.isPanel,
-            sv.annotationPartner1.isCoding,
-            sv.annotationPartner2.isCoding,
-        ]
-    ):
-        gene1, tx1, cdna1 = (
-            sv.annotationPartner1.gene,
-            sv.annotationPartner1.transcript,
-            sv.annotationPartner1.cdna,
-        )
-        gene2, tx2, cdna2 = (
-            sv.annotationPartner2.gene,
-            sv.annotationPartner2.transcript,
-            sv.annotationPartner2.cdna,
-        )
-        if sv.isIntragenic:
-            Annotation = "%s (%s) %s: %s_%s%s" % (
-                gene1,
-                tx1,
-                fusion_type,
-                cdna1,
-                cdna2,
-                svtype,
-            )
-            return Annotation
-        else:
-            Annotation = "%s (%s) - %s (%s) %s: %s:%s_%s:%s%s" % (
-                gene1,
-                tx1,
-                gene2,
-                tx2,
-                fusion_type,
-                cdna1,
-                gene1,
-                cdna2,
-                gene2,
-                svtype,
-            )
-            return Annotation
-    elif sv.annotationPartner1.isPanel and sv.annotationPartner1.isCoding:
-        gene1, tx1, cdna1 = (
-            sv.annotationPartner1.gene,
-            sv.annotationPartner1.transcript,
-            sv.annotationPartner1.cdna,
-        )
-        cdna2 = sv.annotationPartner2.cdna
-        Annotation = "%s (%s) %s: %s:%s_%s%s" % (
-            gene1,
-            tx1,
-            fusion_type,
-            cdna1,
-            gene1,
-            "chr"
-            + sv.annotationPartner2.chrom
-            + ":g."
-            + str(sv.annotationPartner2.pos),
-            svtype,
-        )
-        return Annotation
+    signature = partner_signature(
+        sv, sv.isFusion and sv.bkp1.isCoding and sv.bkp2.isCoding
+    )
+    if signature == "fusion" and sv.isKnownFusion:
+        fusion_type = "fusion"
     else:
-        gene2, tx2, cdna2 = (
-            sv.annotationPartner2.gene,
-            sv.annotationPartner2.transcript,
-            sv.annotationPartner2.cdna,
-        )
-        cdna1 = sv.annotationPartner1.cdna
-        Annotation = "%s (%s) %s: %s:%s_%s%s" % (
-            gene2,
-            tx2,
-            fusion_type,
-            cdna2,
-            gene2,
-            "chr"
-            + sv.annotationPartner1.chrom
-            + ":g."
-            + str(sv.annotationPartner1.pos),
-            svtype,
-        )
-        return Annotation
+        fusion_type = "rearrangement"
+    return OTHER_SV_RULES[signature](sv, fusion_type, svtype)
 
 
-def get_cytoband(bkp):
+def get_cytoband(bkp, cytobands=None):
     """
-    Get cytoband of a breakpoint by querying panda dataframe
-    bkp -> str
+    Get cytoband of a breakpoint from the cytoband interval index
+    bkp, cytoband_index -> str
     """
+    if cytobands is None:
+        cytobands = references.cytobands
     chrom, coord = bkp.chrom, bkp.pos
-    which_cytoband = cb_df[
-        (cb_df["Chr"].values == chrom)
-        & (cb_df["Bp_start"].values <= coord)
-        & (cb_df["Bp_stop"].values >= coord)
-    ]
+    which_cytoband = cytobands.find(chrom, coord)
     if len(which_cytoband) == 0:
-        raise MissingCytoBand(bkp)
+        raise MissingCytoBand("%s:%s" % (chrom, coord))
     elif len(which_cytoband) > 1:
-        raise MultipleCytoBand(bkp)
-    locus = which_cytoband.values[0]
-    return locus[0] + locus[1]
+        raise MultipleCytoBand("%s:%s" % (chrom, coord))
+    return which_cytoband[0]
+
+
+def get_cytobands(chroms, positions):
+    """
+    Get cytobands for a whole column of breakpoints. Breakpoints
+    without a unique cytoband are returned as None
+    array, array -> array
+    """
+    return references.cytobands.find_many(chroms, positions)
 
 
 def reformat(svtype):
@@ -227,8 +207,7 @@ def reformat(svtype):
     str -> str
     """
 
-    svdict = {"DUPLICATION": "dup", "DELETION": "del", "INVERSION": "inv"}
-    return svdict[svtype]
+    return SV_SUFFIXES[svtype]
 
 
 class Error(Exception):
@@ -249,5 +228,5 @@ class MultipleCytoBand(Error):
 
     def __init__(self, bkp):
         Exception.__init__(
-            self, self, "Multiple cytobands identified for the breakpoint: " + bkp
+            self, "Multiple cytobands identified for the breakpoint: " + bkp
         )
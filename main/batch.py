@@ -0,0 +1,694 @@
+#!/usr/bin/env python2
+import os
+import sys
+import gzip
+import json
+import shutil
+import logging
+import tempfile
+import contextlib
+import traceback
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import profiling
+from multiprocessing.util import Finalize
+from profiling import stage, count, timed
+from models import (
+    sv_record,
+    build_cache,
+    cache_builder,
+    timestamp,
+    InputNotSeekable,
+    OutputFormatUnavailable,
+    NotAnnotatedOutput,
+)
+from memo import breakpoint_memo
+from store import breakpoint_store
+from reference import references
+from columnar import annotate_columnar
+from variant import annotation_state, expand_svtype
+from writer import get_output_format, open_writer
+from config import CHECKPOINT_CHUNKSIZE
+from checkpoint import run_checkpoint, run_signature, chunk_digest, split_chunks
+from refdiff import open_references, diff_references
+
+# suppress pandas copy warning
+pd.options.mode.chained_assignment = None
+
+logger = logging.getLogger("basic_logger")
+
+# Annotation state of a worker process, installed by init_worker
+worker_state = None
+
+# Columns of the iCallSV table used for annotation
+SV_COLUMNS = [
+    "TumorId",
+    "NormalId",
+    "Chr1",
+    "Pos1",
+    "Chr2",
+    "Pos2",
+    "SV_Type",
+    "Gene1",
+    "Gene2",
+    "Site1Description",
+    "Site2Description",
+    "Fusion",
+]
+BKP_COLUMNS = ["Chr1", "Pos1", "Chr2", "Pos2"]
+GENE_COLUMNS = ["Gene1", "Gene2"]
+# Columns of the fields of an sv record
+RECORD_COLUMNS = [
+    "SV_Type",
+    "Chr1",
+    "Pos1",
+    "Chr2",
+    "Pos2",
+    "Gene1",
+    "Gene2",
+    "Site1Description",
+    "Site2Description",
+    "Fusion",
+]
+RESULT_COLUMNS = ["Note", "Annotation", "Position", "oncokb_sv_type"]
+# Execution engines of annotate_frame
+ENGINES = ["serial", "pool", "columnar"]
+
+
+def run_batch(args):
+    """
+    Annotate all SVs of the iCallSV table given on the command line
+    and write them with their annotations to the output file
+    Namespace -> None
+    """
+    report_dir = None
+    if args.profile:
+        if args.profile_functions and not os.path.isdir(args.profile_functions):
+            os.makedirs(args.profile_functions)
+        main_profile = profiling.enable("main", args.profile_functions)
+        report_dir = tempfile.mkdtemp()
+    try:
+        with stage("run"):
+            run_stages(args, report_dir)
+    finally:
+        # Also report runs that stop early, and remove the report dir
+        if args.profile:
+            write_profile(args.profile, main_profile, report_dir)
+
+
+def run_stages(args, report_dir=None):
+    """
+    Read the input, build the annotation cache and annotate and
+    write the SVs chunk by chunk
+    Namespace, str -> None
+    """
+    try:
+        output_format = get_output_format(args.out_file, args.out_format)
+    except OutputFormatUnavailable as e:
+        print(timestamp() + str(e))
+        sys.exit(1)
+    if args.reference_bundle:
+        references.use_bundle(args.reference_bundle)
+    input_file, changes, na_values = args.input_file, None, None
+    if args.reannotate_from:
+        try:
+            input_file = open_annotated(args.reannotate_from)
+        except NotAnnotatedOutput as e:
+            print(timestamp() + str(e))
+            sys.exit(1)
+        # Earlier annotations are copied as written
+        na_values = [""]
+        with stage("diff_references"):
+            changes = diff_references(
+                open_references(args.previous_references), references
+            )
+        print(
+            timestamp()
+            + "Reference data of %d genes and %d cytobands changed since %s."
+            % (len(changes.genes), len(changes.cytobands), args.previous_references)
+        )
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = open_checkpoint(args)
+    resumed = checkpoint is not None and bool(checkpoint.chunks)
+    with stage("read_input"):
+        if args.stream_chunksize:
+            # First pass over the breakpoint columns to build one cache,
+            # with the gene columns to select the SVs touched by changed
+            # references, or over whole rows to skip the chunks of a
+            # resumed run
+            usecols = BKP_COLUMNS + GENE_COLUMNS if changes is not None else BKP_COLUMNS
+            try:
+                bkp_chunks = read_svs(
+                    input_file, args.stream_chunksize, None if resumed else usecols, na_values
+                )
+                bkps = get_unique_breakpoints(select_svs(bkp_chunks, checkpoint, changes))
+                sv_chunks = read_svs(input_file, args.stream_chunksize, None, na_values)
+            except InputNotSeekable as e:
+                print(timestamp() + str(e))
+                sys.exit(1)
+        else:
+            sv_chunks = read_svs(input_file, None, None, na_values)
+            if checkpoint is not None:
+                sv_chunks = split_chunks(sv_chunks[0], CHECKPOINT_CHUNKSIZE)
+            bkps = get_unique_breakpoints(select_svs(sv_chunks, checkpoint, changes))
+
+    builder, store = None, None
+    if bkps.empty and resumed:
+        print(timestamp() + "All SVs were annotated by the checkpointed run.")
+    elif bkps.empty and changes is not None:
+        print(timestamp() + "No SVs are touched by the changed reference data.")
+    else:
+        builder, store = start_cache(args, bkps, checkpoint)
+
+    try:
+        annotate_chunks(
+            args, sv_chunks, builder, output_format, report_dir, checkpoint, changes
+        )
+    finally:
+        if builder is not None:
+            builder.close()
+        if store is not None:
+            store.close()
+
+
+def open_checkpoint(args):
+    """
+    Open the checkpoint directory of a run, with the chunks of an
+    earlier run of the same references and VEP when resuming
+    Namespace -> run_checkpoint
+    """
+    previous = None
+    if args.reannotate_from:
+        previous = open_references(args.previous_references)
+    checkpoint = run_checkpoint(
+        args.checkpoint, run_signature(references, args.online, previous), args.resume
+    )
+    if checkpoint.stale:
+        print(
+            timestamp()
+            + "Checkpoint %s was written with other references or VEP; "
+            "annotating all SVs again." % args.checkpoint
+        )
+    elif args.resume:
+        print(
+            timestamp()
+            + "Resuming from %d annotated chunks in %s."
+            % (len(checkpoint.chunks), args.checkpoint)
+        )
+    return checkpoint
+
+
+def open_annotated(path):
+    """
+    Open an output file of an earlier run, gzip or bgzip compressed
+    or not, to annotate it again
+    str -> file
+    """
+    f = gzip.open(path, "rb") if path.endswith((".gz", ".bgz")) else open(path)
+    header = f.readline().rstrip("\r\n").split("\t")
+    if not all(column in header for column in RESULT_COLUMNS):
+        f.close()
+        raise NotAnnotatedOutput(path)
+    f.seek(0)
+    return f
+
+
+def select_svs(sv_chunks, checkpoint=None, changes=None):
+    """
+    Select the SVs to annotate from chunks of SVs, leaving out the
+    chunks of a resumed run and, when annotating an earlier output
+    again, the SVs not touched by the changed references
+    iterable, run_checkpoint, reference_changes -> iterable
+    """
+    if checkpoint is not None and checkpoint.chunks:
+        sv_chunks = checkpoint.pending(sv_chunks)
+    if changes is not None:
+        sv_chunks = changes.select(sv_chunks)
+    return sv_chunks
+
+
+def start_cache(args, bkps, checkpoint=None):
+    """
+    Start building the annotation cache of the breakpoints, with the
+    persistent store given on the command line, or else the one of
+    the checkpoint directory
+    Namespace, df, run_checkpoint -> (cache_builder, breakpoint_store)
+    """
+    try:
+        print(timestamp() + "Proceeding to build annotation cache...")
+        resolver, store = None, None
+        if args.online:
+            from rest import rest_resolver
+
+            resolver = rest_resolver()
+        store_path = args.cache_db
+        if store_path is None and checkpoint is not None:
+            store_path = checkpoint.store_path
+        if store_path and args.online:
+            store = breakpoint_store(store_path, resolver.server, "REST", "", "")
+        elif store_path:
+            store = breakpoint_store(store_path)
+        with stage("build_cache"):
+            builder = cache_builder(
+                bkps,
+                references.transcript_reference,
+                args.verbose,
+                store,
+                resolver,
+                args.vep_cpus,
+                args.vep_shard_size,
+            )
+    except ValueError:
+        print(timestamp() + "Input SV data appears to be empty. Annotation process will exit.")
+        print(traceback.format_exc())
+        sys.exit(1)
+    except Exception as e:
+        print(timestamp() + "Failed to build annotation cache using VEP.")
+        print(traceback.format_exc())
+        sys.exit(1)
+    return builder, store
+
+
+def annotate_chunks(
+    args,
+    sv_chunks,
+    builder,
+    output_format="tsv",
+    report_dir=None,
+    checkpoint=None,
+    changes=None,
+):
+    """
+    Annotate and write the SVs chunk by chunk, starting on the rows
+    whose breakpoints are in the annotation cache while VEP shards
+    are still running. With a checkpoint, every annotated chunk is
+    saved and the chunks of a resumed run are copied from it. With
+    reference changes, the chunks are of an earlier output and only
+    their SVs touched by the changes are annotated again.
+    Namespace, iterable, cache_builder, str, str, run_checkpoint,
+    reference_changes -> None
+    """
+    # Derived breakpoint state is only valid for this cache
+    memo = breakpoint_memo(args.memo_size) if args.memo_size > 0 else None
+    state = annotation_state(
+        references, builder.cache if builder is not None else None, memo, args.verbose
+    )
+    pool = None
+    if args.workers > 1 and not args.columnar:
+        pool = start_pool(
+            references,
+            args.workers,
+            report_dir,
+            args.profile_functions,
+            args.memo_size,
+            args.verbose,
+        )
+    print(timestamp() + "Starting variant annotation...")
+    n_annotated, n_chunks = 0, 0
+    with contextlib.closing(open_writer(args.out_file, output_format)) as out:
+        for i, sv_chunk in enumerate(timed(sv_chunks, "read_chunk")):
+            n_chunks += 1
+            sv_chunk.reset_index(drop=True, inplace=True)
+            if checkpoint is not None:
+                with stage("checkpoint"):
+                    digest = chunk_digest(sv_chunk)
+                    if checkpoint.is_done(i, digest):
+                        new = checkpoint.load(i)
+                        out.write(new)
+                        n_annotated += len(new.index)
+                        continue
+                annotated = []
+            if changes is None:
+                blocks = annotate_rows(args, sv_chunk, builder, state, pool)
+            else:
+                blocks = [
+                    reannotate_rows(args, sv_chunk, builder, state, pool, changes)
+                ]
+            for new in blocks:
+                with stage("write"):
+                    out.write(new)
+                if checkpoint is not None:
+                    annotated.append(new)
+                n_annotated += len(new.index)
+            if checkpoint is not None:
+                with stage("checkpoint"):
+                    checkpoint.save(i, digest, annotated)
+            if args.stream_chunksize:
+                print(timestamp() + "Annotated %d SVs." % n_annotated)
+    if checkpoint is not None:
+        checkpoint.finish(n_chunks)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    elif memo is not None:
+        report_memo(memo, "Breakpoint memo")
+    print(timestamp() + "Completed variant annotation!")
+
+
+def annotate_rows(args, sv_chunk, builder, state, pool=None):
+    """
+    Annotate a chunk of SVs block by block as the annotation cache
+    gets their breakpoints, and get each block with its annotations
+    Namespace, df, cache_builder, annotation_state, Pool -> iterator
+    """
+    for sv_all_data in ready_rows(sv_chunk, builder):
+        if builder.pending:
+            count("vep.pipelined_svs", len(sv_all_data.index))
+        with stage("prepare"):
+            svdata = prepare_svs(sv_all_data)
+        with stage("annotate"):
+            if args.columnar:
+                annotated_SVs = annotate_columns(svdata, state)
+            else:
+                annotated_SVs = annotate_SVs(svdata, state, pool, args.chunksize)
+
+        with stage("write"):
+            new = pd.concat(
+                [sv_all_data, pd.DataFrame(annotated_SVs, columns=RESULT_COLUMNS)],
+                axis=1,
+            )
+        count("svs", len(new.index))
+        yield new
+
+
+def reannotate_rows(args, sv_chunk, builder, state, pool, changes):
+    """
+    Annotate again the SVs of a chunk of an earlier output that are
+    touched by changed references, and keep the earlier annotations
+    of the others
+    Namespace, df, cache_builder, annotation_state, Pool,
+    reference_changes -> df
+    """
+    touched = changes.touches(sv_chunk)
+    count("reannotate.copied_svs", int((~touched).sum()))
+    if touched.any():
+        svdata = sv_chunk[touched].drop(RESULT_COLUMNS, axis=1).reset_index(drop=True)
+        new = pd.concat(list(annotate_rows(args, svdata, builder, state, pool)))
+        sv_chunk.loc[touched, RESULT_COLUMNS] = new[RESULT_COLUMNS].values
+    return sv_chunk
+
+
+def ready_rows(sv_chunk, builder):
+    """
+    Split a chunk of SVs into blocks of rows whose breakpoints are
+    all in the annotation cache, waiting for VEP shards as needed.
+    Shards follow the order in which breakpoints first appear, so
+    rows become ready roughly in order.
+    df, cache_builder -> iterator
+    """
+    if not builder.pending:
+        yield sv_chunk
+        return
+    need = np.maximum.accumulate(
+        np.maximum(
+            builder.shard_of(sv_chunk["Chr1"], sv_chunk["Pos1"]),
+            builder.shard_of(sv_chunk["Chr2"], sv_chunk["Pos2"]),
+        )
+    )
+    start = 0
+    while start < len(need):
+        end = need.searchsorted(builder.ready, side="right")
+        if end > start:
+            yield sv_chunk.iloc[start:end].reset_index(drop=True)
+            start = end
+            continue
+        try:
+            with stage("build_cache"):
+                builder.wait(need[start])
+        except Exception:
+            print(timestamp() + "Failed to build annotation cache using VEP.")
+            print(traceback.format_exc())
+            sys.exit(1)
+
+
+def report_memo(memo, name):
+    """
+    Print the hits and misses of the breakpoint memo of this process
+    and add them to its profile
+    breakpoint_memo, str -> None
+    """
+    memo.report()
+    hits, misses = sum(memo.hits.values()), sum(memo.misses.values())
+    print(
+        timestamp()
+        + "%s hit rate: %.1f%% (%d hits, %d misses, %d entries)."
+        % (name, 100 * memo.hit_rate(), hits, misses, len(memo))
+    )
+    sys.stdout.flush()
+
+
+def write_profile(path, main_profile, report_dir):
+    """
+    Merge the profile of this process with the profiles written by
+    the worker processes and write them as a JSON report
+    str, profiler, str -> None
+    """
+    reports = [main_profile.report()]
+    reports += profiling.collect_worker_reports(report_dir)
+    shutil.rmtree(report_dir, ignore_errors=True)
+    with open(path, "w") as f:
+        json.dump(profiling.merge_reports(reports), f, indent=2, sort_keys=True)
+    print(timestamp() + "Wrote profile to %s" % path)
+
+
+def read_svs(input_file, chunksize=None, usecols=None, na_values=None):
+    """
+    Read the iCallSV table from the input file, either whole or as
+    an iterator of chunks. Streaming reads the file twice, so each
+    chunked read starts from the beginning of the file. Given
+    na_values, only those values are read as missing instead of the
+    pandas defaults.
+    file, int, list, list -> iterable
+    """
+    if chunksize:
+        try:
+            input_file.seek(0)
+        except IOError:
+            raise InputNotSeekable(input_file.name)
+    svs = pd.read_csv(
+        input_file,
+        header="infer",
+        sep="\t",
+        dtype=str,
+        usecols=usecols,
+        chunksize=chunksize,
+        keep_default_na=na_values is None,
+        na_values=na_values,
+    )
+    return svs if chunksize else [svs]
+
+
+def get_unique_breakpoints(sv_chunks):
+    """
+    Collect the unique breakpoints of all SVs as VEP input records
+    iterable -> df
+    """
+    # Deduplicate each chunk and concatenate once at the end. The
+    # breakpoints of each SV are kept next to each other, so that VEP
+    # shards follow the order in which breakpoints first appear.
+    bkps = [pd.DataFrame(columns=["#CHROM", "POS"])]
+    for svdata in sv_chunks:
+        bkps.append(
+            pd.DataFrame(
+                {
+                    "#CHROM": np.column_stack(
+                        (svdata["Chr1"].values, svdata["Chr2"].values)
+                    ).ravel(),
+                    "POS": np.column_stack(
+                        (svdata["Pos1"].values, svdata["Pos2"].values)
+                    ).ravel(),
+                },
+                columns=["#CHROM", "POS"],
+            ).drop_duplicates()
+        )
+    bkps = pd.concat(bkps, ignore_index=True, axis=0).drop_duplicates()
+    bkps["ID"], bkps["REF"], bkps["ALT"] = ".,N,-".split(",")
+    return bkps[["#CHROM", "POS", "ID", "REF", "ALT"]]
+
+
+def prepare_svs(sv_all_data):
+    """
+    Select the annotation columns of an iCallSV table and
+    expand the SV types
+    df -> df
+    """
+    svdata = sv_all_data[SV_COLUMNS]
+    svdata["SV_Type"] = svdata["SV_Type"].apply(expand_svtype)
+    return svdata
+
+
+def annotate_frame(
+    svs,
+    reference_set=references,
+    cache=None,
+    engine="serial",
+    pool=None,
+    chunksize=500,
+    memo=None,
+    verbose=False,
+):
+    """
+    Annotate a frame with the columns of an iCallSV table in process
+    and get a copy of it with the Note, Annotation, Position and
+    oncokb_sv_type columns added, as written by a batch run. The
+    engine is "serial", "columnar" or "pool", which dispatches
+    blocks of SVs to a pool made with start_pool, or to a new pool
+    of one worker per processor but one. Without a cache, the
+    breakpoints of the frame are annotated with VEP first. Loaded
+    references, a cache covering several frames and a pool can be
+    reused across frames.
+    df, reference_set, vep_cache, str, Pool, int, breakpoint_memo,
+    bool -> df
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            "Unknown engine %s, expected one of %s." % (engine, ", ".join(ENGINES))
+        )
+    if cache is None:
+        cache = build_cache(
+            get_unique_breakpoints([svs]), reference_set.transcript_reference, verbose
+        )
+    state = annotation_state(reference_set, cache, memo, verbose)
+    svdata = prepare_svs(svs)
+    if engine == "columnar":
+        annotated = annotate_columns(svdata, state)
+    elif engine == "pool" and pool is None:
+        pool = start_pool(
+            reference_set, max(1, mp.cpu_count() - 1), verbose=verbose
+        )
+        try:
+            annotated = annotate_SVs(svdata, state, pool, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        annotated = annotate_SVs(
+            svdata, state, pool if engine == "pool" else None, chunksize
+        )
+    return pd.concat(
+        [svs, pd.DataFrame(annotated, columns=RESULT_COLUMNS, index=svs.index)],
+        axis=1,
+    )
+
+
+def annotate_SVs(svdata, state, pool=None, chunksize=500):
+    """
+    Annotate a frame of SVs by dispatching chunks of sv records
+    to a pool of workers, or in process without a pool
+    df, annotation_state, Pool, int -> list
+    """
+    if state.cache is None:
+        raise ValueError("Batch annotation requires a VEP annotation cache.")
+    records = sv_records(svdata)
+
+    if pool is None:
+        return map(state.annotate_record, records)
+    # Each block is sent with the cache entries of its breakpoints
+    chunksize = max(1, chunksize)
+    blocks = []
+    for i in range(0, len(records), chunksize):
+        block = records[i : i + chunksize]
+        chroms = [r.chr1 for r in block] + [r.chr2 for r in block]
+        positions = [r.pos1 for r in block] + [r.pos2 for r in block]
+        blocks.append((state.cache.segment(chroms, positions), block))
+    return [result for block in pool.imap(annotate_block, blocks) for result in block]
+
+
+def annotate_columns(svdata, state):
+    """
+    Annotate a frame of SVs in process with the columnar engine
+    df, annotation_state -> list
+    """
+    references = state.references
+    return annotate_columnar(
+        svdata,
+        references.gene_transcripts,
+        references.gene_classes,
+        references.oncokb,
+        state.cache,
+        references.transcript_exons,
+        references.kinase_domains,
+        state.memo,
+        references.cytobands,
+    )
+
+
+def sv_records(svdata):
+    """
+    Get the SVs of a frame as sv records. Breakpoints and genes are
+    kept as read, so that missing values fail the SV; the other
+    fields are converted to strings.
+    df -> list
+    """
+    columns = [
+        svdata[column].tolist()
+        if column in BKP_COLUMNS or column in GENE_COLUMNS
+        else svdata[column].astype(str).tolist()
+        for column in RECORD_COLUMNS
+    ]
+    return map(sv_record._make, zip(*columns))
+
+
+def annotate_block(block):
+    """
+    Annotate a block of sv records in a worker with the cache
+    entries sent along
+    tuple -> list
+    """
+    segment, records = block
+    state = annotation_state(
+        worker_state.references, segment, worker_state.memo, worker_state.verbose
+    )
+    return map(state.annotate_record, records)
+
+
+def start_pool(
+    reference_set, workers, report_dir=None, dump_dir=None, memo_size=0, verbose=False
+):
+    """
+    Start a pool of worker processes annotating with the given
+    references. Workers get the cache entries of every block they
+    annotate, so one pool serves any number of caches.
+    reference_set, int, str, str, int, bool -> Pool
+    """
+    return mp.Pool(
+        processes=workers,
+        initializer=init_worker,
+        initargs=(
+            reference_set.load(),
+            report_dir,
+            dump_dir,
+            memo_size,
+            verbose,
+        ),
+    )
+
+
+def init_worker(reference_set, report_dir=None, dump_dir=None, memo_size=0, verbose=False):
+    """
+    Install the loaded reference indexes once per worker process
+    instead of relying on fork to inherit module globals. The VEP
+    annotation cache is not installed: the entries of its breakpoints
+    come with every block. A bundle-backed reference set is sent as
+    its path and mapped by each worker. Each worker fills its own
+    breakpoint memo and prints its hit rate on exit. With a report
+    directory the worker is profiled and writes its report there on
+    exit.
+    reference_set, str, str, int, bool -> None
+    """
+    global worker_state
+    memo = breakpoint_memo(memo_size) if memo_size > 0 else None
+    worker_state = annotation_state(reference_set, None, memo, verbose)
+    if memo is not None:
+        # Runs before the profile report is written
+        Finalize(
+            None,
+            report_memo,
+            args=(memo, "Worker %d breakpoint memo" % os.getpid()),
+            exitpriority=11,
+        )
+    if report_dir:
+        profiling.enable("worker", dump_dir)
+        Finalize(None, profiling.write_worker_report, args=(report_dir,), exitpriority=10)
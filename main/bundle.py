@@ -0,0 +1,386 @@
+#!/usr/bin/env python2
+import os
+import json
+import mmap
+import struct
+import hashlib
+import logging
+import numpy as np
+from datetime import datetime
+from constants import (
+    ideogram_9606_GCF_000001305_13_850_V1,
+    impact_468_kinase_domain_annotation,
+    IMPACT_TumourSuppressors,
+    IMPACT_Hotspots,
+    OncoKb_known_fusions,
+)
+from reference import (
+    DATA_DIR,
+    TRANSCRIPT_REFERENCE,
+    REFFLAT_SUMMARY,
+    read_table,
+    transcript_index,
+    gene_class_registry,
+    transcript_record,
+    exon_record,
+)
+
+logger = logging.getLogger("basic_logger")
+
+# A bundle is the magic string, the format version and the length of a
+# JSON header, followed by the header and by the arrays it describes,
+# each aligned to ALIGNMENT bytes so they can be mapped in place
+MAGIC = "SVANNREF"
+FORMAT_VERSION = 2
+PREAMBLE = struct.Struct("<8sII")
+ALIGNMENT = 64
+SOURCES = (TRANSCRIPT_REFERENCE, REFFLAT_SUMMARY)
+# Reference constants compiled into a bundle along with the tables
+CONSTANTS = (
+    ("ideogram_9606_GCF_000001305_13_850_V1", ideogram_9606_GCF_000001305_13_850_V1),
+    ("impact_468_kinase_domain_annotation", impact_468_kinase_domain_annotation),
+    ("IMPACT_TumourSuppressors", IMPACT_TumourSuppressors),
+    ("IMPACT_Hotspots", IMPACT_Hotspots),
+    ("OncoKb_known_fusions", OncoKb_known_fusions),
+)
+
+
+class InvalidReferenceBundle(Exception):
+    """Raised when a reference bundle cannot be read"""
+
+    def __init__(self, path, reason):
+        Exception.__init__(
+            self, "Invalid reference bundle %s: %s" % (path, reason)
+        )
+
+
+def strings(values):
+    """
+    Convert strings to a fixed width byte string array
+    iterable -> array
+    """
+    values = [str(v) for v in values]
+    return np.array(values, dtype="S%d" % max([1] + map(len, values)))
+
+
+def source_digests(data_dir=DATA_DIR):
+    """
+    Get the sha256 digests of the reference tables and constants a
+    bundle is compiled from
+    str -> dict
+    """
+    digests = {}
+    for name in SOURCES:
+        with open(os.path.join(data_dir, name), "rb") as f:
+            digests[name] = hashlib.sha256(f.read()).hexdigest()
+    # Constants are hashed by value, whether constants.py or only its
+    # compiled module is deployed
+    digests["constants"] = hashlib.sha256(
+        json.dumps(CONSTANTS, sort_keys=True)
+    ).hexdigest()
+    return digests
+
+
+def content_hash(arrays):
+    """
+    Hash the names, types, shapes and data of bundle arrays
+    dict -> str
+    """
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update("%s %s %s\n" % (name, array.dtype.str, array.shape))
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+def compile_arrays(data_dir=DATA_DIR, fusions=OncoKb_known_fusions):
+    """
+    Compile the reference tables and constants, with a list of known
+    fusions, into sorted arrays for the mapped indexes
+    str, iterable -> dict
+    """
+    arrays = {}
+
+    # Transcript rows grouped by gene, keeping their order in the table
+    reference = read_table(os.path.join(data_dir, TRANSCRIPT_REFERENCE))
+    genes = strings(reference["Gene"])
+    order = np.argsort(genes, kind="mergesort")
+    arrays["transcripts.gene"] = genes[order]
+    arrays["transcripts.lookup"] = strings(reference["Lookup_Transcript"])[order]
+    arrays["transcripts.reported"] = strings(reference["Reported_Transcript"])[order]
+    arrays["transcripts.panel"] = (
+        np.array([int(x) for x in reference["IsPanel"]], dtype=np.int64)[order] == 1
+    )
+
+    # Exon summaries sorted by (gene, transcript), later rows win
+    summary = read_table(os.path.join(data_dir, REFFLAT_SUMMARY))
+    rows = {}
+    for gene, transcript, strand, last, pos1, pos2 in zip(
+        summary["Gene"],
+        summary["Transcript"],
+        summary["Strand"],
+        summary["last_exon"],
+        summary["pos1"],
+        summary["pos2"],
+    ):
+        rows[(gene, transcript)] = (strand, int(last), int(pos1), int(pos2))
+    keys = sorted(rows)
+    arrays["exons.gene"] = strings(k[0] for k in keys)
+    arrays["exons.transcript"] = strings(k[1] for k in keys)
+    arrays["exons.strand"] = strings(rows[k][0] for k in keys)
+    for i, column in enumerate(["last_exon", "pos1", "pos2"], 1):
+        arrays["exons." + column] = np.array(
+            [rows[k][i] for k in keys], dtype=np.int64
+        )
+
+    # Gene class flags
+    registry = gene_class_registry(
+        transcript_index(reference),
+        IMPACT_TumourSuppressors,
+        IMPACT_Hotspots,
+        impact_468_kinase_domain_annotation["HUGO"],
+        fusions,
+    )
+    genes = sorted(registry.flags)
+    arrays["classes.gene"] = strings(genes)
+    arrays["classes.flags"] = np.array(
+        [registry.flags[g] for g in genes], dtype=np.uint8
+    )
+
+    # Known fusions, so that a bundle keeps those of its release
+    arrays["fusions.name"] = strings(sorted(fusions))
+
+    # Small tables kept in their original row order
+    for prefix, table in (
+        ("cytobands.", ideogram_9606_GCF_000001305_13_850_V1),
+        ("kinases.", impact_468_kinase_domain_annotation),
+    ):
+        for column, values in table.items():
+            if all(isinstance(v, (int, long)) for v in values):
+                arrays[prefix + column] = np.array(values, dtype=np.int64)
+            else:
+                arrays[prefix + column] = strings(values)
+    return arrays
+
+
+def write_bundle(path, arrays, meta):
+    """
+    Write arrays and metadata to a bundle file, replacing any
+    existing bundle atomically. Returns the content hash.
+    str, dict, dict -> str
+    """
+    meta = dict(meta, hash=content_hash(arrays), arrays={})
+    offset = 0
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        meta["arrays"][name] = [array.dtype.str, list(array.shape), offset]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps(meta, sort_keys=True)
+    start = PREAMBLE.size + len(header)
+    start += -start % ALIGNMENT
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name in sorted(arrays):
+            f.seek(start + meta["arrays"][name][2])
+            f.write(np.ascontiguousarray(arrays[name]).data)
+        f.truncate(start + offset)
+    os.rename(tmp, path)
+    return meta["hash"]
+
+
+def compile_references(path, data_dir=DATA_DIR):
+    """
+    Compile the reference tables of data_dir and the reference
+    constants into a bundle at path. Returns the content hash.
+    str, str -> str
+    """
+    meta = {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sources": source_digests(data_dir),
+    }
+    return write_bundle(path, compile_arrays(data_dir), meta)
+
+
+class reference_bundle(object):
+    """
+    Read-only memory map of a compiled reference bundle. Arrays are
+    views of the mapped file, so every process mapping the same
+    bundle shares one physical copy through the page cache.
+    """
+
+    def __init__(self, path, verify=False):
+        self.path = path
+        with open(path, "rb") as f:
+            preamble = f.read(PREAMBLE.size)
+            if len(preamble) < PREAMBLE.size:
+                raise InvalidReferenceBundle(path, "truncated file")
+            magic, version, header_size = PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise InvalidReferenceBundle(path, "not a reference bundle")
+            if version != FORMAT_VERSION:
+                raise InvalidReferenceBundle(
+                    path, "format version %d, expected %d" % (version, FORMAT_VERSION)
+                )
+            self.meta = json.loads(f.read(header_size))
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = PREAMBLE.size + header_size
+        start += -start % ALIGNMENT
+        self.arrays = {}
+        for name, (dtype, shape, offset) in self.meta["arrays"].items():
+            dtype = np.dtype(str(dtype))
+            count = int(np.prod(shape))
+            if start + offset + count * dtype.itemsize > len(self.map):
+                raise InvalidReferenceBundle(path, "truncated array " + name)
+            self.arrays[str(name)] = np.frombuffer(
+                self.map, dtype=dtype, count=count, offset=start + offset
+            ).reshape(shape)
+        self.hash = str(self.meta["hash"])
+        if verify and content_hash(self.arrays) != self.hash:
+            raise InvalidReferenceBundle(path, "content hash mismatch")
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def table(self, prefix):
+        """
+        Get the columns of a bundled table as lists
+        str -> dict
+        """
+        return dict(
+            (name[len(prefix) :], array.tolist())
+            for name, array in self.arrays.items()
+            if name.startswith(prefix)
+        )
+
+    def is_stale(self, data_dir=DATA_DIR):
+        """
+        Check whether the reference tables or constants changed since
+        the bundle was compiled
+        str -> bool
+        """
+        return self.meta["sources"] != source_digests(data_dir)
+
+
+def find_range(keys, key, lo=0, hi=None):
+    """
+    Get the row range of a key in a sorted array
+    array, str, int, int -> (int, int)
+    """
+    keys = keys[lo:hi]
+    return (
+        lo + int(keys.searchsorted(key, side="left")),
+        lo + int(keys.searchsorted(key, side="right")),
+    )
+
+
+class mapped_transcript_index(object):
+    """
+    transcript_index over the gene-sorted transcript arrays of a
+    reference bundle. Records are assembled on lookup.
+    """
+
+    def __init__(self, bundle):
+        self.genes = bundle["transcripts.gene"]
+        self.lookup = bundle["transcripts.lookup"]
+        self.reported = bundle["transcripts.reported"]
+        self.panel = bundle["transcripts.panel"]
+
+    @property
+    def lookup_transcripts(self):
+        return frozenset(self.lookup.tolist())
+
+    def __contains__(self, gene):
+        return self.get(gene) is not None
+
+    def get(self, gene):
+        """
+        Get the transcript record of a gene
+        str -> (transcript_record or None)
+        """
+        if not isinstance(gene, str):
+            return None
+        lo, hi = find_range(self.genes, gene)
+        if lo == hi:
+            return None
+        lookup = self.lookup[lo:hi].tolist()
+        return transcript_record(
+            gene,
+            tuple(lookup),
+            dict(zip(lookup, self.reported[lo:hi].tolist())),
+            bool(self.panel[lo]),
+        )
+
+
+class mapped_exon_index(object):
+    """
+    exon_index over the (gene, transcript) sorted exon arrays of a
+    reference bundle
+    """
+
+    def __init__(self, bundle):
+        self.genes = bundle["exons.gene"]
+        self.transcripts = bundle["exons.transcript"]
+        self.strands = bundle["exons.strand"]
+        self.last_exons = bundle["exons.last_exon"]
+        self.pos1 = bundle["exons.pos1"]
+        self.pos2 = bundle["exons.pos2"]
+
+    def get(self, gene, transcript):
+        """
+        Get the exon summary of a gene transcript
+        str, str -> (exon_record or None)
+        """
+        if not isinstance(transcript, str) or not isinstance(gene, str):
+            return None
+        lo, hi = find_range(self.genes, gene)
+        lo, hi = find_range(self.transcripts, transcript, lo, hi)
+        if lo == hi:
+            return None
+        return exon_record(
+            str(self.strands[lo]),
+            int(self.last_exons[lo]),
+            int(self.pos1[lo]),
+            int(self.pos2[lo]),
+        )
+
+
+class mapped_gene_class_registry(object):
+    """
+    gene_class_registry over the sorted gene flag arrays of a
+    reference bundle
+    """
+
+    def __init__(self, bundle):
+        self.genes = bundle["classes.gene"]
+        self.gene_flags = bundle["classes.flags"]
+
+    def __iter__(self):
+        return iter(self.genes.tolist())
+
+    def get(self, gene):
+        """
+        Get the class flags of a gene
+        str -> int
+        """
+        if not isinstance(gene, str):
+            return 0
+        lo, hi = find_range(self.genes, gene)
+        return int(self.gene_flags[lo]) if lo < hi else 0
+
+    def classify_genes(self, genes):
+        """
+        Get the class flags of an array of genes
+        array -> array
+        """
+        genes = [g if isinstance(g, str) else "" for g in genes]
+        flags = np.zeros(len(genes), dtype=np.int64)
+        if not genes or not len(self.genes):
+            return flags
+        keys = strings(genes)
+        i = np.minimum(self.genes.searchsorted(keys), len(self.genes) - 1)
+        found = self.genes[i] == keys
+        flags[found] = self.gene_flags[i[found]]
+        return flags
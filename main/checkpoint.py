@@ -0,0 +1,193 @@
+#!/usr/bin/env python2
+import os
+import json
+import hashlib
+import pandas as pd
+from config import VEP, VEP_VERSION, VEP_CACHE, FASTA
+from profiling import count
+
+# Version of the manifest and chunk file layout
+CHECKPOINT_VERSION = 1
+MANIFEST = "manifest.json"
+# Persistent store of the VEP annotations of a checkpointed run
+STORE = "vep_cache.db"
+
+
+def reference_digests(references):
+    """
+    Identify the reference tables and constants of a reference set
+    reference_set -> dict
+    """
+    if references.bundle_path:
+        return {"bundle": references.bundle.hash}
+    from bundle import source_digests
+
+    return source_digests(references.data_dir)
+
+
+def run_signature(references, online=False, previous=None):
+    """
+    Describe what the annotations of a run depend on besides its
+    input: the reference tables and constants, VEP or the REST API
+    used to annotate breakpoints and, when annotating an earlier
+    output again, the references it was annotated with
+    reference_set, bool, reference_set -> dict
+    """
+    signature = {
+        "references": reference_digests(references),
+        "annotation": "REST" if online else [VEP, VEP_VERSION, VEP_CACHE, FASTA],
+    }
+    if previous is not None:
+        signature["previous_references"] = reference_digests(previous)
+    return signature
+
+
+def chunk_digest(chunk):
+    """
+    Hash the content of a chunk of input rows
+    df -> str
+    """
+    return hashlib.sha1(chunk.to_csv(None, sep="\t", index=False)).hexdigest()
+
+
+def split_chunks(svs, chunksize):
+    """
+    Split a table into chunks of at most chunksize rows
+    df, int -> list
+    """
+    return [
+        svs.iloc[i : i + chunksize].reset_index(drop=True)
+        for i in range(0, max(1, len(svs.index)), chunksize)
+    ]
+
+
+class run_checkpoint(object):
+    """
+    Checkpoint directory of a batch run: the annotated rows of every
+    completed input chunk, each in its own TSV file, and a manifest
+    listing the chunks with the hash of their input rows and what
+    the annotations depend on. Files are written under a temporary
+    name and renamed, so an interrupted run leaves only complete
+    chunks in the manifest. Resuming reuses the chunks whose input
+    hash is unchanged; any other chunk is annotated again.
+    """
+
+    def __init__(self, directory, signature, resume=False):
+        self.directory = directory
+        self.signature = signature
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.chunks = {}
+        self.reused = 0
+        # An earlier run of other references or VEP is not reused
+        self.stale = False
+        manifest = self.read_manifest() if resume else None
+        if manifest is not None and (
+            manifest.get("version") != CHECKPOINT_VERSION
+            or manifest.get("signature") != signature
+        ):
+            self.stale = True
+        elif manifest is not None:
+            self.chunks = dict(
+                (int(i), chunk)
+                for i, chunk in manifest["chunks"].items()
+                if os.path.isfile(self.path(chunk["results"]))
+            )
+        self.write_manifest(False)
+
+    @property
+    def store_path(self):
+        return self.path(STORE)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read_manifest(self):
+        """
+        Read the manifest of an earlier run, if any
+        None -> dict
+        """
+        try:
+            with open(self.path(MANIFEST)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def write_manifest(self, complete):
+        """
+        Replace the manifest with the chunks completed so far
+        bool -> None
+        """
+        manifest = {
+            "version": CHECKPOINT_VERSION,
+            "signature": self.signature,
+            "complete": complete,
+            "chunks": dict((str(i), chunk) for i, chunk in self.chunks.items()),
+        }
+        tmp = self.path(MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path(MANIFEST))
+
+    def is_done(self, i, digest):
+        """
+        Check whether input chunk i, with the given input hash, was
+        annotated by an earlier run
+        int, str -> bool
+        """
+        chunk = self.chunks.get(i)
+        return chunk is not None and chunk["input_sha1"] == digest
+
+    def pending(self, sv_chunks):
+        """
+        Get the input chunks that are not annotated yet
+        iterable -> iterator
+        """
+        for i, sv_chunk in enumerate(sv_chunks):
+            if not self.is_done(i, chunk_digest(sv_chunk)):
+                yield sv_chunk
+
+    def load(self, i):
+        """
+        Read the annotated rows of a completed chunk as written
+        int -> df
+        """
+        self.reused += 1
+        count("checkpoint.reused_chunks")
+        return pd.read_csv(
+            self.path(self.chunks[i]["results"]),
+            sep="\t",
+            dtype=str,
+            keep_default_na=False,
+            na_values=[""],
+        )
+
+    def save(self, i, digest, annotated):
+        """
+        Write the annotated rows of input chunk i and add the chunk to
+        the manifest
+        int, str, list -> None
+        """
+        name = "chunk_%06d.tsv" % i
+        tmp = self.path(name + ".tmp")
+        with open(tmp, "w") as f:
+            for j, frame in enumerate(annotated):
+                f.write(frame.to_csv(None, header=j == 0, sep="\t", index=False))
+        os.rename(tmp, self.path(name))
+        self.chunks[i] = {
+            "input_sha1": digest,
+            "rows": sum(len(frame.index) for frame in annotated),
+            "results": name,
+        }
+        count("checkpoint.saved_chunks")
+        self.write_manifest(False)
+
+    def finish(self, n_chunks):
+        """
+        Drop chunks beyond the end of the input and mark the run as
+        complete
+        int -> None
+        """
+        for i in [i for i in self.chunks if i >= n_chunks]:
+            os.remove(self.path(self.chunks.pop(i)["results"]))
+        self.write_manifest(True)
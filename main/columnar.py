@@ -0,0 +1,342 @@
+#!/usr/bin/env python2
+import logging
+import numpy as np
+import pandas as pd
+from models import bkp, sv, has_missing_fields, NO_HGVSC
+from annotation import get_variant_annotation
+from notes import get_notes
+from reference import TUMOUR_SUPPRESSOR, HOTSPOT, KINASE
+from profiling import stage, count
+
+logger = logging.getLogger("basic_logger")
+
+# Input columns of the columnar engine. SV_Type is expected in the
+# long form (TRANSLOCATION, DELETION, ...) used by the sv class.
+SV_COLUMNS = [
+    "SV_Type",
+    "Chr1",
+    "Pos1",
+    "Chr2",
+    "Pos2",
+    "Gene1",
+    "Gene2",
+    "Site1Description",
+    "Site2Description",
+    "Fusion",
+]
+# Columns whose missing values fail an SV, as in the sv constructor
+REQUIRED_COLUMNS = ["Chr1", "Pos1", "Chr2", "Pos2", "Gene1", "Gene2"]
+
+# Breakpoint features computed by expand_breakpoints
+BKP_FEATURES = [
+    "transcript",
+    "cdna",
+    "strand",
+    "isCoding",
+    "isPanel",
+    "isTumourSuppressor",
+    "isHotspot",
+    "isKinase",
+]
+
+
+def startswith(values, prefixes):
+    """
+    Element-wise str.startswith over an object array
+    array, tuple -> array
+    """
+    return np.array([str(v).startswith(prefixes) for v in values], dtype=bool)
+
+
+def expand_breakpoints(
+    chroms, positions, genes, descs, transcript_index, gene_classes, cache
+):
+    """
+    Column-wise equivalent of bkp.expand for arrays of breakpoints.
+    Breakpoints that bkp.expand would reject are flagged in the
+    'valid' column.
+    array, array, array, array, transcript_index,
+    gene_class_registry, vep_cache -> DataFrame
+    """
+    n = len(chroms)
+    chroms = np.asarray(chroms, dtype=object)
+    genes = np.asarray(genes, dtype=object)
+    descs = np.asarray(descs, dtype=object)
+    pos = pd.to_numeric(pd.Series(positions), errors="coerce").values
+    valid = ~np.isnan(pos)
+    pos = np.where(valid, pos, 0).astype(np.int64)
+
+    # Resolve the first coding cDNA across the lookup transcripts of
+    # each gene, one transcript rank at a time
+    records = [transcript_index.get(gene) for gene in genes]
+    lookups = [r.lookup_transcripts if r is not None else () for r in records]
+    n_tx = np.array([len(x) for x in lookups], dtype=np.int64)
+    cdna = np.array(
+        ["chr" + c + ":g." + str(p) for c, p in zip(chroms, pos)], dtype=object
+    )
+    transcript = np.empty(n, dtype=object)
+    resolved = np.zeros(n, dtype=bool)
+    # Lookups that bkp.expand gives up on, keeping the lookup
+    # transcripts and the genomic position
+    failed = np.zeros(n, dtype=bool)
+    for rank in range(n_tx.max() if n else 0):
+        active = np.flatnonzero(~resolved & (n_tx > rank) & valid)
+        tx = np.array([lookups[i][rank] for i in active], dtype=object)
+        transcript[active] = tx
+        hgvsc = cache.get_many(chroms[active], pos[active], tx)
+        found = hgvsc != None  # noqa: E711
+        count("vep_cache.hits", int(found.sum()))
+        count("vep_cache.misses", int(len(found) - found.sum()))
+        empty = found & (hgvsc == NO_HGVSC)
+        hit = found & ~empty & ~startswith(hgvsc, ("c.-", "c.*"))
+        cdna[active[hit]] = hgvsc[hit]
+        failed[active[empty]] = True
+        resolved[active[hit | empty]] = True
+    # Rows with an invalid position are rejected and never looked up
+    has_record = np.array([r is not None for r in records], dtype=bool) & valid
+    failed |= has_record & (n_tx == 0)
+    for i in np.flatnonzero(has_record):
+        if failed[i]:
+            transcript[i] = list(lookups[i])
+        else:
+            transcript[i] = records[i].reported_transcripts[transcript[i]]
+
+    plus = np.array(["(+)" in d for d in descs], dtype=bool)
+    minus = np.array(["(-)" in d for d in descs], dtype=bool)
+    strand = np.where(plus, "+", np.where(minus, "-", None)).astype(object)
+    valid &= plus | minus
+
+    is_coding = startswith(cdna, ("c.",))
+    is_panel = np.array([r is not None and r.isPanel for r in records], dtype=bool)
+    flags = gene_classes.classify_genes(genes)
+    is_tsg = (flags & TUMOUR_SUPPRESSOR > 0) & is_panel & is_coding
+    return pd.DataFrame(
+        {
+            "chrom": chroms,
+            "pos": pos,
+            "gene": genes,
+            "desc": descs,
+            "transcript": transcript,
+            "cdna": cdna,
+            "strand": strand,
+            "isCoding": is_coding,
+            "isPanel": is_panel,
+            "isTumourSuppressor": is_tsg,
+            "isHotspot": (flags & HOTSPOT > 0) & is_coding,
+            "isKinase": (flags & KINASE > 0) & is_coding,
+            "valid": valid,
+        }
+    )
+
+
+def expand_svs(svdata, transcript_index, gene_classes, oncoKb, cache):
+    """
+    Column-wise equivalent of sv.expand. Returns breakpoint features
+    for both breakpoints and the sv features of every row, with rows
+    that sv.expand would reject flagged in the 'valid' column.
+    df, transcript_index, gene_class_registry, dict, vep_cache
+    -> (DataFrame, DataFrame, DataFrame)
+    """
+    fields = zip(*[svdata[column].values for column in REQUIRED_COLUMNS])
+    complete = ~np.array([has_missing_fields(*f) for f in fields], dtype=bool)
+    svdata = svdata[SV_COLUMNS].astype(str)
+    n = len(svdata.index)
+    b1 = expand_breakpoints(
+        svdata["Chr1"].values,
+        svdata["Pos1"].values,
+        svdata["Gene1"].values,
+        svdata["Site1Description"].values,
+        transcript_index,
+        gene_classes,
+        cache,
+    )
+    b2 = expand_breakpoints(
+        svdata["Chr2"].values,
+        svdata["Pos2"].values,
+        svdata["Gene2"].values,
+        svdata["Site2Description"].values,
+        transcript_index,
+        gene_classes,
+        cache,
+    )
+    c1, c2 = b1["isCoding"].values, b2["isCoding"].values
+    p1, p2 = b1["isPanel"].values, b2["isPanel"].values
+    description = svdata["Fusion"].values
+    svtype = svdata["SV_Type"].values
+
+    # Same checks as the sv constructor and sv.expand
+    valid = b1["valid"].values & b2["valid"].values & complete
+    valid &= p1 | p2
+    valid &= (p1 & c1) | (p2 & c2)
+
+    is_intragenic = (
+        (b1["gene"].values == b2["gene"].values)
+        & (b1["transcript"].values == b2["transcript"].values)
+        & c1
+        & c2
+    )
+
+    is_fusion = startswith(description, ("Protein Fusion", "Transcript Fusion"))
+    is_fusion &= c1 & c2
+    fusion_gene = np.empty(n, dtype=object)
+    fusion_gene[is_fusion] = [
+        s[s.find("{") + 1 : s.find("}")] for s in description[is_fusion]
+    ]
+    partners = [
+        g.split(":") if f else None for g, f in zip(fusion_gene, is_fusion)
+    ]
+    well_formed = np.array([p is None or len(p) == 2 for p in partners], dtype=bool)
+    valid &= well_formed
+    partner1 = np.array(
+        [p[0] if p is not None and len(p) == 2 else None for p in partners],
+        dtype=object,
+    )
+    partner2 = np.array(
+        [p[1] if p is not None and len(p) == 2 else None for p in partners],
+        dtype=object,
+    )
+    gene1, gene2 = b1["gene"].values, b2["gene"].values
+    in_order = (partner1 == gene1) & (partner2 == gene2)
+    reversed_order = ~in_order & (partner2 == gene1) & (partner1 == gene2)
+    valid &= ~is_fusion | in_order | reversed_order
+    is_known = np.array(
+        [f and g in oncoKb for f, g in zip(is_fusion, fusion_gene)], dtype=bool
+    )
+    # sv.expand fails to log a missing coding annotation when both
+    # breakpoints are coding but the description is not a fusion
+    valid &= ~(
+        ~is_fusion
+        & np.array(["Fusion:" in d for d in description], dtype=bool)
+        & c1
+        & c2
+    )
+
+    chr1, chr2 = b1["chrom"].values, b2["chrom"].values
+    swap_chroms = np.array(
+        [
+            (a.isdigit() and b.isdigit() and int(a) > int(b)) or a in ("X", "Y")
+            for a, b in zip(chr1, chr2)
+        ],
+        dtype=bool,
+    )
+    swap = ((svtype == "TRANSLOCATION") & swap_chroms) | (
+        is_intragenic & (b1["strand"].values == "-")
+    )
+    # 0: bkp1 first, 1: bkp2 first, 2: fusion partner order
+    partner_order = np.where(swap, 1, np.where(is_fusion, 2, 0))
+
+    features = pd.DataFrame(
+        {
+            "svtype": svtype,
+            "description": description,
+            "isIntragenic": is_intragenic,
+            "isFusion": is_fusion,
+            "fusionGene": fusion_gene,
+            "isKnownFusion": is_known,
+            "fusionReversed": reversed_order,
+            "partnerOrder": partner_order,
+            "valid": valid,
+        }
+    )
+    return b1, b2, features
+
+
+def make_bkp(features):
+    """
+    Create a bkp object from precomputed breakpoint features
+    dict -> bkp
+    """
+    breakpoint = bkp(
+        features["chrom"], features["pos"], features["gene"], features["desc"]
+    )
+    for attr in BKP_FEATURES:
+        setattr(breakpoint, attr, features[attr])
+    for attr in BKP_FEATURES[3:]:
+        setattr(breakpoint, attr, bool(features[attr]))
+    return breakpoint
+
+
+def make_sv(features, bkp1, bkp2):
+    """
+    Create an expanded sv object from precomputed sv features
+    and breakpoints
+    dict, bkp, bkp -> sv
+    """
+    variant = sv.__new__(sv)
+    variant.svtype = features["svtype"]
+    variant.description = features["description"]
+    variant.site1, variant.site2 = bkp1.desc, bkp2.desc
+    variant.chr1, variant.pos1 = bkp1.chrom, str(bkp1.pos)
+    variant.chr2, variant.pos2 = bkp2.chrom, str(bkp2.pos)
+    variant.gene1, variant.gene2 = bkp1.gene, bkp2.gene
+    variant.bkp1, variant.bkp2 = bkp1, bkp2
+    variant.isIntragenic = bool(features["isIntragenic"])
+    variant.isFusion = bool(features["isFusion"])
+    variant.fusionGene = features["fusionGene"]
+    variant.isKnownFusion = bool(features["isKnownFusion"])
+    if variant.isFusion:
+        if features["fusionReversed"]:
+            variant.fusionPartner1, variant.fusionPartner2 = bkp2, bkp1
+        else:
+            variant.fusionPartner1, variant.fusionPartner2 = bkp1, bkp2
+    order = features["partnerOrder"]
+    if order == 1:
+        variant.annotationPartner1, variant.annotationPartner2 = bkp2, bkp1
+    elif order == 2:
+        variant.annotationPartner1, variant.annotationPartner2 = (
+            variant.fusionPartner1,
+            variant.fusionPartner2,
+        )
+    else:
+        variant.annotationPartner1, variant.annotationPartner2 = bkp1, bkp2
+    return variant
+
+
+def annotate_columnar(
+    svdata,
+    transcript_index,
+    gene_classes,
+    oncoKb,
+    cache,
+    exon_index,
+    kinase_domains,
+    memo=None,
+    cytobands=None,
+):
+    """
+    Annotate a frame of SVs by computing breakpoint and sv features
+    column-wise and only rendering the notes row by row. Returns the
+    same (note, annotation, position, oncokb_sv_type) tuples as
+    annotate_sv_record, in input order.
+    df, transcript_index, gene_class_registry, dict, vep_cache,
+    exon_index, kinase_domain_index, breakpoint_memo, cytoband_index
+    -> list
+    """
+    if cache is None:
+        raise ValueError("The columnar engine requires a VEP annotation cache.")
+    with stage("columnar.expand"):
+        b1, b2, features = expand_svs(
+            svdata, transcript_index, gene_classes, oncoKb, cache
+        )
+    results = []
+    for f, r1, r2 in zip(
+        features.to_dict("records"), b1.to_dict("records"), b2.to_dict("records")
+    ):
+        note, annotation, position, oncokb_sv_type = [None] * 4
+        if not f["valid"]:
+            count("columnar.rejected")
+        else:
+            try:
+                variant = make_sv(f, make_bkp(r1), make_bkp(r2))
+                with stage("annotation"):
+                    annotation = get_variant_annotation(variant, cytobands)
+                with stage("notes"):
+                    annotation, note, position, oncokb_sv_type = get_notes(
+                        variant, exon_index, kinase_domains, memo
+                    )
+            except Exception as e:
+                # Like annotate_sv_record, keep the annotation when the notes fail
+                count("exceptions." + type(e).__name__)
+                logger.warning(e)
+        results.append((note, annotation, position, oncokb_sv_type))
+    return results
@@ -1,7 +1,26 @@
 import os
 import sys
 
+VEP_VERSION = "86"
 VEP = "/dmp/resources/prod/tools/bio/vep/VERSIONS/variant_effect_predictor_v86/variant_effect_predictor.pl"
 VEP_CACHE = "/dmp/resources/prod/tools/bio/vep/VERSIONS/variant_effect_predictor_v86"
 PERL = "/dmp/resources/prod/tools/system/perl/bin/perl"
 FASTA = "/dmp/resources/prod/tools/bio/vep/VERSIONS/variant_effect_predictor_v86/homo_sapiens_merged/86_GRCh37/Homo_sapiens.GRCh37.75.dna.primary_assembly.fa"
+
+# VEP runs use up to VEP_CPUS processors in total, over shards of
+# VEP_SHARD_SIZE breakpoints
+VEP_CPUS = 12
+VEP_SHARD_SIZE = 10000
+VEP_BUFFER_SIZE = 10000
+
+# Formats of the annotated output file
+OUTPUT_FORMATS = ("tsv", "gzip", "bgzip", "parquet", "feather")
+
+# Rows per checkpointed chunk when the input is not streamed
+CHECKPOINT_CHUNKSIZE = 10000
+
+# Ensembl REST API used for online annotation
+REST_SERVER = "http://grch37.rest.ensembl.org"
+REST_BATCH_SIZE = 200
+REST_WORKERS = 4
+REST_RATE_LIMIT = 15
@@ -1,8 +1,5 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8 -*-
-import os
-import sys
-import pandas as pd
 
 
 #Created: 28-Oct-2018
@@ -13,7 +10,6 @@ ideogram_9606_GCF_000001305_13_850_V1 = {
     'Bp_start' : [1,2300000,5400000,7200000,9200000,12700000,16200000,20400000,23900000,28000000,30200000,32400000,34600000,40100000,44100000,46800000,50700000,56100000,59000000,61300000,68900000,69700000,84900000,88400000,92000000,94700000,99700000,102200000,107200000,111800000,116100000,117800000,120600000,121500000,125000000,128900000,142600000,147000000,150300000,155000000,156500000,159100000,160500000,165500000,167200000,170900000,172900000,176000000,180300000,185800000,190800000,193800000,198700000,207200000,211500000,214500000,224100000,224600000,227000000,230700000,234700000,236600000,243700000,1,4400000,7100000,12200000,16700000,19200000,24000000,27900000,30000000,32100000,36600000,38600000,41800000,47800000,52900000,55000000,61300000,64100000,68600000,71500000,73500000,75000000,83300000,90500000,93300000,96800000,102700000,106000000,107500000,110200000,114400000,118800000,122400000,129900000,132500000,135100000,136800000,142200000,144100000,148700000,149900000,150500000,154900000,159800000,163700000,169700000,178000000,180600000,183000000,189400000,191900000,197400000,203300000,204900000,209000000,215300000,221500000,225200000,226100000,231000000,235600000,237300000,1,2800000,4000000,8700000,11800000,13300000,16400000,23900000,26400000,30900000,32100000,36500000,39400000,43700000,44100000,44200000,50600000,52300000,54400000,58600000,63700000,69800000,74200000,79800000,83500000,87200000,87900000,91000000,93900000,98300000,100000000,100900000,102800000,106200000,107900000,111300000,113500000,117300000,119000000,121900000,123800000,125800000,129200000,133700000,135700000,138700000,142800000,148900000,152100000,155000000,157000000,159000000,160700000,167600000,170900000,175700000,179000000,182700000,184500000,186000000,187900000,192300000,1,4500000,6000000,11300000,15200000,17800000,21300000,27700000,35800000,41200000,44600000,48200000,50400000,52700000,59500000,66600000,70500000,76300000,78900000,82400000,84100000,86900000,88000000,93700000,95100000,98800000,101100000,107700000,114100000,120800000,123800000,128800000,131100000,139500000,141500000,146800000,148500000,151100000,155600000,161800000,164500000,170100000,171900000,176300000,177500000,183200000,187100000,1,4500000,6300000,9800000,15000000,18400000,23300000,24600000,28900000,33800000,38400000,42500000,46100000,48400000,50700000,58900000,62900000,63200000,66700000,68400000,73300000,76900000,81400000,82800000,92300000,98200000,102800000,104500000,109600000,111500000,113100000,115200000,121400000,127300000,130600000,136200000,139500000,144500000,149800000,152700000,155700000,159900000,168500000,172800000,176600000,1,2300000,4200000,7100000,10600000,11600000,13400000,15200000,25200000,27000000,30400000,32100000,33500000,36600000,40500000,46200000,51800000,52900000,57000000,58700000,61000000,63300000,63400000,70000000,75900000,83900000,84900000,88000000,93100000,99500000,100600000,105500000,114600000,118300000,118500000,126100000,127100000,130300000,131200000,135200000,139000000,142800000,145600000,149000000,152500000,155500000,161000000,164500000,1,2800000,4500000,7300000,13800000,16500000,20900000,25500000,28000000,28800000,35000000,37200000,43300000,45400000,49000000,50500000,54000000,58000000,59900000,61700000,67000000,72200000,77500000,86400000,88200000,91100000,92800000,98000000,103800000,104500000,107400000,114600000,117400000,121100000,123800000,127100000,129200000,130400000,132600000,138200000,143100000,147900000,152600000,155100000,1,2200000,6200000,12700000,19000000,23300000,27400000,28800000,36500000,38300000,39700000,43100000,45600000,48100000,52200000,52600000,55500000,61600000,62200000,66000000,68000000,70500000,73900000,78300000,80100000,84600000,86900000,93300000,99000000,101600000,106200000,110500000,112100000,117700000,119200000,122500000,127300000,131500000,136400000,139900000,1,2200000,4600000,9000000,14200000,16600000,18500000,19900000,25600000,28000000,33200000,36300000,38400000,41000000,43600000,47300000,49000000,50700000,65900000,68700000,72200000,74000000,79200000,81100000,84100000,86900000,90400000,91800000,93900000,96600000,99300000,102600000,108200000,111300000,114900000,117700000,122500000,125800000,130300000,133500000,134000000,135900000,137400000,1,3000000,3800000,6600000,12200000,17300000,18600000,18700000,22600000,24600000,29600000,31300000,34400000,38000000,40200000,42300000,46100000,49900000,52900000,61200000,64500000,70600000,74900000,77700000,82000000,87900000,89500000,92900000,94100000,97000000,99300000,101900000,103000000,104900000,105800000,111900000,114900000,119100000,121700000,123100000,127500000,130600000,1,2800000,10700000,12700000,16200000,21700000,26100000,27200000,31000000,36400000,43500000,48800000,51600000,53700000,55700000,59900000,61700000,63400000,65900000,68400000,70400000,75200000,77100000,85600000,88300000,92800000,97200000,102100000,102900000,110400000,112500000,114500000,121200000,123900000,127800000,130800000,1,3300000,5400000,10100000,12800000,14800000,20000000,21300000,26500000,27800000,30700000,33300000,35800000,38200000,46400000,49100000,51500000,54900000,56600000,58100000,63100000,65100000,67700000,71500000,75700000,80300000,86700000,89000000,92600000,96200000,101600000,103800000,109000000,111700000,112300000,114300000,116800000,118100000,120700000,125900000,129300000,1,4500000,10000000,16300000,17900000,19500000,23300000,25500000,27800000,28900000,32200000,34000000,35500000,40100000,45200000,45800000,47300000,50900000,55300000,59600000,62300000,65700000,68600000,73300000,75400000,77200000,79000000,87700000,90000000,95000000,98200000,99300000,101700000,104800000,107000000,110300000,1,3700000,8100000,16100000,17600000,19100000,24600000,33300000,35300000,36600000,37800000,43500000,47200000,50900000,54100000,55500000,58100000,62100000,64800000,67900000,70200000,73800000,79300000,83600000,84900000,89800000,91900000,94700000,96300000,101400000,103200000,104000000,1,3900000,8700000,15800000,19000000,20700000,25700000,28100000,30300000,31200000,33600000,40100000,42800000,43600000,44800000,49500000,52900000,59100000,59300000,63700000,67200000,67300000,67500000,72700000,75200000,76600000,78300000,81700000,85200000,89100000,94300000,98500000,1,7900000,10500000,12600000,14800000,16800000,21200000,24200000,28100000,34600000,36600000,38600000,47000000,52600000,56700000,57400000,66700000,70800000,72900000,74100000,79200000,81700000,84200000,87100000,88700000,1,3300000,6500000,10700000,16000000,22200000,24000000,25800000,31800000,38100000,38400000,40900000,44900000,47400000,50200000,57600000,58300000,61100000,62600000,64200000,67100000,70900000,74800000,75300000,1,2900000,7100000,8500000,10900000,15400000,17200000,19000000,25000000,32700000,37200000,43500000,48200000,53800000,56200000,59000000,61600000,66800000,68700000,73100000,1,6900000,13900000,14000000,16300000,20000000,24400000,26500000,28600000,32400000,35500000,38300000,38700000,43400000,45200000,48000000,51400000,53600000,56300000,1,5100000,9200000,12100000,17900000,21300000,22300000,25600000,27500000,29400000,32100000,34400000,37600000,41700000,42100000,46400000,49800000,55000000,56500000,58400000,1,2800000,6800000,10900000,13200000,14300000,16400000,24000000,26800000,31500000,35800000,37800000,39700000,42600000,1,3800000,8300000,12200000,14700000,17900000,22200000,23500000,25900000,29600000,32200000,37600000,41000000,44200000,48400000,49400000,1,4300000,6000000,9500000,17100000,19300000,21900000,24900000,29300000,31500000,37600000,42400000,46400000,49800000,54800000,58100000,60600000,63000000,64600000,67800000,71800000,73900000,76000000,84600000,86200000,91800000,93500000,98300000,102600000,103700000,108700000,116500000,120900000,128700000,130400000,133600000,138000000,140300000,142100000,147100000,1,2500000,3000000,11600000,12500000,13400000,15100000,19800000,22100000,26200000,28800000],
     'Bp_stop' : [2300000,5400000,7200000,9200000,12700000,16200000,20400000,23900000,28000000,30200000,32400000,34600000,40100000,44100000,46800000,50700000,56100000,59000000,61300000,68900000,69700000,84900000,88400000,92000000,94700000,99700000,102200000,107200000,111800000,116100000,117800000,120600000,121500000,125000000,128900000,142600000,147000000,150300000,155000000,156500000,159100000,160500000,165500000,167200000,170900000,172900000,176000000,180300000,185800000,190800000,193800000,198700000,207200000,211500000,214500000,224100000,224600000,227000000,230700000,234700000,236600000,243700000,249250621,4400000,7100000,12200000,16700000,19200000,24000000,27900000,30000000,32100000,36600000,38600000,41800000,47800000,52900000,55000000,61300000,64100000,68600000,71500000,73500000,75000000,83300000,90500000,93300000,96800000,102700000,106000000,107500000,110200000,114400000,118800000,122400000,129900000,132500000,135100000,136800000,142200000,144100000,148700000,149900000,150500000,154900000,159800000,163700000,169700000,178000000,180600000,183000000,189400000,191900000,197400000,203300000,204900000,209000000,215300000,221500000,225200000,226100000,231000000,235600000,237300000,243199373,2800000,4000000,8700000,11800000,13300000,16400000,23900000,26400000,30900000,32100000,36500000,39400000,43700000,44100000,44200000,50600000,52300000,54400000,58600000,63700000,69800000,74200000,79800000,83500000,87200000,87900000,91000000,93900000,98300000,100000000,100900000,102800000,106200000,107900000,111300000,113500000,117300000,119000000,121900000,123800000,125800000,129200000,133700000,135700000,138700000,142800000,148900000,152100000,155000000,157000000,159000000,160700000,167600000,170900000,175700000,179000000,182700000,184500000,186000000,187900000,192300000,198022430,4500000,6000000,11300000,15200000,17800000,21300000,27700000,35800000,41200000,44600000,48200000,50400000,52700000,59500000,66600000,70500000,76300000,78900000,82400000,84100000,86900000,88000000,93700000,95100000,98800000,101100000,107700000,114100000,120800000,123800000,128800000,131100000,139500000,141500000,146800000,148500000,151100000,155600000,161800000,164500000,170100000,171900000,176300000,177500000,183200000,187100000,191154276,4500000,6300000,9800000,15000000,18400000,23300000,24600000,28900000,33800000,38400000,42500000,46100000,48400000,50700000,58900000,62900000,63200000,66700000,68400000,73300000,76900000,81400000,82800000,92300000,98200000,102800000,104500000,109600000,111500000,113100000,115200000,121400000,127300000,130600000,136200000,139500000,144500000,149800000,152700000,155700000,159900000,168500000,172800000,176600000,180915260,2300000,4200000,7100000,10600000,11600000,13400000,15200000,25200000,27000000,30400000,32100000,33500000,36600000,40500000,46200000,51800000,52900000,57000000,58700000,61000000,63300000,63400000,70000000,75900000,83900000,84900000,88000000,93100000,99500000,100600000,105500000,114600000,118300000,118500000,126100000,127100000,130300000,131200000,135200000,139000000,142800000,145600000,149000000,152500000,155500000,161000000,164500000,171115067,2800000,4500000,7300000,13800000,16500000,20900000,25500000,28000000,28800000,35000000,37200000,43300000,45400000,49000000,50500000,54000000,58000000,59900000,61700000,67000000,72200000,77500000,86400000,88200000,91100000,92800000,98000000,103800000,104500000,107400000,114600000,117400000,121100000,123800000,127100000,129200000,130400000,132600000,138200000,143100000,147900000,152600000,155100000,159138663,2200000,6200000,12700000,19000000,23300000,27400000,28800000,36500000,38300000,39700000,43100000,45600000,48100000,52200000,52600000,55500000,61600000,62200000,66000000,68000000,70500000,73900000,78300000,80100000,84600000,86900000,93300000,99000000,101600000,106200000,110500000,112100000,117700000,119200000,122500000,127300000,131500000,136400000,139900000,146364022,2200000,4600000,9000000,14200000,16600000,18500000,19900000,25600000,28000000,33200000,36300000,38400000,41000000,43600000,47300000,49000000,50700000,65900000,68700000,72200000,74000000,79200000,81100000,84100000,86900000,90400000,91800000,93900000,96600000,99300000,102600000,108200000,111300000,114900000,117700000,122500000,125800000,130300000,133500000,134000000,135900000,137400000,141213431,3000000,3800000,6600000,12200000,17300000,18600000,18700000,22600000,24600000,29600000,31300000,34400000,38000000,40200000,42300000,46100000,49900000,52900000,61200000,64500000,70600000,74900000,77700000,82000000,87900000,89500000,92900000,94100000,97000000,99300000,101900000,103000000,104900000,105800000,111900000,114900000,119100000,121700000,123100000,127500000,130600000,135534747,2800000,10700000,12700000,16200000,21700000,26100000,27200000,31000000,36400000,43500000,48800000,51600000,53700000,55700000,59900000,61700000,63400000,65900000,68400000,70400000,75200000,77100000,85600000,88300000,92800000,97200000,102100000,102900000,110400000,112500000,114500000,121200000,123900000,127800000,130800000,135006516,3300000,5400000,10100000,12800000,14800000,20000000,21300000,26500000,27800000,30700000,33300000,35800000,38200000,46400000,49100000,51500000,54900000,56600000,58100000,63100000,65100000,67700000,71500000,75700000,80300000,86700000,89000000,92600000,96200000,101600000,103800000,109000000,111700000,112300000,114300000,116800000,118100000,120700000,125900000,129300000,133851895,4500000,10000000,16300000,17900000,19500000,23300000,25500000,27800000,28900000,32200000,34000000,35500000,40100000,45200000,45800000,47300000,50900000,55300000,59600000,62300000,65700000,68600000,73300000,75400000,77200000,79000000,87700000,90000000,95000000,98200000,99300000,101700000,104800000,107000000,110300000,115169878,3700000,8100000,16100000,17600000,19100000,24600000,33300000,35300000,36600000,37800000,43500000,47200000,50900000,54100000,55500000,58100000,62100000,64800000,67900000,70200000,73800000,79300000,83600000,84900000,89800000,91900000,94700000,96300000,101400000,103200000,104000000,107349540,3900000,8700000,15800000,19000000,20700000,25700000,28100000,30300000,31200000,33600000,40100000,42800000,43600000,44800000,49500000,52900000,59100000,59300000,63700000,67200000,67300000,67500000,72700000,75200000,76600000,78300000,81700000,85200000,89100000,94300000,98500000,102531392,7900000,10500000,12600000,14800000,16800000,21200000,24200000,28100000,34600000,36600000,38600000,47000000,52600000,56700000,57400000,66700000,70800000,72900000,74100000,79200000,81700000,84200000,87100000,88700000,90354753,3300000,6500000,10700000,16000000,22200000,24000000,25800000,31800000,38100000,38400000,40900000,44900000,47400000,50200000,57600000,58300000,61100000,62600000,64200000,67100000,70900000,74800000,75300000,81195210,2900000,7100000,8500000,10900000,15400000,17200000,19000000,25000000,32700000,37200000,43500000,48200000,53800000,56200000,59000000,61600000,66800000,68700000,73100000,78077248,6900000,13900000,14000000,16300000,20000000,24400000,26500000,28600000,32400000,35500000,38300000,38700000,43400000,45200000,48000000,51400000,53600000,56300000,59128983,5100000,9200000,12100000,17900000,21300000,22300000,25600000,27500000,29400000,32100000,34400000,37600000,41700000,42100000,46400000,49800000,55000000,56500000,58400000,63025520,2800000,6800000,10900000,13200000,14300000,16400000,24000000,26800000,31500000,35800000,37800000,39700000,42600000,48129895,3800000,8300000,12200000,14700000,17900000,22200000,23500000,25900000,29600000,32200000,37600000,41000000,44200000,48400000,49400000,51304566,4300000,6000000,9500000,17100000,19300000,21900000,24900000,29300000,31500000,37600000,42400000,46400000,49800000,54800000,58100000,60600000,63000000,64600000,67800000,71800000,73900000,76000000,84600000,86200000,91800000,93500000,98300000,102600000,103700000,108700000,116500000,120900000,128700000,130400000,133600000,138000000,140300000,142100000,147100000,155270560,2500000,3000000,11600000,12500000,13400000,15100000,19800000,22100000,26200000,28800000,59373566]
 }
-cb_df = pd.DataFrame(data=ideogram_9606_GCF_000001305_13_850_V1)
 
 
 #Created: 28-Oct-2018
@@ -26,22 +22,6 @@ impact_468_kinase_domain_annotation = {
     'Refseq_transcriptID' : ["NM_000141","NM_004329","NM_020975","NM_001274","NM_002576","NM_003942","NM_003942","NM_003952","NM_000075","NM_001982","NM_001260","NM_002019","NM_004119","NM_014572","NM_014572","NM_001014431","NM_002742","NM_000875","NM_001012338","NM_002755","NM_002613","NM_002746","NM_003010","NM_004217","NM_004448","NM_016507","NM_005433","NM_000208","NM_000215","NM_000215","NM_000455","NM_001626","NM_021913","NM_030662","NM_002227","NM_002227","NM_002529","NM_005465","NM_006182","NM_014002","NM_032017","NM_003600","NM_177990","NM_198291","NM_002745","NM_007194","NM_001111067","NM_004304","NM_005235","NM_001024847","NM_002093","NM_002447","NM_002740","NM_002880","NM_004441","NM_004721","NM_005233","NM_000142","NM_000222","NM_002253","NM_004439","NM_006206","NM_002609","NM_005211","NM_005921","NM_006622","NM_182925","NM_213647","NM_002648","NM_002944","NM_004440","NM_004690","NM_004690","NM_153047","NM_000245","NM_001145306","NM_004333","NM_005228","NM_001174067","NM_002350","NM_000459","NM_003177","NM_004612","NM_004972","NM_004972","NM_005157","NM_006180","NM_000061","NM_001654"],
     'HUGO' : ["FGFR2","BMPR1A","RET","CHEK1","PAK1","#RPS6KA4","#RPS6KA4","RPS6KB2","CDK4","ERBB3","CDK8","FLT1","FLT3","#LATS2","#LATS2","AKT1","PRKD1","IGF1R","NTRK3","MAP2K1","PDPK1","MAPK3","MAP2K4","AURKB","ERBB2","CDK12","YES1","INSR","#JAK3","#JAK3","STK11","AKT2","AXL","MAP2K2","#JAK1","#JAK1","NTRK1","AKT3","DDR2","IKBKE","STK40","AURKA","PAK7","SRC","MAPK1","CHEK2","ACVR1","ALK","ERBB4","TGFBR2","GSK3B","MST1R","PRKCI","RAF1","EPHB1","MAP3K13","EPHA3","FGFR3","KIT","KDR","EPHA5","PDGFRA","PDGFRB","CSF1R","MAP3K1","PLK2","FLT4","FGFR4","PIM1","ROS1","EPHA7","#LATS1","#LATS1","FYN","MET","CDK6","BRAF","EGFR","FGFR1","LYN","TEK","SYK","TGFBR1","#JAK2","#JAK2","ABL1","NTRK2","BTK","ARAF"]
     }
-kinase_annotation = pd.DataFrame(data=impact_468_kinase_domain_annotation)
-
-
-refFlat_summary = pd.read_csv(
-    os.path.dirname(os.path.realpath(sys.argv[0])) + \
-            "/data/refFlat_summary.txt", sep="\t", 
-        dtype={'a': str, 'b': str, 'c': str, 
-        'd': str, 'e': int, 'f': str, 'g': str})
-
-
-#Created: 28-Oct-2018
-# Includes cv6 genes and intronic regions tartgetted for SV
-transcript_reference = pd.read_csv(
-    os.path.dirname(os.path.realpath(sys.argv[0])) + \
-            "/data/REFERENCE_refseq_canonical_transcripts.txt", sep="\t",
-        dtype={'a': str, 'b': str, 'c': str, 'd': str, 'e': str})
 
 
 # Not used. Just for reference.
@@ -875,10 +855,3 @@ OncoKb_known_fusions = {
     'YAP1:MAMLD1': 1,
     'YAP1:TFE3': 1
 }
-
-# Created 28-Oct-2018
-# Based on /dmp/data/pubdata/refgene-canonical/VERSIONS/hg19v20160908/refFlat.canonical_all_coding_exons_aa.interval_list
-refFlat_canonical = pd.read_csv(
-    os.path.dirname(os.path.realpath(sys.argv[0])) + \
-            "/data/ensembl_refseq_canonical_mrna_grch37.2.txt",
-    sep="\t",dtype={'a': str, 'b': str})
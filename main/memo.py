@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+from operator import attrgetter
+from profiling import count
+
+MISSING = object()
+
+
+class breakpoint_memo(object):
+    """
+    Bounded memo of derived breakpoint state. A memoized step is a
+    function setting attributes of a breakpoint from some of its
+    other attributes, its inputs, which it does not set itself, all
+    declared in the __slots__ of the breakpoint class. The step is
+    run on a scratch copy holding only the inputs, and the attributes
+    it sets, or the exception it raises, are stored under
+    the step, the values of the inputs and the other arguments, e.g.
+    (get_bkp_info, chrom, pos, gene, desc, transcript, strand,
+    exon_index, orientation, fusion), to be replayed on later
+    breakpoints with the same key. Warnings logged by a step are
+    only logged on the first call.
+
+    Eviction approximates LRU with two generations of plain dicts:
+    entries are added to the recent generation, which becomes the
+    old one once it holds half of maxsize entries, and old entries
+    are moved back on a hit. Whatever was used within the last
+    maxsize / 2 insertions is kept.
+    """
+
+    def __init__(self, maxsize=50000):
+        self.maxsize = max(2, maxsize)
+        self.recent = {}
+        self.old = {}
+        self.getters = {}
+        self.hits = {}
+        self.misses = {}
+
+    def __len__(self):
+        return len(self.recent) + len(self.old)
+
+    def apply(self, step, target, inputs, *args):
+        """
+        Run step(target, *args), or replay its stored outcome
+        function, bkp, tuple, ... -> None
+        """
+        getter = self.getters.get(inputs)
+        if getter is None:
+            getter = self.getters[inputs] = attrgetter(*inputs)
+        try:
+            values = getter(target)
+        except AttributeError:
+            values = tuple([getattr(target, name, MISSING) for name in inputs])
+        key = (step,) + values + args
+        entry = self.recent.get(key)
+        if entry is None:
+            entry = self.old.pop(key, None)
+            if entry is None:
+                entry = self.run(step, target, inputs, values, args)
+                self.misses[step] = self.misses.get(step, 0) + 1
+            else:
+                self.hits[step] = self.hits.get(step, 0) + 1
+            if len(self.recent) >= self.maxsize // 2:
+                self.old, self.recent = self.recent, {}
+            self.recent[key] = entry
+        else:
+            self.hits[step] = self.hits.get(step, 0) + 1
+        written, error = entry
+        for name, value in written:
+            setattr(target, name, value)
+        if error is not None:
+            raise error
+
+    def run(self, step, target, inputs, values, args):
+        """
+        Run a step on a scratch copy of the inputs of a breakpoint
+        and get the attributes it set and the exception it raised
+        function, bkp, tuple, tuple, tuple -> tuple
+        """
+        # The scratch copy skips __init__, so only the inputs and the
+        # attributes the step sets are present
+        scratch = object.__new__(type(target))
+        for name, value in zip(inputs, values):
+            if value is not MISSING:
+                setattr(scratch, name, value)
+        error = None
+        try:
+            step(scratch, *args)
+        except Exception as e:
+            error = e
+        written = []
+        for name in type(target).__slots__:
+            if name not in inputs:
+                value = getattr(scratch, name, MISSING)
+                if value is not MISSING:
+                    written.append((name, value))
+        return tuple(written), error
+
+    def report(self):
+        """
+        Add the hits and misses of every step to the profiling
+        counters, once at the end of a run
+        None -> None
+        """
+        for kind, counts in (("hits", self.hits), ("misses", self.misses)):
+            for step, n in counts.items():
+                count("memo.%s.%s" % (step.__name__, kind), n)
+
+    def hit_rate(self):
+        """
+        Get the share of memoized steps replayed from the memo
+        None -> float
+        """
+        hits = sum(self.hits.values())
+        total = hits + sum(self.misses.values())
+        return float(hits) / total if total else 0.0
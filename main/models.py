@@ -1,11 +1,25 @@
 #!/usr/bin/env python2
 import os
+import re
 import sys
 import logging
-import requests
-import pandas as pd
-from config import VEP, VEP_CACHE, PERL, FASTA
+import numpy as np
+from config import (
+    VEP,
+    VEP_CACHE,
+    PERL,
+    FASTA,
+    VEP_BUFFER_SIZE,
+    VEP_CPUS,
+    VEP_SHARD_SIZE,
+)
+from reference import TUMOUR_SUPPRESSOR, HOTSPOT, KINASE
+from profiling import stage, count
+from collections import namedtuple
+import json
+import Queue
 import random
+import threading
 import subprocess
 from datetime import datetime
 
@@ -32,6 +46,36 @@ class bkp(object):
     Class to represent a breakpoint and other related attributes and features.
     """
 
+    __slots__ = (
+        # input
+        "chrom",
+        "pos",
+        "gene",
+        "desc",
+        # expand
+        "transcript",
+        "cdna",
+        "strand",
+        "isCoding",
+        "isPanel",
+        "isTumourSuppressor",
+        "isHotspot",
+        "isKinase",
+        # notes.get_bkp_info, which does not set the sites of all
+        # breakpoints
+        "firstexon",
+        "lastexon",
+        "startpos",
+        "stoppos",
+        "exon",
+        "intron",
+        "site",
+        "variantSite1",
+        "variantSite2",
+        # notes.get_kinase_status
+        "isEntireKinase",
+    )
+
     def __init__(self, chrom, pos, gene, desc):
         try:
             self.chrom = str(chrom)
@@ -44,14 +88,24 @@ class bkp(object):
             )
         except Exception:
             raise Exception("Unexpected error:", sys.exc_info()[0])
-
-    def expand(
-        self, transcript_reference, kinase_annotation, hotspot, tumourSuppressor, cache
-    ):
-        reference = transcript_reference[
-            transcript_reference["Gene"] == self.gene
-        ].to_dict("list")
-        self.transcript = reference["Lookup_Transcript"] or None
+        self.transcript, self.cdna, self.strand = None, None, None
+        self.isCoding, self.isPanel = False, False
+        self.isTumourSuppressor, self.isHotspot, self.isKinase = False, False, False
+        self.variantSite1, self.variantSite2 = None, None
+        self.isEntireKinase = None
+
+    def expand(self, transcript_index, gene_classes, cache, memo=None):
+        if memo is not None:
+            return memo.apply(
+                bkp.expand.__func__,
+                self,
+                ("chrom", "pos", "gene", "desc"),
+                transcript_index,
+                gene_classes,
+                cache,
+            )
+        reference = transcript_index.get(self.gene)
+        self.transcript = list(reference.lookup_transcripts) if reference else None
         self.cdna = "chr" + self.chrom + ":g." + str(self.pos)
         if self.transcript is None:
             logger.warning("Cannot find canonical transcript for " + str(self.gene))
@@ -62,11 +116,7 @@ class bkp(object):
                 # self.transcript = self.transcript.split(".")[0]
                 # if self.transcript == "ENST00000331340":
                 #    self.transcript = "NM_006060"
-                self.transcript = dict(
-                    zip(
-                        reference["Lookup_Transcript"], reference["Reported_Transcript"]
-                    )
-                )[self.transcript]
+                self.transcript = reference.reported_transcripts[self.transcript]
             except Exception as e:
                 logger.warning(e)
 
@@ -86,69 +136,137 @@ class bkp(object):
             self.isCoding = False
 
         self.isPanel = False
-        try:
-            if set(reference["IsPanel"]).pop() == 1:
-                self.isPanel = True
-        except KeyError:
+        if reference is not None:
+            self.isPanel = reference.isPanel
+        else:
             logger.warning(
                 "%s not present in the reference canonical transcript file."
                 % (self.gene)
             )
 
-        if all([self.gene in tumourSuppressor, self.isPanel, self.isCoding]):
+        flags = gene_classes.get(self.gene)
+        if all([flags & TUMOUR_SUPPRESSOR, self.isPanel, self.isCoding]):
             self.isTumourSuppressor = True
         else:
             self.isTumourSuppressor = False
 
-        if self.gene in hotspot and self.isCoding:
+        if flags & HOTSPOT and self.isCoding:
             self.isHotspot = True
         else:
             self.isHotspot = False
 
-        if self.gene in kinase_annotation["HUGO"].tolist() and self.isCoding:
+        if flags & KINASE and self.isCoding:
             self.isKinase = True
         else:
             self.isKinase = False
 
 
+# Fields of a structural variant as read from an iCallSV table
+sv_record = namedtuple(
+    "sv_record",
+    [
+        "svtype",
+        "chr1",
+        "pos1",
+        "chr2",
+        "pos2",
+        "gene1",
+        "gene2",
+        "site1",
+        "site2",
+        "description",
+    ],
+)
+
+
+def has_missing_fields(chr1, pos1, chr2, pos2, gene1, gene2):
+    """
+    Check whether breakpoints or genes of an SV are missing from an
+    input table, which fails the SV. Any other value is accepted
+    here, e.g. a gene name with " / " in it, and is checked when the
+    SV is expanded.
+    object, object, object, object, object, object -> bool
+    """
+    return any(
+        field is None or field != field
+        for field in (chr1, pos1, chr2, pos2, gene1, gene2)
+    )
+
+
 class sv(object):
     """
     Class to represent a structural variant and other related attributes and features.
     """
 
+    __slots__ = sv_record._fields + (
+        # expand
+        "bkp1",
+        "bkp2",
+        "isIntragenic",
+        "isFusion",
+        "fusionGene",
+        "fusionPartner1",
+        "fusionPartner2",
+        "isKnownFusion",
+        "annotationPartner1",
+        "annotationPartner2",
+        # annotation and notes
+        "annotation",
+        "exons",
+        "bkpsites",
+        "prefix",
+        "misc",
+        "sig",
+        "Note",
+    )
+
     message = ""
 
-    def __init__(self, svtype, bkp1, bkp2, genes, site1, site2, description):
+    def __init__(
+        self, svtype, chr1, pos1, chr2, pos2, gene1, gene2, site1, site2, description
+    ):
+        if has_missing_fields(chr1, pos1, chr2, pos2, gene1, gene2):
+            raise Exception(
+                "Could not create a new instance of sv class due to incorrect format of arguments."
+            )
         self.svtype = svtype
         self.site1 = site1
         self.site2 = site2
         self.description = description
+        self.chr1, self.pos1 = chr1, pos1
+        self.chr2, self.pos2 = chr2, pos2
+        self.gene1, self.gene2 = gene1, gene2
+        self.bkp1, self.bkp2 = None, None
+        self.isIntragenic, self.isFusion, self.isKnownFusion = False, False, False
+        self.fusionGene, self.fusionPartner1, self.fusionPartner2 = None, None, None
+        self.annotationPartner1, self.annotationPartner2 = None, None
+        self.annotation, self.exons, self.bkpsites = None, None, None
+        self.prefix, self.misc, self.sig, self.Note = None, None, None, None
+
+    @classmethod
+    def parse(cls, svtype, bkp1, bkp2, genes, site1, site2, description):
+        """
+        Create an sv from the fields of its comma-joined string form,
+        with breakpoints given as chrom:pos and genes as gene1 / gene2
+        str, str, str, str, str, str, str -> sv
+        """
         try:
-            self.chr1, self.pos1 = bkp1.split(":")  # IncorrectBkpFormat
-            self.chr2, self.pos2 = bkp2.split(":")  # IncorrectBkpFormat
-            self.gene1, self.gene2 = genes.split(" / ")  # IncorrectGenesFormat
+            chr1, pos1 = bkp1.split(":")  # IncorrectBkpFormat
+            chr2, pos2 = bkp2.split(":")  # IncorrectBkpFormat
+            gene1, gene2 = genes.split(" / ")  # IncorrectGenesFormat
         except ValueError:
             raise Exception(
                 "Could not create a new instance of sv class due to incorrect format of arguments."
             )
+        return cls(
+            svtype, chr1, pos1, chr2, pos2, gene1, gene2, site1, site2, description
+        )
 
-    def expand(
-        self,
-        transcript_reference,
-        kinase_annotation,
-        hotspot,
-        tumourSuppressor,
-        oncoKb,
-        cache,
-    ):
+    def expand(self, transcript_index, gene_classes, oncoKb, cache, memo=None):
         self.bkp1 = bkp(self.chr1, self.pos1, self.gene1, self.site1)
         self.bkp2 = bkp(self.chr2, self.pos2, self.gene2, self.site2)
-        self.bkp1.expand(
-            transcript_reference, kinase_annotation, hotspot, tumourSuppressor, cache
-        )
-        self.bkp2.expand(
-            transcript_reference, kinase_annotation, hotspot, tumourSuppressor, cache
-        )
+        self.bkp1.expand(transcript_index, gene_classes, cache, memo)
+        self.bkp2.expand(transcript_index, gene_classes, cache, memo)
 
         # Define key variables
         if not (self.bkp1.isPanel or self.bkp2.isPanel):
@@ -252,6 +370,25 @@ class sv(object):
             )
 
 
+def partner_signature(sv, fusion):
+    """
+    Classify an expanded sv by the breakpoints its annotation and
+    notes are rendered from: "fusion", the fusion partners, when
+    fusion is given; "intragenic" or "both", both annotation
+    partners in the panel and coding, in one gene or not; "first" or
+    "second", only that annotation partner
+    sv, bool -> str
+    """
+    if fusion:
+        return "fusion"
+    partner1, partner2 = sv.annotationPartner1, sv.annotationPartner2
+    if not (partner1.isPanel and partner1.isCoding):
+        return "second"
+    if not (partner2.isPanel and partner2.isCoding):
+        return "first"
+    return "intragenic" if sv.isIntragenic else "both"
+
+
 def get_cdna_pos(bkp, cache):
     """
     Get cdna position for a bkp object by querying
@@ -270,33 +407,404 @@ def get_cdna_pos(bkp, cache):
     # )
 
 
-def build_cache(bkps, transcript_reference, verbose):
-    # print(transcript_reference["Lookup_Transcript"])
+# hgvsc stored for VEP consequences without one
+NO_HGVSC = ""
 
-    def filter_for_select_tx(list_of_dict):
-        try:
-            return list(
-                filter(
-                    lambda x: x["transcript_id"]
-                    in transcript_reference["Lookup_Transcript"].values,
-                    list_of_dict,
-                )
+# Chromosome codes used to pack a breakpoint into a single int64 key
+CHROM_CODES = dict(
+    [(str(i), i) for i in range(1, 23)] + [("X", 23), ("Y", 24), ("MT", 25)]
+)
+
+
+class vep_cache(object):
+    """
+    Compact index of VEP cDNA annotations for breakpoints.
+    Each breakpoint is packed into an int64 key (chromosome code
+    in the high bits, position in the low 32 bits), transcripts are
+    stored as integer codes and hgvsc strings are interned. Entries
+    are kept in an array of (key, transcript code) composites sorted
+    so that a lookup is a binary search.
+    """
+
+    # bits reserved for the transcript code in an entry
+    TX_BITS = 20
+
+    def __init__(self):
+        self.chrom_codes = dict(CHROM_CODES)
+        self.transcript_codes = {}
+        self._entries, self._hgvsc = [], []
+        self.entries = np.empty(0, dtype=np.int64)
+        self.hgvsc = np.empty(0, dtype=object)
+        self._dirty = False
+        # Shared by the segments of this cache
+        self.source = random.getrandbits(64)
+
+    def __len__(self):
+        self.finalize()
+        return len(self.entries)
+
+    # A segment answers like its source cache for the breakpoints it
+    # holds, so derived breakpoint state memoized with either is valid
+    # for both
+    def __eq__(self, other):
+        return isinstance(other, vep_cache) and self.source == other.source
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.source)
+
+    def segment(self, chroms, positions):
+        """
+        Get a cache holding all annotations of the given breakpoints,
+        to be sent to a worker instead of the whole cache
+        iterable, iterable -> vep_cache
+        """
+        self.finalize()
+        keys = set()
+        for chrom, pos in zip(chroms, positions):
+            try:
+                key = self.locus_key(chrom, int(pos))
+            except (TypeError, ValueError):
+                continue
+            if key is not None:
+                keys.add(key)
+        keys = np.array(sorted(keys), dtype=np.int64)
+        start = self.entries.searchsorted(keys << self.TX_BITS)
+        end = self.entries.searchsorted((keys + 1) << self.TX_BITS)
+        index = np.concatenate(
+            [np.arange(a, b) for a, b in zip(start, end)] + [np.empty(0, np.int64)]
+        ).astype(np.int64)
+        part = vep_cache()
+        part.chrom_codes = self.chrom_codes
+        part.transcript_codes = self.transcript_codes
+        part.entries, part.hgvsc = self.entries[index], self.hgvsc[index]
+        part.source = self.source
+        return part
+
+    def chrom_code(self, chrom, create=False):
+        """
+        Get the integer code of a chromosome
+        str, bool -> (int or None)
+        """
+        chrom = str(chrom)
+        if chrom.startswith("chr"):
+            chrom = chrom[3:]
+        code = self.chrom_codes.get(chrom)
+        if code is None and create:
+            code = self.chrom_codes[chrom] = len(self.chrom_codes) + 1
+        return code
+
+    def locus_key(self, chrom, pos, create=False):
+        """
+        Pack a breakpoint into an int64 key
+        str, int, bool -> (int or None)
+        """
+        code = self.chrom_code(chrom, create)
+        if code is None:
+            return None
+        return (code << 32) | int(pos)
+
+    def add(self, chrom, pos, transcript, hgvsc):
+        """
+        Add the cDNA annotation of a breakpoint for a transcript
+        str, int, str, str -> None
+        """
+        code = self.transcript_codes.setdefault(
+            str(transcript), len(self.transcript_codes)
+        )
+        if code >> self.TX_BITS:
+            raise ValueError("Too many transcripts for the VEP cache index.")
+        key = self.locus_key(chrom, pos, create=True)
+        self._entries.append((key << self.TX_BITS) | code)
+        self._hgvsc.append(intern(str(hgvsc)))
+        self._dirty = True
+
+    def finalize(self):
+        """
+        Merge pending entries into the sorted arrays
+        None -> None
+        """
+        if not self._dirty:
+            return
+        entries = np.concatenate(
+            [self.entries, np.asarray(self._entries, dtype=np.int64)]
+        )
+        hgvsc = np.empty(len(entries), dtype=object)
+        hgvsc[: len(self.hgvsc)] = self.hgvsc
+        hgvsc[len(self.hgvsc) :] = self._hgvsc
+        # stable sort keeps the first annotation seen for duplicate entries
+        order = np.argsort(entries, kind="mergesort")
+        self.entries, self.hgvsc = entries[order], hgvsc[order]
+        self._entries, self._hgvsc = [], []
+        self._dirty = False
+
+    def get(self, chrom, pos, transcript):
+        """
+        Get hgvsc annotation of a breakpoint for a transcript
+        str, int, str -> (str or None)
+        """
+        self.finalize()
+        key = self.locus_key(chrom, pos)
+        code = self.transcript_codes.get(transcript)
+        if key is None or code is None:
+            return None
+        entry = (key << self.TX_BITS) | code
+        i = self.entries.searchsorted(entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            return self.hgvsc[i]
+        return None
+
+    def get_many(self, chroms, positions, transcripts):
+        """
+        Get hgvsc annotations for columns of breakpoints and
+        transcripts. Missing annotations are returned as None
+        array, array, array -> array
+        """
+        self.finalize()
+        n = len(transcripts)
+        chrom_codes = np.array(
+            [self.chrom_code(c) or -1 for c in chroms], dtype=np.int64
+        )
+        tx_codes = np.array(
+            [self.transcript_codes.get(tx, -1) for tx in transcripts], dtype=np.int64
+        )
+        entries = (
+            ((chrom_codes << 32) | np.asarray(positions, dtype=np.int64))
+            << self.TX_BITS
+        ) | tx_codes
+        found = np.zeros(n, dtype=bool)
+        i = np.zeros(n, dtype=np.int64)
+        if len(self.entries):
+            i = np.minimum(self.entries.searchsorted(entries), len(self.entries) - 1)
+            found = (
+                (self.entries[i] == entries) & (chrom_codes >= 0) & (tx_codes >= 0)
             )
-        except TypeError as e:
-            return []
+        hgvsc = np.empty(n, dtype=object)
+        hgvsc[found] = self.hgvsc[i[found]]
+        return hgvsc
+
 
+def clean_hgvsc(hgvsc):
+    """
+    Strip transcript prefix and deleted bases from a VEP hgvsc
+    str -> str
+    """
+    return re.sub(r"del.*", "", re.sub(r".*:", "", hgvsc))
+
+
+def build_cache(
+    bkps,
+    transcript_reference,
+    verbose,
+    store=None,
+    resolver=None,
+    vep_cpus=VEP_CPUS,
+    shard_size=VEP_SHARD_SIZE,
+):
+    """
+    Build the VEP annotation cache for the canonical transcripts of
+    the given breakpoints, using a local VEP or, given a resolver,
+    the Ensembl REST API. With a persistent breakpoint store, only
+    breakpoints not annotated by a previous run are sent to VEP.
+    df, dict, bool, breakpoint_store, rest_resolver, int, int -> vep_cache
+    """
+    builder = cache_builder(
+        bkps, transcript_reference, verbose, store, resolver, vep_cpus, shard_size
+    )
     try:
-        tmp_dir = os.environ["TMP"]
-    except KeyError:
-        tmp_dir = os.getcwd()
-    input_file_name = "_".join(["variant", str(random.getrandbits(128))]) + ".vcf"
-    out_file_name = input_file_name.replace(".vcf", ".txt")
-    with open(os.path.join(tmp_dir, input_file_name), "w") as f:
-        f.write("##fileformat=VCFv4.2\n")
-        bkps.to_csv(f, header=True, index=None, sep="\t", mode="a")
-
-    vep_cmd = " ".join(
-        [
+        builder.wait()
+    finally:
+        builder.close()
+    return builder.cache
+
+
+class cache_builder(object):
+    """
+    Incremental build of the VEP annotation cache. Breakpoints found
+    in the persistent store or resolved with the REST API are added
+    at once. The others are run through VEP in shards, which are
+    added to the cache as they complete, so SVs can be annotated as
+    soon as the shards of their breakpoints are in. Annotations are
+    added to a new cache, or to the one given.
+    """
+
+    def __init__(
+        self,
+        bkps,
+        transcript_reference,
+        verbose,
+        store=None,
+        resolver=None,
+        vep_cpus=VEP_CPUS,
+        shard_size=VEP_SHARD_SIZE,
+        cache=None,
+    ):
+        # print(transcript_reference["Lookup_Transcript"])
+        self.select_tx = frozenset(transcript_reference["Lookup_Transcript"])
+        if bkps.empty:
+            raise ValueError("No breakpoints to annotate.")
+
+        self.cache = cache if cache is not None else vep_cache()
+        self.store = store
+        self.runner = None
+        self.shards = {}
+        if store is not None:
+            print(timestamp() + "Querying persistent breakpoint cache...")
+            n_bkps = len(bkps.index)
+            with stage("store.load"):
+                bkps = store.load(bkps, self.cache, self.select_tx)
+            count("store.found", n_bkps - len(bkps.index))
+            print(
+                timestamp()
+                + "%d of %d breakpoints found in the persistent cache."
+                % (n_bkps - len(bkps.index), n_bkps)
+            )
+
+        count("vep.breakpoints", len(bkps.index))
+        if not bkps.empty and resolver is not None:
+            print(timestamp() + "Resolving breakpoints with the Ensembl REST API...")
+            with stage("rest.resolve"):
+                annotations = resolver.resolve(zip(bkps["#CHROM"], bkps["POS"]))
+            self.add(bkps, annotations)
+        elif not bkps.empty:
+            # The store keeps the annotations of all transcripts
+            transcripts = self.select_tx if store is None else None
+            self.runner = vep_runner(bkps, verbose, transcripts, vep_cpus, shard_size)
+            for i, shard in enumerate(self.runner.shards):
+                self.shards.update(
+                    ((c, p), i) for c, p in zip(shard["#CHROM"], shard["POS"])
+                )
+        if self.runner is None:
+            self.finish()
+
+    @property
+    def pending(self):
+        """
+        Number of VEP shards not in the cache yet
+        None -> int
+        """
+        return self.runner.pending if self.runner is not None else 0
+
+    @property
+    def ready(self):
+        """
+        Last shard up to which all shards are in the cache, or -1
+        None -> int
+        """
+        if self.runner is None:
+            return -1
+        self.wait(-1)
+        return self.runner.ready
+
+    def shard_of(self, chroms, positions):
+        """
+        Get the VEP shard of each breakpoint, or -1 for breakpoints
+        that are already in the cache
+        iterable, iterable -> array
+        """
+        return np.array(
+            [self.shards.get(bkp, -1) for bkp in zip(chroms, positions)],
+            dtype=np.int64,
+        )
+
+    def add(self, bkps, annotations):
+        """
+        Add the canonical transcript annotations of breakpoints to
+        the cache and the persistent store
+        df, iterable -> None
+        """
+        with stage("cache.fill"):
+            for chrom, pos, transcript, hgvsc in annotations:
+                if transcript in self.select_tx:
+                    self.cache.add(chrom, pos, transcript, hgvsc)
+        if self.store is not None:
+            with stage("store.save"):
+                self.store.save(bkps, annotations)
+
+    def wait(self, shard=None):
+        """
+        Wait until the VEP shards up to the given one, or all of
+        them, are in the cache
+        int -> None
+        """
+        if self.runner is None or not self.runner.pending:
+            return
+        for bkps, annotations in self.runner.results(shard):
+            self.add(bkps, annotations)
+        if not self.runner.pending:
+            self.finish()
+
+    def finish(self):
+        """
+        Sort the completed cache
+        None -> None
+        """
+        with stage("cache.finalize"):
+            self.cache.finalize()
+        print(timestamp() + "Completed building annotation cache")
+
+    def close(self):
+        """
+        Stop the VEP processes still running and remove their files
+        None -> None
+        """
+        if self.runner is not None:
+            self.runner.close()
+
+
+class vep_runner(object):
+    """
+    Run VEP over shards of breakpoints, in their order, with as many
+    concurrent VEP processes as the CPU budget allows and the rest of
+    the budget given to each process as forks. Every shard is fed to
+    VEP over stdin and its JSON output parsed line by line from
+    stdout, keeping only the cDNA annotations of the given
+    transcripts, or of all when there are none. Shards are started
+    from a background thread, which keeps the budget in use while
+    completed shards are consumed.
+    """
+
+    def __init__(
+        self, bkps, verbose, transcripts=None, cpus=VEP_CPUS, shard_size=VEP_SHARD_SIZE
+    ):
+        shard_size = max(1, shard_size)
+        self.shards = [
+            bkps.iloc[i : i + shard_size] for i in range(0, len(bkps.index), shard_size)
+        ]
+        self.processes = max(1, min(len(self.shards), cpus))
+        self.forks = max(1, cpus // self.processes)
+        self.verbose = verbose
+        self.transcripts = transcripts
+        self.slots = threading.Semaphore(self.processes)
+        self.completed = Queue.Queue()
+        self.outputs = {}
+        self.finished = set()
+        self.running = {}
+        self.readers = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.thread = None
+        self._ready = -1
+
+    @property
+    def pending(self):
+        return len(self.shards) - len(self.finished)
+
+    @property
+    def ready(self):
+        while self._ready + 1 in self.finished:
+            self._ready += 1
+        return self._ready
+
+    def command(self, i):
+        """
+        Get the VEP command line of a shard, reading the breakpoints
+        from stdin and writing JSON to stdout
+        int -> list
+        """
+        cmd = [
             PERL,
             VEP,
             "--species",
@@ -307,7 +815,7 @@ def build_cache(bkps, transcript_reference, verbose):
             "--no_progress",
             "--no_stats",
             "--buffer_size",
-            "10000",
+            str(min(VEP_BUFFER_SIZE, len(self.shards[i].index))),
             "--hgvs",
             "--minimal",
             "--canonical",
@@ -315,162 +823,218 @@ def build_cache(bkps, transcript_reference, verbose):
             VEP_CACHE,
             "--fasta",
             FASTA,
-            "--fork",
-            "12",
             "--json",
-            "--input_file",
-            os.path.join(tmp_dir, input_file_name),
-            "--out",
-            os.path.join(tmp_dir, out_file_name),
+            "--output_file",
+            "STDOUT",
         ]
-    )
-
-    try:
-        FNULL = open("/dev/null", "w")
-        print(timestamp() + "Running VEP...")
-        if verbose:
-            subprocess.check_call(vep_cmd, shell=True)
-        else:
-            subprocess.check_call(vep_cmd, shell=True, stdout=FNULL)
-        FNULL.close()
-    except subprocess.CalledProcessError:
-        raise
-
-    try:
-        print(timestamp() + "Reading json outputs from vep:")
-        annotation_results = pd.read_json(
-            os.path.join(tmp_dir, out_file_name), lines=True
-        )[["id", "transcript_consequences"]]
-    except IOError as e:
-        print(
-            timestamp()
-            + "VEP annotated json file cannot be found. Check if VEP ran successfully."
+        if self.forks > 1:
+            cmd += ["--fork", str(self.forks)]
+        return cmd
+
+    def start(self, i):
+        """
+        Start VEP on a shard, with threads feeding its breakpoints
+        and reading its annotations
+        int -> Popen
+        """
+        count("vep.shards")
+        process = subprocess.Popen(
+            self.command(i), bufsize=-1, stdin=subprocess.PIPE, stdout=subprocess.PIPE
         )
-        raise
+        writer = threading.Thread(target=self.feed, args=(i, process))
+        reader = threading.Thread(target=self.collect, args=(i, process))
+        for thread in (writer, reader):
+            thread.daemon = True
+            thread.start()
+        self.readers.append(reader)
+        return process
+
+    def feed(self, i, process):
+        """
+        Write the breakpoints of a shard as VCF to the stdin of VEP
+        int, Popen -> None
+        """
+        shard = self.shards[i]
+        try:
+            process.stdin.write("##fileformat=VCFv4.2\n")
+            process.stdin.write("\t".join(shard.columns) + "\n")
+            for row in zip(*[shard[column] for column in shard.columns]):
+                process.stdin.write("\t".join(map(str, row)) + "\n")
+        except IOError:
+            # VEP exited early, its status is reported by collect
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except IOError:
+                pass
 
-    # Remove temp files
-    try:
-        map(lambda x: os.remove(x), (input_file_name, out_file_name))
-    except OSError as e:
-        # Ignore if temp files cannot be removed due to permissions
-        pass
-
-    print(timestamp() + "Parsing JSON results.")
-    annotation_results.dropna(inplace=True)
-    annotation_results["id"] = (
-        annotation_results["id"].str.replace("_N/-", "").str.replace("_", ":")
-    )
-    print(timestamp() + "Filtering for canonical transcripts.")
-    annotation_results["transcript_consequences"] = annotation_results[
-        "transcript_consequences"
-    ].apply(filter_for_select_tx)
-    print(timestamp() + "Completed filtering")
-    annotation_results = (
-        pd.DataFrame(
-            annotation_results["transcript_consequences"].tolist(),
-            index=annotation_results["id"],
+    def collect(self, i, process):
+        """
+        Parse the JSON lines VEP writes for a shard as they arrive,
+        then queue the shard with the exit status of VEP, or the
+        error met while reading
+        int, Popen -> None
+        """
+        annotations = []
+        try:
+            with stage("vep.parse"):
+                for line in iter(process.stdout.readline, ""):
+                    if line.startswith("{"):
+                        annotations.extend(read_vep_line(line, self.transcripts))
+                    elif self.verbose:
+                        sys.stdout.write(line)
+            status = process.wait()
+        except Exception as e:
+            process.kill()
+            process.wait()
+            status = e
+        with self.lock:
+            self.running.pop(i, None)
+        self.outputs[i] = annotations
+        self.completed.put((i, status))
+        self.slots.release()
+
+    def run(self):
+        """
+        Start the shards in order, keeping up to the process budget
+        running
+        None -> None
+        """
+        try:
+            for i in range(len(self.shards)):
+                self.slots.acquire()
+                with self.lock:
+                    if self.closed:
+                        return
+                    self.running[i] = self.start(i)
+        except Exception as e:
+            self.completed.put((None, e))
+
+    def results(self, until=None):
+        """
+        Run shards until those up to the given one, or all of them,
+        have completed, yielding the breakpoints and annotations of
+        every shard as it completes
+        int -> iterator
+        """
+        if self.thread is None:
+            print(
+                timestamp()
+                + "Running VEP on %d shards, %d at a time with %d forks each..."
+                % (len(self.shards), self.processes, self.forks)
+            )
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        last = len(self.shards) - 1
+        if until is not None:
+            last = min(until, last)
+        while self.ready < last:
+            try:
+                # Waits with a timeout so that the main thread can be
+                # interrupted
+                with stage("vep.wait"):
+                    i, status = self.completed.get(True, 1)
+            except Queue.Empty:
+                continue
+            yield self.take(i, status)
+        # Also take the shards that completed beyond the last one, but
+        # not those completing meanwhile
+        for _ in range(self.completed.qsize()):
+            yield self.take(*self.completed.get())
+
+    def take(self, i, status):
+        """
+        Get the annotations of a completed shard
+        int, int -> (df, list)
+        """
+        if i is None or isinstance(status, Exception):
+            raise status
+        if status:
+            raise subprocess.CalledProcessError(status, " ".join(self.command(i)))
+        self.finished.add(i)
+        return self.shards[i], self.outputs.pop(i)
+
+    def close(self):
+        """
+        Stop the VEP processes still running
+        None -> None
+        """
+        with self.lock:
+            self.closed = True
+            for process in self.running.values():
+                if process.poll() is None:
+                    process.terminate()
+        if self.thread is not None:
+            # Wakes the thread if it waits for a free process slot
+            self.slots.release()
+            self.thread.join()
+        for reader in self.readers:
+            reader.join()
+
+
+def read_vep_line(line, transcripts=None):
+    """
+    Get the cDNA annotations of a line of VEP JSON output as
+    (chrom, pos, transcript, hgvsc) tuples, for the given transcripts
+    or all of them
+    str, frozenset -> list
+    """
+    # Most intergenic breakpoints have no transcript consequences
+    if "transcript_consequences" not in line:
+        return []
+    record = json.loads(line)
+    consequences = record.get("transcript_consequences")
+    if not isinstance(consequences, list):
+        return []
+    chrom, pos = record["id"].replace("_N/-", "").replace("_", ":").split(":")
+    annotations = []
+    for consequence in consequences:
+        transcript = consequence["transcript_id"]
+        if transcripts is not None and transcript not in transcripts:
+            continue
+        hgvsc = consequence.get("hgvsc")
+        annotations.append(
+            (chrom, int(pos), transcript, clean_hgvsc(hgvsc) if hgvsc else NO_HGVSC)
         )
-        .stack()
-        .reset_index(name="transcript_consequences")[["id", "transcript_consequences"]]
-    )
-    print(timestamp() + "Coverted to long.")
-    annotation_results[["hgvsc", "transcript_id"]] = annotation_results[
-        "transcript_consequences"
-    ].apply(pd.Series)[["hgvsc", "transcript_id"]]
-    print(timestamp() + "Expanded columns.")
-    annotation_results.drop(["transcript_consequences"], axis=1, inplace=True)
-    annotation_results["hgvsc"] = (
-        annotation_results["hgvsc"].str.replace(r".*:", "").str.replace(r"del.*", "")
-    )
-    print(timestamp() + "Completed parsing JSON results")
-    return annotation_results
+    return annotations
 
 
 def get_cdna_pos_from_cache(bkp, cache):
     cdna = None
     for tx in bkp.transcript:
-        try:
-            query_cdna = cache[
-                (cache["id"].values == ":".join([bkp.chrom, str(bkp.pos)]))
-                & (cache["transcript_id"].values == tx)
-            ]["hgvsc"].tolist()[0]
-            if query_cdna.startswith("c.-") or query_cdna.startswith("c.*"):
-                continue
-            else:
-                cdna = str(query_cdna)
-                break
-        except (KeyError, IndexError) as e:
+        query_cdna = cache.get(bkp.chrom, bkp.pos, tx)
+        count("vep_cache.misses" if query_cdna is None else "vep_cache.hits")
+        if query_cdna is None:
             cdna = "chr" + bkp.chrom + ":g." + str(bkp.pos)
+        elif query_cdna == NO_HGVSC:
+            # VEP reported the transcript without a cDNA position
+            raise cdnaNotFound("%s:%s %s" % (bkp.chrom, bkp.pos, tx))
+        elif query_cdna.startswith("c.-") or query_cdna.startswith("c.*"):
+            continue
+        else:
+            cdna = str(query_cdna)
+            break
     if cdna is None:
         cdna = "chr" + bkp.chrom + ":g." + str(bkp.pos)
     return tx, cdna
 
 
 def get_cdna_pos_from_api(bkp):
-    dummy_ref = "C"
-    query = make_query(bkp, dummy_ref)
-    cdna = None
-
-    # get request max twice to VEP for annotation
-    request = make_get_request(query)
-    if not request.ok:
-        s = request.text
-        actual_ref = s[s.find("(") + 1 : s.find(")")]
-        if actual_ref not in ["A", "C", "G", "T"] or actual_ref == dummy_ref:
-            request.raise_for_status()
-        else:
-            query = make_query(bkp, actual_ref)
-            request = make_get_request(query)
-            if not request.ok:
-                request.raise_for_status()
-    decoded = request.json()
-    try:
-        result = dict(str(s).split(":", 1) for s in decoded[0]["hgvsc"])
-    except KeyError:
-        result = {}
-        logger.warning("Cannot find any cDNA annotations for gene " + bkp.gene)
-    for tx in bkp.transcript:
-        if tx in result:
-            query_cdna = result[tx]
-            if query_cdna.startswith("c.-") or query_cdna.startswith("c.*"):
-                pass
-            else:
-                cdna = query_cdna[:-3]
-                break
-    if not cdna:
-        cdna = "chr" + bkp.chrom + ":g." + str(bkp.pos)
-    return tx, cdna
-
-
-def make_get_request(query):
     """
-    Generate query string in the format required by vep
-    str -> request
+    Get cdna position for a bkp object by querying the
+    Ensembl REST API
+    bkp -> tuple
     """
-    server = "http://grch37.rest.ensembl.org"
-    ext = "/variant_recoder/human/" + query
-    try:
-        request = requests.get(
-            server + ext, headers={"Content-Type": "application/json"}, timeout=5
-        )
-    except requests.ConnectionError as e:
-        raise e
-    except requests.exceptions.RequestException as e:
-        raise e
-    return request
+    from rest import get_resolver
 
-
-def make_query(bkp, dummy_ref):
-    """
-    Make dummy query string for the second
-    request sent to vep server
-    bkp, str -> str
-    """
-    chrom, coord = bkp.chrom, bkp.pos
-    revcomp = {"A": "T", "T": "A", "C": "G", "G": "C", "N": "N"}
-    dummy_alt = revcomp[dummy_ref]
-    query = chrom + ":g." + str(coord) + dummy_ref + ">" + dummy_alt + "?"
-    return query
+    cache = vep_cache()
+    for chrom, pos, tx, hgvsc in get_resolver().resolve([(bkp.chrom, bkp.pos)]):
+        cache.add(chrom, pos, tx, hgvsc)
+    if not len(cache):
+        logger.warning("Cannot find any cDNA annotations for gene " + bkp.gene)
+    return get_cdna_pos_from_cache(bkp, cache)
 
 
 class Error(Exception):
@@ -603,3 +1167,38 @@ class BothBreakpointsNoncoding(Error):
             self,
             "Atleast one of the breakpoints need to be in target panel and in coding region",
         )
+
+
+class InputNotSeekable(Error):
+    """Raised when a streamed input file cannot be read twice"""
+
+    def __init__(self, name):
+        Exception.__init__(
+            self,
+            "Streaming with --stream_chunksize reads the input twice, but %s "
+            "cannot be rewound. Pass a regular file or drop --stream_chunksize."
+            % name,
+        )
+
+
+class OutputFormatUnavailable(Error):
+    """Raised when the modules writing an output format are not installed"""
+
+    def __init__(self, output_format):
+        Exception.__init__(
+            self,
+            "Writing %s output requires pyarrow. Install it or choose "
+            "another --out_format." % output_format,
+        )
+
+
+class NotAnnotatedOutput(Error):
+    """Raised when a file to annotate again is not an annotated output"""
+
+    def __init__(self, path):
+        Exception.__init__(
+            self,
+            "%s is not an output of svannotate: --reannotate_from reads tsv "
+            "output, optionally gzip or bgzip compressed, with the Note, "
+            "Annotation, Position and oncokb_sv_type columns." % path,
+        )
@@ -4,28 +4,27 @@ import os
 import sys
 import re
 import logging
-import pandas as pd
-import numpy as np
-from main.models import bkp
+from main.models import bkp, partner_signature
 
 logger = logging.getLogger("basic_logger")
 
 
-def get_bkp_info(bkp, refFlat_summary, orientation, fusion=0):
+def get_bkp_info(bkp, exon_index, orientation, fusion=0, memo=None):
     """
     Get exon and intron features for a breakpoint object
-    bkp, df, int, int -> None
+    bkp, exon_index, int, int, breakpoint_memo -> None
     """
-    try:
-        bkp_dict = (
-            refFlat_summary[
-                (refFlat_summary["Gene"].values == bkp.gene)
-                & (refFlat_summary["Transcript"].values == bkp.transcript)
-            ]
-            .to_dict("records")
-            .pop()
+    if memo is not None:
+        return memo.apply(
+            get_bkp_info,
+            bkp,
+            ("chrom", "pos", "gene", "desc", "transcript", "strand"),
+            exon_index,
+            orientation,
+            fusion,
         )
-    except IndexError:
+    record = exon_index.get(bkp.gene, bkp.transcript)
+    if record is None:
         raise Exception(
             "Exon and Intron information not found for %s in refFlat_summary."
             % (bkp.gene)
@@ -34,11 +33,11 @@ def get_bkp_info(bkp, refFlat_summary, orientation, fusion=0):
     # bkp.firstexon is hard-coded to 1 to follow
     # existing practice on IMPACT
     bkp.firstexon = "1"
-    bkp.lastexon = str(bkp_dict["last_exon"])
-    if bkp_dict["Strand"] == "+":
-        bkp.startpos, bkp.stoppos = bkp_dict["pos1"], bkp_dict["pos2"]
+    bkp.lastexon = str(record.last_exon)
+    if record.strand == "+":
+        bkp.startpos, bkp.stoppos = record.pos1, record.pos2
     else:
-        bkp.startpos, bkp.stoppos = bkp_dict["pos2"], bkp_dict["pos1"]
+        bkp.startpos, bkp.stoppos = record.pos2, record.pos1
     bkp.exon, bkp.intron, bkp.site = [""] * 3
     if bkp.desc.startswith("Exon "):
         bkp.exon = bkp.desc.split(" ")[1]
@@ -144,99 +143,106 @@ def get_exon_order(bkp, order):
         return "exons %s - %s" % ordert
 
 
-def get_exons_involved(sv, refFlat_summary):
+def fusion_exons(sv, exon_index, memo):
+    get_bkp_info(sv.fusionPartner1, exon_index, 1, 1, memo)
+    get_bkp_info(sv.fusionPartner2, exon_index, 2, 1, memo)
+    sv.bkpsites = get_bkpsite_note(sv, sv.fusionPartner1, sv.fusionPartner2)
+    note1 = sv.fusionPartner1.gene + " " + get_exon_order(sv.fusionPartner1, 3)
+    note2 = sv.fusionPartner2.gene + " " + get_exon_order(sv.fusionPartner2, 4)
+    if sv.isKnownFusion:
+        sv.exons = "%s and %s." % (note1, note2)
+    else:
+        sv.exons = "%s to %s." % (note1, note2)
+
+
+def partners_info(sv, exon_index, memo):
+    get_bkp_info(sv.annotationPartner1, exon_index, 1, 0, memo)
+    get_bkp_info(sv.annotationPartner2, exon_index, 2, 0, memo)
+
+
+def translocation_exons(sv, exon_index, memo):
+    partners_info(sv, exon_index, memo)
+    sv.exons = "%s %s and %s %s." % (
+        sv.annotationPartner1.gene,
+        sv.annotationPartner1.site,
+        sv.annotationPartner2.gene,
+        sv.annotationPartner2.site,
+    )
+
+
+def intragenic_exons(sv, exon_index, memo):
+    partners_info(sv, exon_index, memo)
+    partner1, partner2 = sv.annotationPartner1, sv.annotationPartner2
+    intra1, intra2 = (1, 2) if partner1.strand == "+" else (2, 1)
+    get_bkp_info(partner1, exon_index, intra1, 0, memo)
+    get_bkp_info(partner2, exon_index, intra2, 0, memo)
+    sv.bkpsites = get_bkpsite_note(sv, partner1, partner2)
+    intron1, intron2 = partner1.intron, partner2.intron
+    if intron1 and intron2 and intron1 == intron2:
+        sv.exons = "intron %s." % (intron1)
+    elif not partner1.exon == partner2.exon:
+        sv.exons = "exons %s - %s." % (partner1.exon, partner2.exon)
+    else:
+        sv.exons = "exon %s." % (partner1.exon)
+    partner1.variantSite1, partner2.variantSite1 = [partner1.pos] * 2
+    partner1.variantSite2, partner2.variantSite2 = [partner2.pos] * 2
+
+
+def genes_exons(sv, exon_index, memo):
+    partners_info(sv, exon_index, memo)
+    sv.bkpsites = get_bkpsite_note(sv, sv.annotationPartner1, sv.annotationPartner2)
+    note1 = sv.annotationPartner1.gene + " " + get_exon_order(sv.annotationPartner1, 1)
+    note2 = sv.annotationPartner2.gene + " " + get_exon_order(sv.annotationPartner2, 2)
+    sv.exons = "%s and %s." % (note1, note2)
+
+
+def partner_exons(sv, exon_index, memo, orientation, translocation):
+    if orientation == 1:
+        partner, b1, b2 = sv.annotationPartner1, sv.annotationPartner1, None
+    else:
+        partner, b1, b2 = sv.annotationPartner2, None, sv.annotationPartner2
+    get_bkp_info(partner, exon_index, orientation, 0, memo)
+    if translocation:
+        note1 = "%s" % (partner.site)
+    else:
+        sv.bkpsites = get_bkpsite_note(sv, b1, b2)
+        note1 = get_exon_order(partner, orientation)
+    sv.exons = "%s." % (note1)
+
+
+# Exon notes by the partner signature of the sv and whether it is a
+# translocation
+EXON_RULES = {
+    ("fusion", True): fusion_exons,
+    ("fusion", False): fusion_exons,
+    ("both", True): translocation_exons,
+    ("intragenic", True): translocation_exons,
+    ("both", False): genes_exons,
+    ("intragenic", False): intragenic_exons,
+    ("first", True): lambda sv, exon_index, memo: partner_exons(
+        sv, exon_index, memo, 1, True
+    ),
+    ("first", False): lambda sv, exon_index, memo: partner_exons(
+        sv, exon_index, memo, 1, False
+    ),
+    ("second", True): lambda sv, exon_index, memo: partner_exons(
+        sv, exon_index, memo, 2, True
+    ),
+    ("second", False): lambda sv, exon_index, memo: partner_exons(
+        sv, exon_index, memo, 2, False
+    ),
+}
+
+
+def get_exons_involved(sv, exon_index, memo=None):
     """
     Get exons involved in an sv object based on the variant type
     and the breakpoint sites
-    (sv, df) -> None
+    (sv, exon_index, breakpoint_memo) -> None
     """
     sv.bkpsites = ""
-    if sv.isFusion:
-        get_bkp_info(sv.fusionPartner1, refFlat_summary, 1, 1)
-        get_bkp_info(sv.fusionPartner2, refFlat_summary, 2, 1)
-        sv.bkpsites = get_bkpsite_note(sv, sv.fusionPartner1, sv.fusionPartner2)
-        note1 = sv.fusionPartner1.gene + " " + get_exon_order(sv.fusionPartner1, 3)
-        note2 = sv.fusionPartner2.gene + " " + get_exon_order(sv.fusionPartner2, 4)
-        if sv.isKnownFusion:
-            sv.exons = "%s and %s." % (note1, note2)
-        else:
-            sv.exons = "%s to %s." % (note1, note2)
-    elif all(
-        [
-            sv.annotationPartner1.isPanel,
-            sv.annotationPartner2.isPanel,
-            sv.annotationPartner1.isCoding,
-            sv.annotationPartner2.isCoding,
-        ]
-    ):
-        get_bkp_info(sv.annotationPartner1, refFlat_summary, 1)
-        get_bkp_info(sv.annotationPartner2, refFlat_summary, 2)
-        if sv.svtype == "TRANSLOCATION":
-            sv.exons = "%s %s and %s %s." % (
-                sv.annotationPartner1.gene,
-                sv.annotationPartner1.site,
-                sv.annotationPartner2.gene,
-                sv.annotationPartner2.site,
-            )
-        elif sv.isIntragenic:
-            intra1, intra2 = (1, 2) if sv.annotationPartner1.strand == "+" else (2, 1)
-            get_bkp_info(sv.annotationPartner1, refFlat_summary, intra1)
-            get_bkp_info(sv.annotationPartner2, refFlat_summary, intra2)
-            sv.bkpsites = get_bkpsite_note(
-                sv, sv.annotationPartner1, sv.annotationPartner2
-            )
-            if all(
-                [
-                    sv.annotationPartner1.intron,
-                    sv.annotationPartner2.intron,
-                    sv.annotationPartner1.intron == sv.annotationPartner2.intron,
-                ]
-            ):
-                sv.exons = "intron %s." % (sv.annotationPartner1.intron)
-            elif not sv.annotationPartner1.exon == sv.annotationPartner2.exon:
-                sv.exons = "exons %s - %s." % (
-                    sv.annotationPartner1.exon,
-                    sv.annotationPartner2.exon,
-                )
-            else:
-                sv.exons = "exon %s." % (sv.annotationPartner1.exon)
-            sv.annotationPartner1.variantSite1, sv.annotationPartner2.variantSite1 = [
-                sv.annotationPartner1.pos
-            ] * 2
-            sv.annotationPartner1.variantSite2, sv.annotationPartner2.variantSite2 = [
-                sv.annotationPartner2.pos
-            ] * 2
-        else:
-            sv.bkpsites = get_bkpsite_note(
-                sv, sv.annotationPartner1, sv.annotationPartner2
-            )
-            note1 = (
-                sv.annotationPartner1.gene
-                + " "
-                + get_exon_order(sv.annotationPartner1, 1)
-            )
-            note2 = (
-                sv.annotationPartner2.gene
-                + " "
-                + get_exon_order(sv.annotationPartner2, 2)
-            )
-            sv.exons = "%s and %s." % (note1, note2)
-    elif sv.annotationPartner1.isPanel and sv.annotationPartner1.isCoding:
-        get_bkp_info(sv.annotationPartner1, refFlat_summary, 1)
-        if sv.svtype == "TRANSLOCATION":
-            note1 = "%s" % (sv.annotationPartner1.site)
-        else:
-            sv.bkpsites = get_bkpsite_note(sv, sv.annotationPartner1, None)
-            note1 = get_exon_order(sv.annotationPartner1, 1)
-        sv.exons = "%s." % (note1)
-    else:
-        get_bkp_info(sv.annotationPartner2, refFlat_summary, 2)
-        if sv.svtype == "TRANSLOCATION":
-            note1 = "%s" % (sv.annotationPartner2.site)
-        else:
-            sv.bkpsites = get_bkpsite_note(sv, None, sv.annotationPartner2)
-            note1 = get_exon_order(sv.annotationPartner2, 2)
-        sv.exons = "%s." % (note1)
+    signature = partner_signature(sv, sv.isFusion)
+    EXON_RULES[signature, sv.svtype == "TRANSLOCATION"](sv, exon_index, memo)
     return
 
 
@@ -249,34 +255,40 @@ def getOverlap(a, b):
     return max(0, min(a[1], b[1]) - max(a[0], b[0]))
 
 
-def get_kinase_status(bkp, kinase_annotation):
+def get_kinase_status(bkp, kinase_domains, memo=None):
     """
     Get kinase domain annotation for a given bkp
-    bkp, df -> (str or None)
+    bkp, kinase_domain_index, breakpoint_memo -> (str or None)
     """
     bkp.isEntireKinase = None
     if not bkp.isKinase:
         return
-    interval, kinase_interval = [[]] * 2
-    try:
-        interval.extend([bkp.variantSite1, bkp.variantSite2])
-        if bkp.strand == "-":
-            interval.sort()
-        kinase_interval = (
-            kinase_annotation[(kinase_annotation["HUGO"].values == bkp.gene)]
-            .iloc[0, [1, 4]]
-            .values.tolist()
+    if memo is not None:
+        return memo.apply(
+            get_kinase_status,
+            bkp,
+            ("gene", "strand", "isKinase", "variantSite1", "variantSite2"),
+            kinase_domains,
         )
-        kinase_interval.sort()
-    except AttributeError:
+    interval, kinase_interval = [[]] * 2
+    if bkp.variantSite1 is None or bkp.variantSite2 is None:
         e = (
             "Breakpoint site positions cannot be determined "
             "for gene %s. Check if the raw SV call was made on "
             "Canonical transcript."
         ) % (bkp.gene)
         logger.warning(e)
-    except (IndexError, NameError, ValueError):
-        logger.warning("Cannot find kinase domain information for %s" % (bkp.gene))
+    else:
+        try:
+            interval.extend([bkp.variantSite1, bkp.variantSite2])
+            if bkp.strand == "-":
+                interval.sort()
+            kinase_interval = list(kinase_domains[bkp.gene])
+            kinase_interval.sort()
+        except (KeyError, ValueError):
+            logger.warning(
+                "Cannot find kinase domain information for %s" % (bkp.gene)
+            )
     if interval and kinase_interval:
         interval, kinase_interval = map(
             lambda x: [int(y) for y in x], (interval, kinase_interval)
@@ -310,64 +322,61 @@ def get_kinase_note(bkp):
             return "does not include the kinase domain of % s" % (bkp.gene)
 
 
+# Note prefixes, formatted with the genes and transcripts of the
+# annotation, the conjunction and the SV type
+PREFIXES = {
+    "known_fusion": "The {0} involves ",
+    "fusion": "The {0}{1}{2} that results in a fusion of ",
+    "intron": "The {0}{1}intragenic {2} with breakpoints in ",
+    "intragenic": "The {0}{1}intragenic {2} of ",
+    "translocation": "The {0}{1}{2} with breakpoints in ",
+    "translocation_partner": "The {0}{1}{2} with a breakpoint in ",
+    "other": "The {0}{1}{2} of ",
+}
+TRANSCRIPT = re.compile(r" \(NM_[0-9]+\)")
+
+
+def prefix_kind(sv):
+    """
+    Get the kind of note prefix of an sv
+    sv -> str
+    """
+    if sv.isKnownFusion:
+        return "known_fusion"
+    if sv.isFusion:
+        return "fusion"
+    if sv.isIntragenic:
+        intron1, intron2 = sv.annotationPartner1.intron, sv.annotationPartner2.intron
+        return "intron" if intron1 and intron2 and intron1 == intron2 else "intragenic"
+    if sv.svtype == "TRANSLOCATION":
+        if partner_signature(sv, False) in ("both", "intragenic"):
+            return "translocation"
+        return "translocation_partner"
+    return "other"
+
+
 def get_prefix(sv):
     """
     Get the prefix of a note based on variant type
     sv -> None
     """
-    prefix = "The "
     if sv.svtype == "INVERSION" or sv.isIntragenic:
         conj = " is an "
     else:
         conj = " is a "
-    if sv.isKnownFusion:
-        prefix += str(sv.annotation.split(":")[0]) + " involves "
-    elif sv.isFusion:
-        prefix += (
-            str(sv.annotation.split(":")[0])
-            + conj
-            + sv.svtype.lower()
-            + " that results in a fusion of "
-        )
-    elif sv.isIntragenic:
-        if all(
-            [
-                sv.annotationPartner1.intron,
-                sv.annotationPartner2.intron,
-                sv.annotationPartner1.intron == sv.annotationPartner2.intron,
-            ]
-        ):
-            prefix += (
-                str(sv.annotation.split(":")[0])
-                + conj
-                + "intragenic "
-                + sv.svtype.lower()
-                + " with breakpoints in "
-            )
-        else:
-            prefix += (
-                str(sv.annotation.split(":")[0])
-                + conj
-                + "intragenic "
-                + sv.svtype.lower()
-                + " of "
-            )
-    elif sv.svtype == "TRANSLOCATION":
-        if all(
-            [
-                sv.annotationPartner1.isPanel,
-                sv.annotationPartner2.isPanel,
-                sv.annotationPartner1.isCoding,
-                sv.annotationPartner2.isCoding,
-            ]
-        ):
-            TRA_join = " with breakpoints in "
-        else:
-            TRA_join = " with a breakpoint in "
-        prefix += str(sv.annotation.split(":")[0]) + conj + sv.svtype.lower() + TRA_join
-    else:
-        prefix += str(sv.annotation.split(":")[0]) + conj + sv.svtype.lower() + " of "
-    sv.prefix = re.sub(r" \(NM_[0-9]+\)", "", prefix, count=2)
+    prefix = PREFIXES[prefix_kind(sv)].format(
+        str(sv.annotation.split(":")[0]), conj, sv.svtype.lower()
+    )
+    sv.prefix = TRANSCRIPT.sub("", prefix, count=2)
+
+
+# Kinase note of the second partner, without its gene, when both
+# partners have the same kinase domain status
+KINASE_NOTE = re.compile(
+    r"\bdoes not include the kinase domain of \b|"
+    r"\bincludes the kinase domain of \b|"
+    r"\bincludes a part of the kinase domain of \b"
+)
 
 
 def get_misc_notes(sv):
@@ -383,35 +392,16 @@ def get_misc_notes(sv):
     misc_note, frame_note = [None] * 2
     if sv.isFusion and "in frame" in sv.description:
         frame_note = "is predicted to be in frame"
+    partner1, partner2 = sv.annotationPartner1, sv.annotationPartner2
     if sv.isIntragenic:
-        kinase1, kinase2 = get_kinase_note(sv.annotationPartner1), None
+        kinase1, kinase2 = get_kinase_note(partner1), None
     else:
-        kinase1, kinase2 = map(
-            lambda x: get_kinase_note(x), (sv.annotationPartner1, sv.annotationPartner2)
-        )
-    if all(
-        [
-            kinase1,
-            kinase2,
-            sv.annotationPartner1.isEntireKinase
-            == sv.annotationPartner2.isEntireKinase,
-        ]
-    ):
-        regex_str = (
-            r"\b"
-            + "does not include the kinase domain of "
-            + r"\b|"
-            + r"\b"
-            + "includes the kinase domain of "
-            + r"\b|"
-            + r"\b"
-            + "includes a part of the kinase domain of "
-            + r"\b"
-        )
-        kinase2 = re.sub(regex_str, "", kinase2, count=1)
+        kinase1, kinase2 = get_kinase_note(partner1), get_kinase_note(partner2)
+    if kinase1 and kinase2 and partner1.isEntireKinase == partner2.isEntireKinase:
+        kinase2 = KINASE_NOTE.sub("", kinase2, count=1)
         kinase1 = kinase1.replace("domain", "domains").replace("a part", "parts")
     misc_note = " and ".join(
-        filter(lambda x: isinstance(x, str), [frame_note, kinase1, kinase2])
+        [note for note in (frame_note, kinase1, kinase2) if isinstance(note, str)]
     )
     if misc_note:
         sv.misc = " %s %s." % (prefix, misc_note)
@@ -444,31 +434,39 @@ def clinical_warning_note(sv):
     return warning_note
 
 
+UNDETERMINED = " Functional significance is undetermined."
+
+
+def is_coding_suppressor(bkp):
+    return bkp.isPanel and bkp.isCoding and bkp.isTumourSuppressor
+
+
 def functional_significance(sv):
     """
     Determine if functional significance note is neccessary
     based on variant type
     sv -> None
     """
+    partner1, partner2 = sv.annotationPartner1, sv.annotationPartner2
     func_sig_note = ""
     if sv.isKnownFusion:
         pass
-    elif all([sv.annotationPartner1.isKinase, sv.annotationPartner1.isHotspot]) or all(
-        [sv.annotationPartner2.isKinase, sv.annotationPartner2.isHotspot]
+    elif (partner1.isKinase and partner1.isHotspot) or (
+        partner2.isKinase and partner2.isHotspot
     ):
         func_sig_note = clinical_warning_note(sv)
-    elif sv.svtype == "DELETION" and any(
-        [
-            all([sv.bkp1.isPanel, sv.bkp1.isCoding, sv.bkp1.isTumourSuppressor]),
-            all([sv.bkp2.isPanel, sv.bkp2.isCoding, sv.bkp2.isTumourSuppressor]),
-        ]
+    elif sv.svtype == "DELETION" and (
+        is_coding_suppressor(sv.bkp1) or is_coding_suppressor(sv.bkp2)
     ):
         pass
     else:
-        func_sig_note = " Functional significance is undetermined."
+        func_sig_note = UNDETERMINED
     sv.sig = func_sig_note
 
 
+EXON_RANGE = re.compile(r"exons \d+ - \d+")
+
+
 def special_cases(sv):
     """
     Returns a customized note for special cases
@@ -482,13 +480,9 @@ def special_cases(sv):
     }
     custom_note = sv.Note
     if sv.annotation.startswith("EGFR (NM_005228) rearrangement:"):
-        if re.search(r"exons \d+ - \d+", sv.Note):
-            exon1, exon2 = (
-                re.search(r"exons \d+ - \d+", sv.Note)
-                .group()
-                .replace("exons ", "")
-                .split(" - ")
-            )
+        exons = EXON_RANGE.search(sv.Note)
+        if exons:
+            exon1, exon2 = exons.group().replace("exons ", "").split(" - ")
             if all([exon1 == "2", exon2 == "7", sv.svtype != "DUPLICATION"]):
                 custom_note = special_case_notes["vIII"]
             elif all(
@@ -572,6 +566,13 @@ def get_bkpsite_note(sv, b1=None, b2=None):
     return bkps_note
 
 
+POSITION_JOIN = re.compile(
+    r"\bof \b|\binvolves \b|\bwith breakpoints in \b|\bwith a breakpoint in \b"
+)
+# Characters that make a prefix match other text than itself
+PATTERN_CHARS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
 def get_position(sv):
     """
     Derive position string from notes
@@ -586,13 +587,14 @@ def get_position(sv):
             sv.fusionPartner2.exon,
         )
     else:
-        position = re.sub(str(sv.prefix), "", note_local, count=1)
-        position = re.sub(
-            r"\bof \b|\binvolves \b|\bwith breakpoints in \b|\bwith a breakpoint in \b",
-            "",
-            position,
-            count=1,
-        )
+        # The prefix is removed as a pattern. Most prefixes match only
+        # themselves and are removed as text, without compiling them.
+        prefix = str(sv.prefix)
+        if PATTERN_CHARS.search(prefix):
+            position = re.sub(prefix, "", note_local, count=1)
+        else:
+            position = note_local.replace(prefix, "", 1)
+        position = POSITION_JOIN.sub("", position, count=1)
     return position
 
 
@@ -662,15 +664,15 @@ def get_sv_oncokb_type(sv):
                 return special_vars[i]
 
 
-def get_notes(sv, refFlat_summary, kinase_annotation):
+def get_notes(sv, exon_index, kinase_domains, memo=None):
     """
     Main note function to call relevant helper functions
-    sv, df, df -> tuple
+    sv, exon_index, kinase_domain_index, breakpoint_memo -> tuple
     """
     # Get exons and breakpoints invovled in SV
-    get_exons_involved(sv, refFlat_summary)
+    get_exons_involved(sv, exon_index, memo)
     # Get kinase domain annotation
-    map(lambda bkp: get_kinase_status(bkp, kinase_annotation), (sv.bkp1, sv.bkp2))
+    map(lambda bkp: get_kinase_status(bkp, kinase_domains, memo), (sv.bkp1, sv.bkp2))
     # Override status of known fusion if necessary
     override_fusion(sv)
     # Get the first statement of clinical SV note
@@ -0,0 +1,265 @@
+#!/usr/bin/env python2
+import os
+import json
+import time
+import pstats
+import cProfile
+import resource
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Number of functions and allocation sites listed per process
+TOP = 25
+
+
+class _null_stage(object):
+    """
+    Stage used while profiling is disabled
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = _null_stage()
+
+
+class _stage(object):
+    """
+    Time a block as a stage of a profiler
+    """
+
+    __slots__ = ("profiler", "name", "wall", "cpu")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall, self.cpu = time.time(), time.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(
+            self.name, time.time() - self.wall, time.clock() - self.cpu
+        )
+        return False
+
+
+class profiler(object):
+    """
+    Per-process record of wall and CPU time per stage and of event
+    counters. Stages may nest, so the time of a stage includes the
+    time of the stages run within it. Optionally the process is also
+    run under cProfile and, where available, tracemalloc.
+    """
+
+    def __init__(self, role, dump_dir=None):
+        self.role = role
+        self.pid = os.getpid()
+        self.dump_dir = dump_dir
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.function_profile = None
+        if dump_dir:
+            self.function_profile = cProfile.Profile()
+            self.function_profile.enable()
+            if tracemalloc is not None:
+                tracemalloc.start()
+
+    def stage(self, name):
+        return _stage(self, name)
+
+    def add(self, name, wall, cpu):
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        """
+        Stop function profiling and get the report of this process,
+        dumping cProfile stats and tracemalloc snapshots if enabled
+        None -> dict
+        """
+        report = {
+            "role": self.role,
+            "pid": self.pid,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+            "stages": stage_stats(self.stages),
+            "counters": dict(self.counters),
+        }
+        if self.function_profile is not None:
+            self.function_profile.disable()
+            path = os.path.join(self.dump_dir, "%s-%d.prof" % (self.role, self.pid))
+            self.function_profile.dump_stats(path)
+            report["cprofile"] = path
+            report["top_functions"] = top_functions(path)
+            if tracemalloc is not None and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                path = os.path.join(
+                    self.dump_dir, "%s-%d.tracemalloc" % (self.role, self.pid)
+                )
+                snapshot.dump(path)
+                report["tracemalloc"] = path
+                report["top_allocations"] = [
+                    {"site": str(s.traceback), "size_kb": s.size / 1024.0, "count": s.count}
+                    for s in snapshot.statistics("lineno")[:TOP]
+                ]
+                tracemalloc.stop()
+        return report
+
+
+def stage_stats(stages):
+    """
+    Convert [calls, wall, cpu] stage lists to report entries
+    dict -> dict
+    """
+    return dict(
+        (name, {"calls": calls, "wall": wall, "cpu": cpu})
+        for name, (calls, wall, cpu) in stages.items()
+    )
+
+
+def top_functions(path, n=TOP):
+    """
+    Get the functions with the highest cumulative time from a
+    cProfile dump
+    str, int -> list
+    """
+    stats = pstats.Stats(path).stats
+    rows = sorted(stats.items(), key=lambda x: x[1][3], reverse=True)[:n]
+    return [
+        {
+            "function": "%s:%d(%s)" % func,
+            "calls": ncalls,
+            "tottime": tottime,
+            "cumtime": cumtime,
+        }
+        for func, (_, ncalls, tottime, cumtime, _) in rows
+    ]
+
+
+def merge_reports(reports):
+    """
+    Merge the reports of all processes of a run, summing stage
+    times and counters. Every pair of "<name>.hits" and
+    "<name>.misses" counters is also reported as a hit rate.
+    list -> dict
+    """
+    stages, counters = {}, {}
+    for report in reports:
+        for name, stats in report["stages"].items():
+            merged = stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            for key in merged:
+                merged[key] += stats[key]
+        for name, n in report["counters"].items():
+            counters[name] = counters.get(name, 0) + n
+    hit_rates = {}
+    for name in counters:
+        prefix, _, kind = name.rpartition(".")
+        if kind in ("hits", "misses") and prefix not in hit_rates:
+            hits = counters.get(prefix + ".hits", 0)
+            misses = counters.get(prefix + ".misses", 0)
+            hit_rates[prefix] = float(hits) / (hits + misses)
+    return {
+        "processes": len(reports),
+        "stages": stages,
+        "counters": counters,
+        "hit_rates": hit_rates,
+        "by_process": reports,
+    }
+
+
+_profiler = None
+
+
+def enable(role, dump_dir=None):
+    """
+    Start profiling this process
+    str, str -> profiler
+    """
+    global _profiler
+    _profiler = profiler(role, dump_dir)
+    return _profiler
+
+
+def stage(name):
+    """
+    Time a block as a named stage if profiling is enabled
+    str -> context manager
+    """
+    if _profiler is None:
+        return NULL_STAGE
+    return _profiler.stage(name)
+
+
+def count(name, n=1):
+    """
+    Add to a named counter if profiling is enabled
+    str, int -> None
+    """
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+
+def timed(iterable, name):
+    """
+    Time every step of an iterator as a stage
+    iterable, str -> iterator
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def worker_report_path(report_dir, pid):
+    return os.path.join(report_dir, "worker-%d.json" % pid)
+
+
+def write_worker_report(report_dir):
+    """
+    Write the report of a worker process on exit, to be merged by
+    the parent
+    str -> None
+    """
+    if _profiler is not None:
+        with open(worker_report_path(report_dir, os.getpid()), "w") as f:
+            json.dump(_profiler.report(), f)
+
+
+def collect_worker_reports(report_dir):
+    """
+    Read and remove the reports written by worker processes
+    str -> list
+    """
+    reports = []
+    for name in sorted(os.listdir(report_dir)):
+        if name.startswith("worker-") and name.endswith(".json"):
+            path = os.path.join(report_dir, name)
+            with open(path) as f:
+                reports.append(json.load(f))
+            os.remove(path)
+    return reports
@@ -0,0 +1,165 @@
+#!/usr/bin/env python2
+import os
+from reference import reference_set, cytoband_index
+
+
+def open_references(path):
+    """
+    Open an earlier version of the references, either a reference
+    bundle or a directory of reference tables read along with the
+    current reference constants
+    str -> reference_set
+    """
+    if os.path.isdir(path):
+        return reference_set(data_dir=path)
+    return reference_set(bundle_path=path)
+
+
+def exon_state(references, gene, transcripts):
+    """
+    Get the exon summaries of the transcripts of a gene
+    reference_set, str, set -> dict
+    """
+    state = {}
+    for transcript in transcripts:
+        record = references.transcript_exons.get(gene, transcript)
+        if record is not None:
+            state[transcript] = (
+                record.strand,
+                record.last_exon,
+                record.pos1,
+                record.pos2,
+            )
+    return state
+
+
+def cytoband_rows(references):
+    """
+    Get the cytobands of a reference set as (chrom, start, stop,
+    band) rows
+    reference_set -> set
+    """
+    index = references.cytobands
+    return set(
+        row
+        for chrom in index.starts
+        for row in zip(
+            [chrom] * len(index.starts[chrom]),
+            index.starts[chrom],
+            index.stops[chrom],
+            index.labels[chrom],
+        )
+    )
+
+
+def diff_references(old, new):
+    """
+    Compare two versions of the references gene by gene: canonical
+    and reported transcripts, panel status, exon summaries, gene
+    classes, kinase domains and known fusions, and compare their
+    cytobands
+    reference_set, reference_set -> reference_changes
+    """
+    exon_transcripts = {}
+    for references in (old, new):
+        table = references.refflat_summary
+        for gene, transcript in zip(table["Gene"], table["Transcript"]):
+            exon_transcripts.setdefault(str(gene), set()).add(str(transcript))
+    genes = set(exon_transcripts)
+    for references in (old, new):
+        genes.update(str(gene) for gene in references.transcript_reference["Gene"])
+        genes.update(references.gene_classes)
+        genes.update(references.kinase_domains.domains)
+    fusions = set(old.oncokb) ^ set(new.oncokb)
+    genes_changed = set(gene for fusion in fusions for gene in fusion.split(":"))
+    transcripts_changed = set()
+    for gene in genes:
+        records = [references.gene_transcripts.get(gene) for references in (old, new)]
+        if records[0] != records[1]:
+            genes_changed.add(gene)
+            pairs = [
+                set(record.reported_transcripts.items()) if record else set()
+                for record in records
+            ]
+            transcripts_changed.update(tx for pair in pairs[0] ^ pairs[1] for tx in pair)
+        exons = [
+            exon_state(references, gene, exon_transcripts.get(gene, ()))
+            for references in (old, new)
+        ]
+        if exons[0] != exons[1]:
+            genes_changed.add(gene)
+            transcripts_changed.update(
+                tx
+                for tx in set(exons[0]) | set(exons[1])
+                if exons[0].get(tx) != exons[1].get(tx)
+            )
+        if old.gene_classes.get(gene) != new.gene_classes.get(gene) or (
+            old.kinase_domains.get(gene) != new.kinase_domains.get(gene)
+        ):
+            genes_changed.add(gene)
+    return reference_changes(
+        genes_changed, transcripts_changed, cytoband_rows(old) ^ cytoband_rows(new)
+    )
+
+
+class reference_changes(object):
+    """
+    Genes, transcripts and cytobands whose reference data differ
+    between two versions of the references. An SV is touched by the
+    changes when one of its genes changed or one of its breakpoints
+    falls in a changed cytoband; any other SV is annotated the same
+    with both versions.
+    """
+
+    def __init__(self, genes, transcripts, cytobands):
+        self.genes = frozenset(genes)
+        self.transcripts = frozenset(transcripts)
+        self.cytobands = sorted(cytobands)
+        self.cytoband_index = None
+        if self.cytobands:
+            chroms, starts, stops, labels = zip(*self.cytobands)
+            self.cytoband_index = cytoband_index(
+                {
+                    "Chr": chroms,
+                    "Bp_start": starts,
+                    "Bp_stop": stops,
+                    "Arm": labels,
+                    "Band": [""] * len(labels),
+                }
+            )
+
+    def summary(self):
+        """
+        Get the changes as sorted lists
+        None -> dict
+        """
+        return {
+            "genes": sorted(self.genes),
+            "transcripts": sorted(self.transcripts),
+            "cytobands": [list(row) for row in self.cytobands],
+        }
+
+    def touches(self, svs):
+        """
+        Check which SVs of a frame are touched by the changes
+        df -> array
+        """
+        touched = (
+            svs["Gene1"].isin(self.genes).values | svs["Gene2"].isin(self.genes).values
+        )
+        if self.cytoband_index is not None:
+            for chr_column, pos_column in (("Chr1", "Pos1"), ("Chr2", "Pos2")):
+                for i, (chrom, pos) in enumerate(zip(svs[chr_column], svs[pos_column])):
+                    try:
+                        touched[i] |= bool(self.cytoband_index.find(chrom, int(pos)))
+                    except (TypeError, ValueError):
+                        continue
+        return touched
+
+    def select(self, sv_chunks):
+        """
+        Get the SVs touched by the changes from chunks of SVs
+        iterable -> iterator
+        """
+        for svs in sv_chunks:
+            yield svs[self.touches(svs)]
@@ -0,0 +1,486 @@
+#!/usr/bin/env python2
+import os
+import csv
+import bisect
+import logging
+import numpy as np
+from collections import namedtuple
+from constants import (
+    ideogram_9606_GCF_000001305_13_850_V1,
+    impact_468_kinase_domain_annotation,
+    IMPACT_TumourSuppressors,
+    IMPACT_Hotspots,
+    OncoKb_known_fusions,
+)
+
+logger = logging.getLogger("basic_logger")
+
+# Reference tables shipped with the package
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
+)
+# Includes cv6 genes and intronic regions targetted for SV
+TRANSCRIPT_REFERENCE = "REFERENCE_refseq_canonical_transcripts.txt"
+REFFLAT_SUMMARY = "refFlat_summary.txt"
+
+
+def read_table(path):
+    """
+    Read a tab separated table with a header line into a dict of
+    column lists of strings
+    str -> dict
+    """
+    with open(path) as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader)
+        columns = zip(*reader) or [()] * len(header)
+    return dict((name, list(values)) for name, values in zip(header, columns))
+
+
+class cytoband_index(object):
+    """
+    Per-chromosome sorted interval index of cytobands.
+    Bands are closed intervals and neighbouring bands share
+    their boundary coordinate, so a position can hit zero,
+    one or two bands.
+    """
+
+    def __init__(self, ideogram):
+        self.starts, self.stops, self.labels = {}, {}, {}
+        rows = sorted(
+            zip(
+                ideogram["Chr"],
+                ideogram["Bp_start"],
+                ideogram["Bp_stop"],
+                ideogram["Arm"],
+                ideogram["Band"],
+            ),
+            key=lambda x: (x[0], x[1]),
+        )
+        for chrom, start, stop, arm, band in rows:
+            self.starts.setdefault(chrom, []).append(int(start))
+            self.stops.setdefault(chrom, []).append(int(stop))
+            self.labels.setdefault(chrom, []).append(arm + band)
+        self.start_arrays = dict(
+            (c, np.asarray(v, dtype=np.int64)) for c, v in self.starts.items()
+        )
+        self.stop_arrays = dict(
+            (c, np.asarray(v, dtype=np.int64)) for c, v in self.stops.items()
+        )
+        self.label_arrays = dict(
+            (c, np.asarray(v, dtype=object)) for c, v in self.labels.items()
+        )
+
+    def find(self, chrom, pos):
+        """
+        Return all cytobands overlapping a position
+        str, int -> list
+        """
+        chrom = str(chrom)
+        if chrom not in self.starts:
+            return []
+        hi = bisect.bisect_right(self.starts[chrom], pos)
+        lo = bisect.bisect_left(self.stops[chrom], pos)
+        return self.labels[chrom][lo:hi]
+
+    def find_many(self, chroms, positions):
+        """
+        Resolve cytobands for a column of breakpoints with one
+        searchsorted pass per chromosome. Positions that do not
+        fall in exactly one band are returned as None.
+        array, array -> array
+        """
+        chroms = np.asarray(chroms).astype(str)
+        positions = np.asarray(positions, dtype=np.int64)
+        bands = np.empty(len(chroms), dtype=object)
+        for chrom in np.unique(chroms):
+            where = np.flatnonzero(chroms == chrom)
+            if chrom not in self.start_arrays:
+                continue
+            pos = positions[where]
+            hi = np.searchsorted(self.start_arrays[chrom], pos, side="right")
+            lo = np.searchsorted(self.stop_arrays[chrom], pos, side="left")
+            single = (hi - lo) == 1
+            bands[where[single]] = self.label_arrays[chrom][lo[single]]
+        return bands
+
+
+# Read-only reference record of the canonical transcripts of a gene
+transcript_record = namedtuple(
+    "transcript_record",
+    ["gene", "lookup_transcripts", "reported_transcripts", "isPanel"],
+)
+
+
+class transcript_index(object):
+    """
+    Gene-keyed index of canonical transcript records built
+    once from the transcript reference table.
+    """
+
+    def __init__(self, reference):
+        lookup, reported, panel = {}, {}, {}
+        for gene, lookup_tx, reported_tx, is_panel in zip(
+            reference["Gene"],
+            reference["Lookup_Transcript"],
+            reference["Reported_Transcript"],
+            reference["IsPanel"],
+        ):
+            lookup.setdefault(gene, []).append(lookup_tx)
+            reported.setdefault(gene, {})[lookup_tx] = reported_tx
+            panel.setdefault(gene, int(is_panel) == 1)
+        self.records = dict(
+            (
+                gene,
+                transcript_record(
+                    gene, tuple(lookup[gene]), reported[gene], panel[gene]
+                ),
+            )
+            for gene in lookup
+        )
+        self.lookup_transcripts = frozenset(reference["Lookup_Transcript"])
+
+    def __contains__(self, gene):
+        return gene in self.records
+
+    def get(self, gene):
+        """
+        Get the transcript record of a gene
+        str -> (transcript_record or None)
+        """
+        return self.records.get(gene)
+
+
+# Gene class bit flags
+PANEL = 1
+TUMOUR_SUPPRESSOR = 2
+HOTSPOT = 4
+KINASE = 8
+ONCOKB_PARTNER = 16
+
+
+class gene_class_registry(object):
+    """
+    Registry of gene classes used to flag breakpoints. Each class
+    is held as a frozenset and combined into a single gene -> bit
+    flag map.
+    """
+
+    def __init__(
+        self, transcript_index, tumour_suppressors, hotspots, kinases, oncokb
+    ):
+        self.panel = frozenset(
+            gene
+            for gene, record in transcript_index.records.items()
+            if record.isPanel
+        )
+        self.tumourSuppressors = frozenset(tumour_suppressors)
+        self.hotspots = frozenset(hotspots)
+        self.kinases = frozenset(kinases)
+        self.oncokbPartners = frozenset(
+            gene for fusion in oncokb for gene in fusion.split(":")
+        )
+        self.flags = {}
+        for flag, genes in (
+            (PANEL, self.panel),
+            (TUMOUR_SUPPRESSOR, self.tumourSuppressors),
+            (HOTSPOT, self.hotspots),
+            (KINASE, self.kinases),
+            (ONCOKB_PARTNER, self.oncokbPartners),
+        ):
+            for gene in genes:
+                self.flags[gene] = self.flags.get(gene, 0) | flag
+
+    def __iter__(self):
+        return iter(self.flags)
+
+    def get(self, gene):
+        """
+        Get the class flags of a gene
+        str -> int
+        """
+        return self.flags.get(gene, 0)
+
+    def classify_genes(self, genes):
+        """
+        Get the class flags of an array of genes
+        array -> array
+        """
+        import pandas as pd
+
+        return (
+            pd.Series(np.asarray(genes, dtype=object))
+            .map(self.flags)
+            .fillna(0)
+            .astype(np.int64)
+            .values
+        )
+
+
+class exon_record(object):
+    """
+    Exon summary of a canonical transcript
+    """
+
+    __slots__ = ("strand", "last_exon", "pos1", "pos2")
+
+    def __init__(self, strand, last_exon, pos1, pos2):
+        self.strand = strand
+        self.last_exon = last_exon
+        self.pos1 = pos1
+        self.pos2 = pos2
+
+
+class exon_index(object):
+    """
+    (Gene, Transcript) keyed index of exon summaries built once
+    from refFlat_summary. Later rows win for duplicated keys.
+    """
+
+    def __init__(self, summary):
+        self.records = dict(
+            (
+                (gene, transcript),
+                exon_record(strand, int(last), int(pos1), int(pos2)),
+            )
+            for gene, transcript, strand, last, pos1, pos2 in zip(
+                summary["Gene"],
+                summary["Transcript"],
+                summary["Strand"],
+                summary["last_exon"],
+                summary["pos1"],
+                summary["pos2"],
+            )
+        )
+
+    def get(self, gene, transcript):
+        """
+        Get the exon summary of a gene transcript
+        str, str -> (exon_record or None)
+        """
+        if not isinstance(transcript, str):
+            return None
+        return self.records.get((gene, transcript))
+
+
+class kinase_domain_index(object):
+    """
+    Gene-keyed index of kinase domain coordinates. The first
+    domain listed for a gene wins.
+    """
+
+    def __init__(self, annotation):
+        self.domains = {}
+        for gene, start, end in zip(
+            annotation["HUGO"], annotation["Start"], annotation["End"]
+        ):
+            self.domains.setdefault(gene, (start, end))
+
+    def __contains__(self, gene):
+        return gene in self.domains
+
+    def __getitem__(self, gene):
+        return self.domains[gene]
+
+    def get(self, gene):
+        """
+        Get the kinase domain interval of a gene
+        str -> (tuple or None)
+        """
+        return self.domains.get(gene)
+
+
+class reference_set(object):
+    """
+    Reference tables and indexes used for annotation. Each of them
+    is read or built on first access, so importing the package or
+    parsing arguments never pays for tables that are not used.
+    Tables are read relative to the package data directory, not
+    the working directory or the calling script, or from a compiled
+    reference bundle when one is given.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, bundle_path=None):
+        self.data_dir = data_dir
+        self.bundle_path = bundle_path
+        self._loaded = {}
+
+    def __getstate__(self):
+        # Bundle-backed indexes are views of a memory map, so send the
+        # path and let every process map the bundle itself
+        if self.bundle_path:
+            return dict(self.__dict__, _loaded={})
+        return self.__dict__
+
+    def _get(self, name, build):
+        if name not in self._loaded:
+            self._loaded[name] = build()
+        return self._loaded[name]
+
+    def use_bundle(self, bundle_path):
+        """
+        Serve all tables and indexes from a compiled reference bundle
+        str -> reference_set
+        """
+        self.bundle_path = bundle_path
+        self._loaded = {}
+        if self.bundle.is_stale(self.data_dir):
+            logger.warning(
+                "Reference bundle %s is older than the tables in %s "
+                "or the reference constants." % (bundle_path, self.data_dir)
+            )
+        return self
+
+    @property
+    def bundle(self):
+        from bundle import reference_bundle
+
+        return self._get("bundle", lambda: reference_bundle(self.bundle_path))
+
+    def _bundled_table(self, prefix, columns):
+        table = self.bundle.table(prefix)
+        return dict((column, table[name]) for column, name in columns)
+
+    @property
+    def transcript_reference(self):
+        if self.bundle_path:
+            # Rows are grouped by gene in a bundle
+            return self._get(
+                "transcript_reference",
+                lambda: self._bundled_table(
+                    "transcripts.",
+                    [
+                        ("Gene", "gene"),
+                        ("Lookup_Transcript", "lookup"),
+                        ("Reported_Transcript", "reported"),
+                        ("IsPanel", "panel"),
+                    ],
+                ),
+            )
+        return self._get(
+            "transcript_reference",
+            lambda: read_table(os.path.join(self.data_dir, TRANSCRIPT_REFERENCE)),
+        )
+
+    @property
+    def refflat_summary(self):
+        if self.bundle_path:
+            return self._get(
+                "refflat_summary",
+                lambda: self._bundled_table(
+                    "exons.",
+                    [
+                        ("Gene", "gene"),
+                        ("Transcript", "transcript"),
+                        ("Strand", "strand"),
+                        ("last_exon", "last_exon"),
+                        ("pos1", "pos1"),
+                        ("pos2", "pos2"),
+                    ],
+                ),
+            )
+        return self._get(
+            "refflat_summary",
+            lambda: read_table(os.path.join(self.data_dir, REFFLAT_SUMMARY)),
+        )
+
+    @property
+    def oncokb(self):
+        if self.bundle_path:
+            return self._get(
+                "oncokb", lambda: frozenset(self.bundle["fusions.name"].tolist())
+            )
+        return OncoKb_known_fusions
+
+    @property
+    def cytobands(self):
+        if self.bundle_path:
+            return self._get(
+                "cytobands", lambda: cytoband_index(self.bundle.table("cytobands."))
+            )
+        return self._get(
+            "cytobands", lambda: cytoband_index(ideogram_9606_GCF_000001305_13_850_V1)
+        )
+
+    @property
+    def gene_transcripts(self):
+        if self.bundle_path:
+            from bundle import mapped_transcript_index
+
+            return self._get(
+                "gene_transcripts", lambda: mapped_transcript_index(self.bundle)
+            )
+        return self._get(
+            "gene_transcripts", lambda: transcript_index(self.transcript_reference)
+        )
+
+    @property
+    def transcript_exons(self):
+        if self.bundle_path:
+            from bundle import mapped_exon_index
+
+            return self._get(
+                "transcript_exons", lambda: mapped_exon_index(self.bundle)
+            )
+        return self._get(
+            "transcript_exons", lambda: exon_index(self.refflat_summary)
+        )
+
+    @property
+    def kinase_domains(self):
+        if self.bundle_path:
+            return self._get(
+                "kinase_domains",
+                lambda: kinase_domain_index(self.bundle.table("kinases.")),
+            )
+        return self._get(
+            "kinase_domains",
+            lambda: kinase_domain_index(impact_468_kinase_domain_annotation),
+        )
+
+    @property
+    def gene_classes(self):
+        if self.bundle_path:
+            from bundle import mapped_gene_class_registry
+
+            return self._get(
+                "gene_classes", lambda: mapped_gene_class_registry(self.bundle)
+            )
+        return self._get(
+            "gene_classes",
+            lambda: gene_class_registry(
+                self.gene_transcripts,
+                IMPACT_TumourSuppressors,
+                IMPACT_Hotspots,
+                impact_468_kinase_domain_annotation["HUGO"],
+                self.oncokb,
+            ),
+        )
+
+    def load(self):
+        """
+        Build every index used for annotation, e.g. before the
+        reference set is shipped to worker processes
+        None -> reference_set
+        """
+        for name in (
+            "oncokb",
+            "cytobands",
+            "gene_transcripts",
+            "transcript_exons",
+            "kinase_domains",
+            "gene_classes",
+        ):
+            getattr(self, name)
+        return self
+
+
+references = reference_set()
+
+
+def classify_genes(genes):
+    """
+    Get the class flags of an array of genes
+    array -> array
+    """
+    return references.gene_classes.classify_genes(genes)
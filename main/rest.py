@@ -0,0 +1,255 @@
+#!/usr/bin/env python2
+import json
+import time
+import logging
+import threading
+import requests
+from email.utils import parsedate_tz, mktime_tz
+from multiprocessing.pool import ThreadPool
+from profiling import count
+from config import REST_SERVER, REST_BATCH_SIZE, REST_WORKERS, REST_RATE_LIMIT
+
+logger = logging.getLogger("basic_logger")
+
+HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+REVCOMP = {"A": "T", "T": "A", "C": "G", "G": "C", "N": "N"}
+
+
+def wait_seconds(value, default):
+    """
+    Get the seconds to wait from a Retry-After header, given in
+    seconds or as an HTTP date, or the default when it is missing or
+    has neither form
+    str, float -> float
+    """
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        date = parsedate_tz(value)
+        if date is None:
+            return default
+        return max(0.0, mktime_tz(date) - time.time())
+
+
+class rate_limiter(object):
+    """
+    Thread-safe limiter spacing requests evenly to stay under a
+    number of requests per second, with support for pausing all
+    threads when the server asks to back off.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.next_time = max(self.next_time, time.time() + seconds)
+
+
+class rest_resolver(object):
+    """
+    Resolve cDNA annotations of breakpoints with the Ensembl
+    variant_recoder endpoint. Breakpoints are sent in batched POST
+    requests over a pooled session, with a bounded number of
+    batches in flight, and requests are throttled to the Ensembl
+    rate limit with backoff on 429 and server errors.
+    """
+
+    def __init__(
+        self,
+        server=REST_SERVER,
+        batch_size=REST_BATCH_SIZE,
+        workers=REST_WORKERS,
+        requests_per_second=REST_RATE_LIMIT,
+        retries=5,
+        backoff=1.0,
+        timeout=30,
+    ):
+        self.server = server.rstrip("/")
+        self.batch_size = batch_size
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = rate_limiter(requests_per_second)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=workers, pool_maxsize=workers
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, ext, **kwargs):
+        """
+        Send a request, retrying on connection errors, rate limiting
+        and server errors
+        str, str -> Response
+        """
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            self.limiter.wait()
+            count("rest.requests")
+            if attempt:
+                count("rest.retries")
+            try:
+                response = self.session.request(
+                    method,
+                    self.server + ext,
+                    headers=HEADERS,
+                    timeout=self.timeout,
+                    **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(delay)
+                continue
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == self.retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                self.limiter.pause(wait_seconds(retry_after, delay))
+                continue
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                reset = response.headers.get("X-RateLimit-Reset")
+                self.limiter.pause(wait_seconds(reset, 1))
+            return response
+
+    def resolve(self, bkps):
+        """
+        Resolve cDNA annotations of all transcripts for (chrom, pos)
+        breakpoints as (chrom, pos, transcript, hgvsc) tuples
+        iterable -> list
+        """
+        bkps = sorted(set((str(chrom), int(pos)) for chrom, pos in bkps))
+        batches = [
+            bkps[i : i + self.batch_size] for i in range(0, len(bkps), self.batch_size)
+        ]
+        if len(batches) <= 1 or self.workers <= 1:
+            results = map(self.resolve_batch, batches)
+        else:
+            pool = ThreadPool(min(self.workers, len(batches)))
+            try:
+                results = pool.map(self.resolve_batch, batches)
+            finally:
+                pool.close()
+                pool.join()
+        return [annotation for batch in results for annotation in batch]
+
+    def resolve_batch(self, bkps):
+        """
+        Resolve a batch of breakpoints with one POST request, falling
+        back to single requests for breakpoints missing from the reply.
+        A batch request that fails after its retries fails the batch.
+        list -> list
+        """
+        queries = dict(
+            (make_query(chrom, pos, "C"), (chrom, pos)) for chrom, pos in bkps
+        )
+        annotations, resolved = [], set()
+        response = self.request(
+            "POST", "/variant_recoder/human", data=json.dumps({"ids": list(queries)})
+        )
+        response.raise_for_status()
+        for entry in parse_recoder(response.json()):
+            bkp = queries.get(entry.get("input"))
+            if bkp is not None:
+                resolved.add(bkp)
+                annotations.extend(get_hgvsc(bkp, entry))
+        for chrom, pos in bkps:
+            if (chrom, pos) in resolved:
+                continue
+            count("rest.fallbacks")
+            try:
+                annotations.extend(self.resolve_one(chrom, pos))
+            except requests.HTTPError as e:
+                logger.warning(e)
+        return annotations
+
+    def resolve_one(self, chrom, pos):
+        """
+        Resolve a single breakpoint, retrying once with the reference
+        allele reported by Ensembl when the dummy allele is wrong
+        str, int -> list
+        """
+        dummy_ref = "C"
+        response = self.request(
+            "GET", "/variant_recoder/human/" + make_query(chrom, pos, dummy_ref)
+        )
+        if not response.ok:
+            s = response.text
+            actual_ref = s[s.find("(") + 1 : s.find(")")]
+            if actual_ref not in ["A", "C", "G", "T"] or actual_ref == dummy_ref:
+                response.raise_for_status()
+            response = self.request(
+                "GET", "/variant_recoder/human/" + make_query(chrom, pos, actual_ref)
+            )
+            if not response.ok:
+                response.raise_for_status()
+        annotations = []
+        for entry in parse_recoder(response.json()):
+            annotations.extend(get_hgvsc((chrom, pos), entry))
+        return annotations
+
+
+def make_query(chrom, pos, dummy_ref):
+    """
+    Make dummy hgvs query string for a breakpoint
+    str, int, str -> str
+    """
+    return "%s:g.%s%s>%s" % (chrom, pos, dummy_ref, REVCOMP[dummy_ref])
+
+
+def parse_recoder(decoded):
+    """
+    Flatten variant_recoder results, which are either one record
+    per input or one record per allele of an input
+    list -> list
+    """
+    entries = []
+    for item in decoded:
+        if "input" in item or "hgvsc" in item:
+            entries.append(item)
+        else:
+            entries.extend(v for v in item.values() if isinstance(v, dict))
+    return entries
+
+
+def get_hgvsc(bkp, entry):
+    """
+    Get (chrom, pos, transcript, hgvsc) annotations from a
+    variant_recoder record, stripping the dummy alleles
+    tuple, dict -> list
+    """
+    chrom, pos = bkp
+    annotations = []
+    for s in entry.get("hgvsc", []):
+        transcript, cdna = str(s).split(":", 1)
+        annotations.append((chrom, pos, transcript, cdna[:-3]))
+    return annotations
+
+
+_resolver = None
+
+
+def get_resolver():
+    """
+    Get the shared resolver of this process
+    None -> rest_resolver
+    """
+    global _resolver
+    if _resolver is None:
+        _resolver = rest_resolver()
+    return _resolver
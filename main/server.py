@@ -0,0 +1,307 @@
+#!/usr/bin/env python2
+import os
+import json
+import signal
+import threading
+import traceback
+import SocketServer
+import BaseHTTPServer
+import pandas as pd
+from models import sv_record, vep_cache, cache_builder, timestamp
+from reference import reference_set, DATA_DIR
+from store import breakpoint_store
+from variant import annotate_sv_record, parse_sv, expand_svtype, breakpoint_keys
+from config import VEP_CPUS, VEP_SHARD_SIZE
+
+RESULT_FIELDS = ["Note", "Annotation", "Position", "oncokb_sv_type"]
+# Columns of an SV given as an object, as in an iCallSV table
+SV_FIELDS = [
+    ("svtype", "SV_Type"),
+    ("chr1", "Chr1"),
+    ("pos1", "Pos1"),
+    ("chr2", "Chr2"),
+    ("pos2", "Pos2"),
+    ("gene1", "Gene1"),
+    ("gene2", "Gene2"),
+    ("site1", "Site1Description"),
+    ("site2", "Site2Description"),
+    ("description", "Fusion"),
+]
+
+INCORRECT_FORMAT = "Incorrect format of the structural variant."
+UNRESOLVED_BREAKPOINTS = (
+    "The breakpoints of the structural variant could not be annotated."
+)
+
+
+def failed_result(message):
+    """
+    Get the result of an SV that could not be annotated
+    str -> dict
+    """
+    return dict(
+        [(field, None) for field in RESULT_FIELDS], status="FAILED", message=message
+    )
+
+
+class annotation_service(object):
+    """
+    Annotation state kept warm across requests: the loaded reference
+    indexes and a VEP annotation cache, filled at start with the
+    persistent breakpoint store and then with the breakpoints of
+    every request that are not in it yet, from VEP or the REST API.
+    Requests are annotated one at a time. Reloading the references,
+    e.g. on SIGHUP, happens before the next request.
+    """
+
+    def __init__(
+        self,
+        data_dir=None,
+        bundle_path=None,
+        store_path=None,
+        online=False,
+        verbose=False,
+        vep_cpus=VEP_CPUS,
+        shard_size=VEP_SHARD_SIZE,
+    ):
+        self.data_dir = data_dir
+        self.bundle_path = bundle_path
+        self.verbose = verbose
+        self.vep_cpus = vep_cpus
+        self.shard_size = shard_size
+        self.resolver = None
+        if online:
+            from rest import rest_resolver
+
+            self.resolver = rest_resolver()
+        self.store = None
+        if store_path and online:
+            self.store = breakpoint_store(
+                store_path, self.resolver.server, "REST", "", ""
+            )
+        elif store_path:
+            self.store = breakpoint_store(store_path)
+        self.lock = threading.Lock()
+        self.reload_requested = False
+        self.load()
+
+    def load(self):
+        """
+        Build the reference indexes and fill a new annotation cache
+        with the persistent breakpoint store
+        None -> None
+        """
+        references = reference_set(self.data_dir or DATA_DIR, self.bundle_path).load()
+        cache = vep_cache()
+        resolved = set()
+        if self.store is not None:
+            resolved = self.store.load_all(
+                cache, frozenset(references.transcript_reference["Lookup_Transcript"])
+            )
+        cache.finalize()
+        self.references, self.cache, self.resolved = references, cache, resolved
+        print(
+            timestamp()
+            + "Loaded references and %d stored breakpoints." % len(self.resolved)
+        )
+
+    def request_reload(self, *args):
+        self.reload_requested = True
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    def unresolved(self, records):
+        """
+        Get the breakpoints of sv records that are not in the cache
+        list -> set
+        """
+        return set(
+            key
+            for record in records
+            for key in breakpoint_keys(record)
+            if key not in self.resolved
+        )
+
+    def resolve(self, records):
+        """
+        Add the breakpoints of sv records that are not in the cache
+        yet to the cache
+        list -> None
+        """
+        keys = self.unresolved(records)
+        if not keys:
+            return
+        bkps = pd.DataFrame(
+            [(chrom, str(pos)) for chrom, pos in sorted(keys)],
+            columns=["#CHROM", "POS"],
+        )
+        bkps["ID"], bkps["REF"], bkps["ALT"] = ".,N,-".split(",")
+        builder = cache_builder(
+            bkps,
+            self.references.transcript_reference,
+            self.verbose,
+            self.store,
+            self.resolver,
+            self.vep_cpus,
+            self.shard_size,
+            self.cache,
+        )
+        try:
+            builder.wait()
+        finally:
+            builder.close()
+        self.resolved.update(keys)
+
+    def annotate(self, svs):
+        """
+        Annotate SVs given in their comma-joined string form or as
+        objects with the columns of an iCallSV table
+        list -> list
+        """
+        records, results = [], []
+        for item in svs:
+            try:
+                if isinstance(item, dict):
+                    record = dict((field, item[column]) for field, column in SV_FIELDS)
+                    record["svtype"] = expand_svtype(record["svtype"])
+                    record = sv_record(**record)
+                else:
+                    record = parse_sv(item)
+            except (KeyError, ValueError, AttributeError):
+                record = None
+            records.append(record)
+        with self.lock:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.load()
+            valid = [record for record in records if record is not None]
+            failed = set()
+            try:
+                self.resolve(valid)
+            except Exception:
+                # Breakpoints that could not be resolved fail their SVs,
+                # instead of falling back to genomic positions
+                print(timestamp() + "Failed to annotate breakpoints.")
+                print(traceback.format_exc())
+                failed = self.unresolved(valid)
+            for record in records:
+                if record is None:
+                    results.append(failed_result(INCORRECT_FORMAT))
+                    continue
+                if failed.intersection(breakpoint_keys(record)):
+                    results.append(failed_result(UNRESOLVED_BREAKPOINTS))
+                    continue
+                result = dict(
+                    zip(
+                        RESULT_FIELDS,
+                        annotate_sv_record(
+                            record, self.references, self.cache, None, self.verbose
+                        ),
+                    )
+                )
+                result["status"] = (
+                    "SUCCESS"
+                    if result["Note"] and result["Annotation"] and result["Position"]
+                    else "FAILED"
+                )
+                results.append(result)
+        return results
+
+    def handle(self, payload):
+        """
+        Answer a JSON request: {"sv": sv} with the result of one SV, or
+        {"svs": [sv, ...]} with a list of results
+        str -> dict
+        """
+        try:
+            request = json.loads(payload)
+            if "svs" in request:
+                return {"results": self.annotate(list(request["svs"]))}
+            return self.annotate([request["sv"]])[0]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return {
+                "error": 'Expected a JSON object with an "sv" or an "svs" member.'
+            }
+
+
+class http_handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    POST /annotate with a JSON request, GET /health
+    """
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/annotate":
+            return self.reply(404, {"error": "Not found."})
+        length = int(self.headers.getheader("content-length") or 0)
+        response = self.server.service.handle(self.rfile.read(length))
+        self.reply(400 if "error" in response else 200, response)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/health":
+            return self.reply(404, {"error": "Not found."})
+        self.reply(200, {"status": "ok", "breakpoints": len(self.server.service.resolved)})
+
+    def reply(self, status, response):
+        body = json.dumps(response)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.service.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class socket_handler(SocketServer.StreamRequestHandler):
+    """
+    One JSON request per line, answered with one JSON line
+    """
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ""):
+            if line.strip():
+                self.wfile.write(json.dumps(self.server.service.handle(line)) + "\n")
+                self.wfile.flush()
+
+
+class http_server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class unix_server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(address, service):
+    """
+    Serve annotation requests at an address, HTTP on host:port or a
+    Unix socket on any other path, until interrupted. SIGHUP reloads
+    the references before the next request.
+    str, annotation_service -> None
+    """
+    host, _, port = address.rpartition(":")
+    if port.isdigit() and "/" not in address:
+        server = http_server((host or "127.0.0.1", int(port)), http_handler)
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = unix_server(address, socket_handler)
+    server.service = service
+    signal.signal(signal.SIGHUP, service.request_reload)
+    # Stop on SIGTERM as on an interrupt
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(timestamp() + "Serving annotation requests on %s" % address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if isinstance(server, unix_server) and os.path.exists(address):
+            os.remove(address)
+        print(timestamp() + "Stopped serving annotation requests.")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python2
+import os
+import logging
+import sqlite3
+import contextlib
+from config import VEP, VEP_VERSION, VEP_CACHE, FASTA
+
+logger = logging.getLogger("basic_logger")
+
+
+def store_keys(bkps):
+    """
+    Get the (chrom, pos) keys of breakpoints in the store, or None
+    for positions that are not integers, which are never stored
+    df -> list
+    """
+    keys = []
+    for chrom, pos in zip(bkps["#CHROM"], bkps["POS"]):
+        try:
+            keys.append((str(chrom), int(pos)))
+        except (TypeError, ValueError):
+            keys.append(None)
+    return keys
+
+
+class breakpoint_store(object):
+    """
+    Persistent SQLite store of VEP cDNA annotations keyed by
+    (chrom, pos, transcript). Every row is tagged with the VEP
+    version, VEP cache directory and FASTA it was produced with,
+    so annotations from another VEP setup are never reused.
+    Annotations are stored for all transcripts, independent of
+    the canonical transcript reference in use.
+    """
+
+    def __init__(
+        self, path, vep=VEP, vep_version=VEP_VERSION, vep_cache=VEP_CACHE, fasta=FASTA
+    ):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # The server uses the store from its request threads, one at
+        # a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.text_factory = str
+        with self.connection:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS vep_setup (
+                    tag INTEGER PRIMARY KEY,
+                    vep TEXT, vep_version TEXT, vep_cache TEXT, fasta TEXT,
+                    UNIQUE (vep, vep_version, vep_cache, fasta)
+                );
+                CREATE TABLE IF NOT EXISTS breakpoints (
+                    tag INTEGER, chrom TEXT, pos INTEGER,
+                    PRIMARY KEY (tag, chrom, pos)
+                );
+                CREATE TABLE IF NOT EXISTS annotations (
+                    tag INTEGER, chrom TEXT, pos INTEGER,
+                    transcript TEXT, hgvsc TEXT,
+                    PRIMARY KEY (tag, chrom, pos, transcript)
+                );
+                """
+            )
+            setup = (vep, vep_version, vep_cache, fasta)
+            self.connection.execute(
+                "INSERT OR IGNORE INTO vep_setup "
+                "(vep, vep_version, vep_cache, fasta) VALUES (?, ?, ?, ?)",
+                setup,
+            )
+            self.tag = self.connection.execute(
+                "SELECT tag FROM vep_setup WHERE vep = ? AND vep_version = ? "
+                "AND vep_cache = ? AND fasta = ?",
+                setup,
+            ).fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def _stage(self, keys):
+        """
+        Load breakpoint keys into a temporary query table
+        list -> None
+        """
+        self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS query (chrom TEXT, pos INTEGER)"
+        )
+        self.connection.execute("DELETE FROM query")
+        self.connection.executemany(
+            "INSERT INTO query VALUES (?, ?)",
+            (key for key in keys if key is not None),
+        )
+
+    def load(self, bkps, cache, select_tx):
+        """
+        Add stored annotations of the given breakpoints for the
+        selected transcripts to the cache and return the breakpoints
+        that have never been annotated with this VEP setup
+        df, vep_cache, frozenset -> df
+        """
+        keys = store_keys(bkps)
+        known = self.lookup(keys, cache, select_tx)
+        is_novel = [key is None or key not in known for key in keys]
+        return bkps[is_novel]
+
+    def lookup(self, keys, cache, select_tx):
+        """
+        Add stored annotations of the given (chrom, pos) keys for the
+        selected transcripts to the cache and return the keys of the
+        breakpoints annotated before with this VEP setup
+        list, vep_cache, frozenset -> set
+        """
+        with self.connection:
+            self._stage(keys)
+            with contextlib.closing(self.connection.cursor()) as cursor:
+                # CROSS JOIN keeps the query table as the outer loop,
+                # so annotations are searched by their primary key
+                cursor.execute(
+                    "SELECT a.chrom, a.pos, a.transcript, a.hgvsc "
+                    "FROM query q CROSS JOIN annotations a "
+                    "ON a.tag = ? AND a.chrom = q.chrom AND a.pos = q.pos",
+                    (self.tag,),
+                )
+                for chrom, pos, transcript, hgvsc in cursor:
+                    if transcript in select_tx:
+                        cache.add(chrom, pos, transcript, hgvsc)
+                known = set(
+                    cursor.execute(
+                        "SELECT q.chrom, q.pos FROM query q JOIN breakpoints b "
+                        "ON b.tag = ? AND b.chrom = q.chrom AND b.pos = q.pos",
+                        (self.tag,),
+                    )
+                )
+            self.connection.execute("DELETE FROM query")
+        return known
+
+    def load_all(self, cache, select_tx):
+        """
+        Add all stored annotations for the selected transcripts to the
+        cache and return the keys of all stored breakpoints
+        vep_cache, frozenset -> set
+        """
+        with contextlib.closing(self.connection.cursor()) as cursor:
+            cursor.execute(
+                "SELECT chrom, pos, transcript, hgvsc FROM annotations WHERE tag = ?",
+                (self.tag,),
+            )
+            for chrom, pos, transcript, hgvsc in cursor:
+                if transcript in select_tx:
+                    cache.add(chrom, pos, transcript, hgvsc)
+            return set(
+                cursor.execute(
+                    "SELECT chrom, pos FROM breakpoints WHERE tag = ?", (self.tag,)
+                )
+            )
+
+    def save(self, bkps, annotations):
+        """
+        Store the annotations of newly annotated breakpoints and mark
+        the breakpoints as annotated
+        df, iterable -> None
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO breakpoints VALUES (?, ?, ?)",
+                ((self.tag,) + key for key in store_keys(bkps) if key is not None),
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO annotations VALUES (?, ?, ?, ?, ?)",
+                (
+                    (self.tag, str(c), int(p), str(tx), str(hgvsc))
+                    for c, p, tx, hgvsc in annotations
+                ),
+            )
@@ -0,0 +1,145 @@
+#!/usr/bin/env python2
+import traceback
+from profiling import stage, count
+from models import sv, sv_record
+from annotation import get_variant_annotation
+from notes import get_notes
+
+# SV types of iCallSV tables, any other type is a duplication
+SV_TYPES = {"INV": "INVERSION", "TRA": "TRANSLOCATION", "DEL": "DELETION"}
+
+
+def expand_svtype(svtype):
+    """
+    Expand an iCallSV SV type
+    str -> str
+    """
+    return SV_TYPES.get(svtype, "DUPLICATION")
+
+
+def parse_sv(raw):
+    """
+    Get the sv record of an SV given in its comma-joined string form,
+    as on the command line, with breakpoints given as chrom:pos and
+    genes as gene1 / gene2
+    str -> sv_record
+    """
+    svtype, bkp1, bkp2, genes, site1, site2, description = raw.split(",")
+    chr1, pos1 = bkp1.split(":")
+    chr2, pos2 = bkp2.split(":")
+    gene1, gene2 = genes.split(" / ")
+    return sv_record(svtype, chr1, pos1, chr2, pos2, gene1, gene2, site1, site2, description)
+
+
+def breakpoint_keys(record):
+    """
+    Get the (chrom, pos) keys of the breakpoints of an sv record,
+    leaving out positions that are not integers
+    sv_record -> list
+    """
+    keys = []
+    for chrom, pos in ((record.chr1, record.pos1), (record.chr2, record.pos2)):
+        try:
+            keys.append((str(chrom), int(pos)))
+        except (TypeError, ValueError):
+            continue
+    return keys
+
+
+def annotate_variant(
+    label, make_sv, fields, references, cache=None, memo=None, verbose=False
+):
+    """
+    Main function to initialize sv and breakpoints
+    objects based on given inputs and call methods to
+    generate annotation and notes. The label identifies
+    the SV in detailed exceptions. Without a cache,
+    breakpoints are annotated with the Ensembl REST API.
+    object, callable, tuple, reference_set, vep_cache,
+    breakpoint_memo, bool -> tuple
+    """
+    note, annotation, position, oncokb_sv_type = [None] * 4
+    try:
+        with stage("sv.parse"):
+            variant = make_sv(*fields)
+        with stage("sv.expand"):
+            variant.expand(
+                references.gene_transcripts,
+                references.gene_classes,
+                references.oncokb,
+                cache,
+                memo,
+            )
+
+        with stage("annotation"):
+            annotation = get_variant_annotation(variant, references.cytobands)
+
+        with stage("notes"):
+            annotation, note, position, oncokb_sv_type = get_notes(
+                variant,
+                references.transcript_exons,
+                references.kinase_domains,
+                memo,
+            )
+    except Exception as e:
+        count("exceptions." + type(e).__name__)
+        if verbose:
+            print(str(label) + "\n" + traceback.format_exc(e))
+        return note, annotation, position, oncokb_sv_type
+
+    return note, annotation, position, oncokb_sv_type
+
+
+def annotate_sv_string(raw, references, cache=None, memo=None, verbose=False):
+    """
+    Annotate an SV given in its comma-joined string form, as on
+    the command line
+    str, reference_set, vep_cache, breakpoint_memo, bool -> tuple
+    """
+    fields = raw.split(",")
+    if len(fields) != 7:
+        count("exceptions.ValueError")
+        return None, None, None, None
+    return annotate_variant(raw, sv.parse, fields, references, cache, memo, verbose)
+
+
+def annotate_sv_record(record, references, cache=None, memo=None, verbose=False):
+    """
+    Annotate an SV given as an sv record
+    sv_record, reference_set, vep_cache, breakpoint_memo, bool -> tuple
+    """
+    return annotate_variant(record, sv, record, references, cache, memo, verbose)
+
+
+class annotation_state(object):
+    """
+    What annotating SVs depends on besides the SVs: the reference
+    indexes, the VEP annotation cache, the breakpoint memo valid for
+    that cache and whether to print detailed exceptions. Passed
+    along instead of kept in module globals, so several reference
+    sets or caches can be used in one process.
+    """
+
+    def __init__(self, references, cache, memo=None, verbose=False):
+        self.references = references
+        self.cache = cache
+        self.memo = memo
+        self.verbose = verbose
+
+    def annotate_string(self, raw):
+        """
+        Annotate an SV given in its comma-joined string form
+        str -> tuple
+        """
+        return annotate_sv_string(
+            raw, self.references, self.cache, self.memo, self.verbose
+        )
+
+    def annotate_record(self, record):
+        """
+        Annotate an SV given as an sv record
+        sv_record -> tuple
+        """
+        return annotate_sv_record(
+            record, self.references, self.cache, self.memo, self.verbose
+        )
@@ -0,0 +1,188 @@
+#!/usr/bin/env python2
+import gzip
+import zlib
+import struct
+from config import OUTPUT_FORMATS
+from models import OutputFormatUnavailable
+
+# Output formats implied by the extension of the output file, TSV
+# otherwise
+EXTENSIONS = [
+    (".bgz", "bgzip"),
+    (".gz", "gzip"),
+    (".parquet", "parquet"),
+    (".feather", "feather"),
+    (".arrow", "feather"),
+]
+# Formats written with pyarrow
+ARROW_FORMATS = ("parquet", "feather")
+# zlib level of gzip and bgzip output, the default of both tools
+COMPRESSION_LEVEL = 6
+
+
+def get_output_format(path, output_format=None):
+    """
+    Get the output format given on the command line, or implied by
+    the extension of the output file, and check that the modules it
+    needs are installed
+    str, str -> str
+    """
+    if output_format is None:
+        output_format = next(
+            (fmt for ext, fmt in EXTENSIONS if path.endswith(ext)), "tsv"
+        )
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unknown output format %s." % output_format)
+    if output_format in ARROW_FORMATS:
+        try:
+            import pyarrow
+        except ImportError:
+            raise OutputFormatUnavailable(output_format)
+    return output_format
+
+
+def open_writer(path, output_format="tsv"):
+    """
+    Open a writer appending batches of annotated SVs to the output
+    file in the given format
+    str, str -> (tsv_writer or arrow_writer)
+    """
+    if output_format in ARROW_FORMATS:
+        return arrow_writer(path, output_format)
+    return tsv_writer(path, None if output_format == "tsv" else output_format)
+
+
+class tsv_writer(object):
+    """
+    Append batches of annotated SVs to a tab-separated file,
+    optionally gzip or bgzip compressed, with the header written
+    before the first batch
+    """
+
+    def __init__(self, path, compression=None):
+        if compression == "gzip":
+            self.file = gzip.open(path, "wb", COMPRESSION_LEVEL)
+        elif compression == "bgzip":
+            self.file = bgzf_file(path)
+        else:
+            self.file = open(path, "w")
+        self.header = True
+
+    def write(self, frame):
+        self.file.write(frame.to_csv(None, header=self.header, sep="\t", index=False))
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class bgzf_file(object):
+    """
+    Write-only file of BGZF blocks as written by bgzip: gzip members
+    of at most 64 KB each, followed by an empty end-of-file block.
+    The output reads as gzip and can be indexed with tabix.
+    """
+
+    # uncompressed bytes per block, as in bgzip
+    BLOCK_SIZE = 0xFF00
+    # compressed bytes per block
+    MAX_BLOCK = 0x10000
+    EOF = (
+        "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+        "\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+    )
+
+    def __init__(self, path, level=COMPRESSION_LEVEL):
+        self.file = open(path, "wb")
+        self.level = level
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.BLOCK_SIZE:
+            data = "".join(self.buffer)
+            end = len(data) - len(data) % self.BLOCK_SIZE
+            for i in range(0, end, self.BLOCK_SIZE):
+                self.write_block(data[i : i + self.BLOCK_SIZE])
+            self.buffer = [data[end:]]
+            self.size = len(data) - end
+
+    def write_block(self, data):
+        """
+        Compress data into one BGZF block, or two when it does not
+        compress enough
+        str -> None
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush()
+        # 18 bytes of header and 8 of trailer
+        if len(compressed) + 26 > self.MAX_BLOCK:
+            half = len(data) // 2
+            self.write_block(data[:half])
+            self.write_block(data[half:])
+            return
+        self.file.write(
+            struct.pack(
+                "<4BI2BH2sHH",
+                0x1F,
+                0x8B,
+                8,
+                4,
+                0,
+                0,
+                0xFF,
+                6,
+                "BC",
+                2,
+                len(compressed) + 25,
+            )
+        )
+        self.file.write(compressed)
+        self.file.write(struct.pack("<II", zlib.crc32(data) & 0xFFFFFFFF, len(data)))
+
+    def close(self):
+        if self.size:
+            self.write_block("".join(self.buffer))
+        self.buffer, self.size = [], 0
+        self.file.write(self.EOF)
+        self.file.close()
+
+
+class arrow_writer(object):
+    """
+    Append batches of annotated SVs to a Parquet file, one row group
+    per batch, or to a Feather (Arrow IPC) file, one record batch per
+    batch. All columns are stored as strings, so that batches share
+    the schema of the first one.
+    """
+
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self.schema = None
+        self.writer = None
+
+    def write(self, frame):
+        import pyarrow as pa
+
+        if self.writer is None:
+            self.schema = pa.schema(
+                [pa.field(str(column), pa.string()) for column in frame.columns]
+            )
+            if self.output_format == "parquet":
+                import pyarrow.parquet as pq
+
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self.writer = pa.RecordBatchFileWriter(self.path, self.schema)
+        self.writer.write_table(
+            pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+        )
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
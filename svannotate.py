@@ -8,32 +8,12 @@
 
 
 import os
-import sys
-import requests
-import pandas as pd
-import numpy as np
+import json
 import logging
 import StringIO
 import argparse
 import multiprocessing as mp
-import contextlib
-from main.constants import *
-from main.models import sv, build_cache
-from main.annotation import get_variant_annotation
-from main.notes import get_notes
-from main.models import timestamp
-import traceback
-
-#suppress pandas copy warning
-pd.options.mode.chained_assignment = None
-
-# Global Variables from constants
-oncoKb = OncoKb_known_fusions
-refFlat = refFlat_canonical
-tumourSuppressor = IMPACT_TumourSuppressors
-hotspot = IMPACT_Hotspots
-cache = None
-VERBOSE = False
+from main.config import VEP_CPUS, VEP_SHARD_SIZE, OUTPUT_FORMATS
 
 
 def main():
@@ -55,6 +35,42 @@ def main():
         action="store",
         help="input file of multiple structural variants",
     )
+    # reference compilation
+    analysis_type.add_argument(
+        "-cr",
+        "--compile_references",
+        type=str,
+        action="store",
+        metavar="BUNDLE",
+        help="compile the reference tables into a memory-mapped bundle file",
+    )
+    # reference comparison
+    analysis_type.add_argument(
+        "-dr",
+        "--diff_references",
+        type=str,
+        action="store",
+        metavar="OLD",
+        help="print the genes, transcripts and cytobands whose reference data differ between OLD, a reference bundle or directory of reference tables, and the references in use",
+    )
+    # incremental re-annotation
+    analysis_type.add_argument(
+        "-rf",
+        "--reannotate_from",
+        "--reannotate-from",
+        type=str,
+        action="store",
+        metavar="PREVIOUS_OUTPUT",
+        help="annotate again the SVs of an earlier tsv output touched by reference data changed since --previous_references, and copy the other rows",
+    )
+    # annotation server
+    analysis_type.add_argument(
+        "--serve",
+        type=str,
+        action="store",
+        metavar="ADDRESS",
+        help="keep the references and VEP annotations loaded and answer JSON annotation requests over HTTP on ADDRESS host:port, or on a Unix socket at any other ADDRESS path; SIGHUP reloads the references",
+    )
     parser.add_argument(
         "-o",
         "--out_file",
@@ -64,19 +80,144 @@ def main():
         default=os.path.join(os.getcwd(), "SVannotated_results.txt"),
         help="output file to print annotation results for multiple structural variants",
     )
+    parser.add_argument(
+        "--out_format",
+        choices=OUTPUT_FORMATS,
+        help="format of the output file: tsv, gzip or bgzip compressed tsv, or "
+        "parquet or feather with pyarrow; by default taken from the extension "
+        "of the output file (.gz, .bgz, .parquet, .feather), otherwise tsv",
+    )
     parser.add_argument(
         "-of", "--offline", action="store_true", help="run annotation using cache"
     )
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Print detailed exceptions"
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        action="store",
+        default=max(1, mp.cpu_count() - 1),
+        help="number of worker processes used in batch mode",
+    )
+    parser.add_argument(
+        "-cs",
+        "--chunksize",
+        type=int,
+        action="store",
+        default=500,
+        help="number of structural variants dispatched to a worker at a time",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream_chunksize",
+        type=int,
+        action="store",
+        default=None,
+        help="stream the input file in chunks of this many rows with bounded memory",
+    )
+    parser.add_argument(
+        "--vep_cpus",
+        type=int,
+        action="store",
+        default=VEP_CPUS,
+        help="number of processors shared by concurrent VEP processes",
+    )
+    parser.add_argument(
+        "--vep_shard_size",
+        type=int,
+        action="store",
+        default=VEP_SHARD_SIZE,
+        help="number of breakpoints per VEP process; SVs are annotated as the shards of their breakpoints complete",
+    )
+    parser.add_argument(
+        "-on",
+        "--online",
+        action="store_true",
+        help="resolve breakpoints with the Ensembl REST API instead of a local VEP",
+    )
+    parser.add_argument(
+        "-db",
+        "--cache_db",
+        type=str,
+        action="store",
+        default=None,
+        help="SQLite file of VEP annotations reused across runs",
+    )
+    parser.add_argument(
+        "-ck",
+        "--checkpoint",
+        type=str,
+        action="store",
+        default=None,
+        metavar="DIR",
+        help="save every annotated chunk, the VEP annotations and a run manifest to DIR",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="with --checkpoint, copy the chunks annotated by an interrupted run from DIR and annotate only the rest",
+    )
+    parser.add_argument(
+        "-c",
+        "--columnar",
+        action="store_true",
+        help="compute breakpoint and sv features column-wise in batch mode, in the main process (--workers is not used)",
+    )
+    parser.add_argument(
+        "-m",
+        "--memo_size",
+        type=int,
+        action="store",
+        default=0,
+        help="memoize up to this many derived breakpoint states per process, for tables with recurrent breakpoints",
+    )
+    parser.add_argument(
+        "-rb",
+        "--reference_bundle",
+        type=str,
+        action="store",
+        default=None,
+        help="read reference tables from a bundle made with --compile_references",
+    )
+    parser.add_argument(
+        "-pr",
+        "--previous_references",
+        type=str,
+        action="store",
+        default=None,
+        metavar="OLD",
+        help="with --reannotate_from, the reference bundle or directory of reference tables the earlier output was annotated with",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        action="store",
+        default=None,
+        metavar="REPORT",
+        help="write per-stage wall and CPU times and counters of all processes to a JSON report",
+    )
+    parser.add_argument(
+        "--profile_functions",
+        type=str,
+        action="store",
+        default=None,
+        metavar="DIR",
+        help="with --profile, also dump cProfile stats (and tracemalloc snapshots where available) of every process to DIR",
+    )
     args = parser.parse_args()
-
-    # Set verbose if required
-    global VERBOSE
-    if args.verbose:
-        global VERBOSE
-        VERBOSE = True
+    if args.resume and not args.checkpoint:
+        parser.error("--resume requires --checkpoint")
+    if args.reannotate_from and not args.previous_references:
+        parser.error("--reannotate_from requires --previous_references")
+    if args.structural_variant and args.offline and not args.cache_db:
+        parser.error("-sv with --offline requires --cache_db")
+    if args.reannotate_from and os.path.abspath(
+        args.reannotate_from
+    ) == os.path.abspath(args.out_file):
+        parser.error("--out_file must differ from --reannotate_from")
 
     # Create the logger
     logger = logging.getLogger("basic_logger")
@@ -91,163 +232,95 @@ def main():
     logger.addHandler(ch)
 
     # Call main function
-    if args.input_file:
-        sv_all_data = pd.read_csv(args.input_file, header="infer", sep="\t", dtype=str)
-
-        svdata = sv_all_data[
-            [
-                "TumorId",
-                "NormalId",
-                "Chr1",
-                "Pos1",
-                "Chr2",
-                "Pos2",
-                "SV_Type",
-                "Gene1",
-                "Gene2",
-                "Site1Description",
-                "Site2Description",
-                "Fusion",
-            ]
-        ]
-
-        cache_input_data = pd.concat(
-            [
-                svdata[["Chr1", "Pos1"]].rename(
-                    columns={"Chr1": "#CHROM", "Pos1": "POS"}
-                ),
-                svdata[["Chr2", "Pos2"]].rename(
-                    columns={"Chr2": "#CHROM", "Pos2": "POS"}
-                ),
-            ],
-            ignore_index=True,
-            axis=0,
-        )
-        cache_input_data.drop_duplicates(inplace=True)
-        cache_input_data["ID"], cache_input_data["REF"], cache_input_data[
-            "ALT"
-        ] = ".,N,-".split(",")
-
-        try:
-            print(timestamp() + "Proceeding to build annotation cache...")
-            global cache
-            cache = build_cache(
-                cache_input_data[["#CHROM", "POS", "ID", "REF", "ALT"]],
-                transcript_reference,
-                VERBOSE,
-            )
-        except ValueError:
-            print(timestamp() + "Input SV data appears to be empty. Annotation process will exit.")
-            print(traceback.format_exc())
-        except Exception as e:
-            print(timestamp() + "Failed to build annotation cache using VEP.")
-            print(traceback.format_exc())
-
-        svdata["coord1"] = svdata["Chr1"] + ":" + svdata["Pos1"]
-        svdata["coord2"] = svdata["Chr2"] + ":" + svdata["Pos2"]
-        svdata["Genes"] = svdata["Gene1"] + " / " + svdata["Gene2"]
-        svdata["SV_Type"] = svdata["SV_Type"].apply(
-            lambda x: "INVERSION"
-            if x == "INV"
-            else (
-                "TRANSLOCATION"
-                if x == "TRA"
-                else ("DELETION" if x == "DEL" else "DUPLICATION")
-            )
-        )
-        svdata = svdata.drop(["Chr1", "Chr2", "Pos1", "Pos2"], axis=1)
-        col = [
-            u"SV_Type",
-            u"coord1",
-            u"coord2",
-            u"Genes",
-            u"Site1Description",
-            u"Site2Description",
-            u"Fusion",
-        ]
-        sv_strings = (
-            svdata[col]
-            .apply(lambda row: ",".join(row.values.astype(str)), axis=1)
-            .tolist()
-        )
+    if args.compile_references:
+        from main.bundle import compile_references
 
-        cores = int(mp.cpu_count() - 1)
-        try:
-            # create jobs
-            print(timestamp() + "Starting variant annotation...")
-            with contextlib.closing(mp.Pool(processes=cores)) as pool:
-                annotated_SVs = pool.map(annotate_SV, sv_strings)
-        except Exception as e:
-            print(e)
-
-        new = pd.concat(
-            [
-                sv_all_data,
-                pd.DataFrame(
-                    annotated_SVs,
-                    columns=["Note", "Annotation", "Position", "oncokb_sv_type"],
-                ),
-            ],
-            axis=1,
-        )
+        content_hash = compile_references(args.compile_references)
+        print("Compiled %s (%s)" % (args.compile_references, content_hash))
+    if args.diff_references:
+        from main.reference import references
+        from main.refdiff import open_references, diff_references
 
-        new.to_csv(args.out_file, header=True, sep="\t", index=False)
-        print(timestamp() + "Completed variant annotation!")
-    # note, annotation, position = annotate_SV(args.sv, logger)
-
-    # Send log contents to a string and close the stream
-    # log_contents = log_capture_string.getvalue()
-    # log_capture_string.close()
-
-    # if note and position and annotation:
-    #     status = "SUCCESS"
-    # else:
-    #     status = "FAILED"
-    # result = {
-    #     "Note": note,
-    #     "Annotation": annotation,
-    #     "Position": position,
-    #     "status": status,
-    #     "message": log_contents.replace("\n", "; "),
-    # }
-    # print(result)
-
-
-def annotate_SV(raw):
-    """
-    Main function to initialize sv and breakpoints
-    objects based on given inputs and call methods to 
-    generate annotation and notes.
-    str -> tuple
-    """
-    note, annotation, position, oncokb_sv_type = [None] * 4
-    try:
-        svtype, bkp1, bkp2, genes, site1, site2, description = raw.split(",")
-    except ValueError:
-        return note, annotation, position, oncokb_sv_type
-
-    try:
-        variant = sv(svtype, bkp1, bkp2, genes, site1, site2, description)
-        variant.expand(
-            transcript_reference,
-            kinase_annotation,
-            hotspot,
-            tumourSuppressor,
-            oncoKb,
-            cache,
-        )
+        if args.reference_bundle:
+            references.use_bundle(args.reference_bundle)
+        changes = diff_references(open_references(args.diff_references), references)
+        print(json.dumps(changes.summary(), indent=2, sort_keys=True))
+    if args.input_file or args.reannotate_from:
+        # Batch annotation pulls in pandas and the reference tables,
+        # so it is only imported once arguments have been parsed
+        from main.batch import run_batch
 
-        annotation = get_variant_annotation(variant)
+        run_batch(args)
+    if args.serve:
+        from main.server import annotation_service, serve
 
-        annotation, note, position, oncokb_sv_type = get_notes(
-            variant, refFlat_summary, kinase_annotation
+        serve(
+            args.serve,
+            annotation_service(
+                bundle_path=args.reference_bundle,
+                store_path=args.cache_db,
+                online=args.online,
+                verbose=args.verbose,
+                vep_cpus=args.vep_cpus,
+                shard_size=args.vep_shard_size,
+            ),
         )
-    except Exception as e:
-        if VERBOSE:
-            print(raw + "\n" + traceback.format_exc(e))
-        return note, annotation, position, oncokb_sv_type
+    if args.structural_variant:
+        from main.reference import references
+        from main.variant import annotate_sv_string, parse_sv, breakpoint_keys
+
+        if args.reference_bundle:
+            references.use_bundle(args.reference_bundle)
+        # Breakpoints are annotated with the Ensembl REST API, or
+        # offline from the persistent store
+        cache, missing = None, []
+        if args.offline:
+            from main.models import vep_cache
+            from main.store import breakpoint_store
+
+            try:
+                keys = breakpoint_keys(parse_sv(args.structural_variant))
+            except ValueError:
+                keys = []
+            cache = vep_cache()
+            store = breakpoint_store(args.cache_db)
+            known = store.lookup(
+                keys,
+                cache,
+                frozenset(references.transcript_reference["Lookup_Transcript"]),
+            )
+            store.close()
+            missing = [key for key in keys if key not in known]
+        if missing:
+            # Breakpoints that are not stored fail the SV instead of
+            # falling back to genomic positions
+            note, annotation, position, oncokb_sv_type = [None] * 4
+            logger.error(
+                "The breakpoints %s are not in the breakpoint store."
+                % ", ".join("%s:%d" % key for key in missing)
+            )
+        else:
+            note, annotation, position, oncokb_sv_type = annotate_sv_string(
+                args.structural_variant, references, cache, None, args.verbose
+            )
+
+        # Send log contents to a string and close the stream
+        log_contents = log_capture_string.getvalue()
+        log_capture_string.close()
 
-    return note, annotation, position, oncokb_sv_type
+        if note and position and annotation:
+            status = "SUCCESS"
+        else:
+            status = "FAILED"
+        result = {
+            "Note": note,
+            "Annotation": annotation,
+            "Position": position,
+            "oncokb_sv_type": oncokb_sv_type,
+            "status": status,
+            "message": log_contents.strip("\n").replace("\n", "; "),
+        }
+        print(json.dumps(result))
 
 
 if __name__ == "__main__":